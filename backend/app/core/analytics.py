@@ -0,0 +1,271 @@
+"""
+Columnar snapshot of the billing fact tables for offline analysis.
+
+Every OP and IP bill item is written once, denormalized with its bill,
+patient, doctor and particular name, to Parquet files partitioned by the
+bill's business month:
+
+    <analytics_dir>/bill_items/month=2025-10/part-OP-000120-000480.parquet
+
+Runs are incremental. export_watermarks holds the last bill id exported per
+bill type; a run reads only bills above it (bills are never edited or
+deleted once saved), writes new part files and only then moves the
+watermark, so an interrupted run is simply repeated. Rows are read from the
+read-only engine with yield_per and written batch by batch, so memory
+depends on the batch size, not on how far behind the snapshot is. Reads go
+through archive_reads, so bills archived before their first export are
+still written.
+
+Only one run at a time: a second run would delete the first one's
+in-flight .tmp parts and add its rows to the watermark again. Runs in the
+backend hold a lock and a concurrent one raises ExportRunning; don't run
+the command line export next to a backend that may be exporting.
+
+pyarrow is optional; without it the export reports itself unavailable.
+
+    python -m app.core.analytics export
+"""
+import os
+import threading
+from datetime import datetime
+from typing import Dict
+
+from sqlalchemy import Integer, cast, func, null, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, aliased
+
+from .archive import archive_reads
+from ..models import Patient, OPBill, IPBill, OPBillItem, IPBillItem, Doctor, Particular, ExportWatermark
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+DATASET = "bill_items"
+DEFAULT_BATCH_SIZE = 50_000
+
+_export_lock = threading.Lock()
+
+
+class ExportRunning(RuntimeError):
+    """Another Parquet export is writing the dataset"""
+
+
+def arrow_available() -> bool:
+    return pa is not None
+
+
+def _schema():
+    return pa.schema([
+        ("bill_type", pa.string()),
+        ("bill_id", pa.int64()),
+        ("bill_number", pa.string()),
+        ("bill_date", pa.timestamp("s")),
+        ("bill_day", pa.date32()),
+        ("category", pa.string()),
+        ("patient_id", pa.int64()),
+        ("op_number", pa.string()),
+        ("ip_number", pa.string()),
+        ("patient_name", pa.string()),
+        ("age", pa.string()),
+        ("gender", pa.string()),
+        ("doctor_id", pa.int64()),
+        ("doctor", pa.string()),
+        ("item_id", pa.int64()),
+        ("particular_id", pa.int64()),
+        ("particular", pa.string()),
+        ("department", pa.string()),
+        ("unit", pa.int32()),
+        ("rate", pa.float64()),
+        ("amount", pa.float64()),
+        ("discount_amount", pa.float64()),
+        ("total", pa.float64()),
+    ])
+
+
+def _item_statement(bill_model, after_id: int, up_to_id: int):
+    is_op = bill_model is OPBill
+    item_model = OPBillItem if is_op else IPBillItem
+    # Same attribution as the particulars rollup: OP items may carry their
+    # own doctor, everything else is the bill's
+    item_doctor_id = func.coalesce(item_model.doctor_id, bill_model.doctor_id) if is_op else bill_model.doctor_id
+    item_doctor = aliased(Doctor)
+    particular_id = cast(item_model.particular, Integer)
+
+    return select(
+        bill_model.id,
+        bill_model.bill_number,
+        bill_model.bill_date,
+        bill_model.bill_day,
+        bill_model.category,
+        bill_model.patient_id,
+        Patient.op_number,
+        Patient.ip_number,
+        Patient.name,
+        Patient.age,
+        Patient.gender,
+        item_doctor_id,
+        item_doctor.name,
+        item_model.id,
+        particular_id,
+        func.coalesce(Particular.name, item_model.particular),
+        item_model.department,
+        item_model.unit if is_op else null(),
+        item_model.rate if is_op else null(),
+        item_model.amount,
+        item_model.discount_amount,
+        item_model.total,
+    ).select_from(bill_model).join(
+        item_model, item_model.bill_id == bill_model.id
+    ).outerjoin(
+        Patient, bill_model.patient_id == Patient.id
+    ).outerjoin(
+        item_doctor, item_doctor_id == item_doctor.id
+    ).outerjoin(
+        Particular, Particular.id == particular_id
+    ).where(
+        bill_model.id > after_id,
+        bill_model.id <= up_to_id
+    ).order_by(bill_model.id, item_model.id)
+
+
+class _MonthWriters:
+    """
+    One ParquetWriter per month partition touched by a run. Files are
+    written under a .tmp name and renamed once complete, so readers of the
+    dataset never see a half-written part.
+    """
+    def __init__(self, root: str, bill_type: str, first_id: int, last_id: int, schema):
+        self.root = root
+        self.name = f"part-{bill_type}-{first_id:06d}-{last_id:06d}.parquet"
+        self.schema = schema
+        self.writers = {}
+        self.paths = {}
+
+    def write(self, month: str, columns):
+        writer = self.writers.get(month)
+        if writer is None:
+            directory = os.path.join(self.root, f"month={month}")
+            os.makedirs(directory, exist_ok=True)
+            self.paths[month] = os.path.join(directory, self.name)
+            writer = pq.ParquetWriter(self.paths[month] + ".tmp", self.schema, compression="zstd")
+            self.writers[month] = writer
+        writer.write_batch(pa.record_batch(columns, schema=self.schema))
+
+    def close(self) -> list:
+        for month, writer in self.writers.items():
+            writer.close()
+            os.replace(self.paths[month] + ".tmp", self.paths[month])
+        return sorted(self.paths.values())
+
+    def abort(self):
+        for month, writer in self.writers.items():
+            writer.close()
+            os.remove(self.paths[month] + ".tmp")
+
+
+def _write_batch(writers: _MonthWriters, bill_type: str, rows: list):
+    by_month: Dict[str, list] = {}
+    for row in rows:
+        # bill_day, falling back to bill_date for rows the backfill missed
+        day = row[3] or row[2]
+        by_month.setdefault(day.strftime("%Y-%m"), []).append(row)
+    for month, month_rows in by_month.items():
+        values = list(zip(*month_rows))
+        writers.write(month, [[bill_type] * len(month_rows)] + [list(column) for column in values])
+
+
+def _watermark(conn, name: str) -> int:
+    return conn.execute(
+        select(ExportWatermark.last_bill_id).where(ExportWatermark.name == name)
+    ).scalar() or 0
+
+
+def _export_bill_type(read_engine, write_engine, root: str, bill_model, bill_type: str,
+                      batch_size: int) -> dict:
+    name = f"{DATASET}_{bill_type.lower()}"
+    with write_engine.connect() as conn:
+        after_id = _watermark(conn, name)
+
+    # Archived years read as part of the bill tables
+    with Session(read_engine) as db, archive_reads(db):
+        conn = db.connection()
+        up_to_id = conn.execute(select(func.max(bill_model.id))).scalar() or 0
+        if up_to_id <= after_id:
+            return {"rows": 0, "files": [], "last_bill_id": after_id}
+
+        writers = _MonthWriters(root, bill_type, after_id + 1, up_to_id, _schema())
+        rows_written = 0
+        try:
+            result = conn.execution_options(yield_per=batch_size).execute(
+                _item_statement(bill_model, after_id, up_to_id)
+            )
+            for partition in result.partitions():
+                _write_batch(writers, bill_type, partition)
+                rows_written += len(partition)
+        except BaseException:
+            writers.abort()
+            raise
+        files = writers.close()
+
+    with write_engine.begin() as conn:
+        statement = sqlite_insert(ExportWatermark).values(
+            name=name, last_bill_id=up_to_id, exported_rows=rows_written,
+            exported_at=datetime.utcnow()
+        )
+        conn.execute(statement.on_conflict_do_update(
+            index_elements=[ExportWatermark.name],
+            set_={
+                "last_bill_id": statement.excluded.last_bill_id,
+                "exported_rows": ExportWatermark.exported_rows + statement.excluded.exported_rows,
+                "exported_at": statement.excluded.exported_at,
+            }
+        ))
+    return {"rows": rows_written, "files": files, "last_bill_id": up_to_id}
+
+
+def export_bill_items(read_engine, write_engine, out_dir: str,
+                      batch_size: int = DEFAULT_BATCH_SIZE) -> dict:
+    """
+    Append OP and IP bill items saved since the last run to the Parquet
+    dataset under out_dir. Returns rows and files written per bill type.
+    Raises ExportRunning if another run in this process is under way.
+    """
+    if not arrow_available():
+        raise RuntimeError("pyarrow is not installed")
+    if not _export_lock.acquire(blocking=False):
+        raise ExportRunning("A Parquet export is already running")
+
+    try:
+        root = os.path.join(out_dir, DATASET)
+        os.makedirs(root, exist_ok=True)
+        # Parts left behind by a run that died before its rename
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    os.remove(os.path.join(directory, filename))
+
+        return {
+            "OP": _export_bill_type(read_engine, write_engine, root, OPBill, "OP", batch_size),
+            "IP": _export_bill_type(read_engine, write_engine, root, IPBill, "IP", batch_size),
+        }
+    finally:
+        _export_lock.release()
+
+
+if __name__ == "__main__":
+    import sys
+    from database import engine, read_engine
+    from .config import settings
+
+    if sys.argv[1:] != ["export"]:
+        sys.exit("usage: python -m app.core.analytics export")
+    if not arrow_available():
+        sys.exit("pyarrow is not installed (pip install pyarrow)")
+
+    for bill_type, summary in export_bill_items(read_engine, engine, settings.analytics_path).items():
+        print(f"{bill_type}: {summary['rows']} rows in {len(summary['files'])} files, "
+              f"up to bill {summary['last_bill_id']}")
@@ -0,0 +1,392 @@
+"""
+Yearly archive files for old bills.
+
+Bills of a closed financial year (April to March) and their items are moved
+out of hms_lite.db into hms_archive_<start year>.db next to it, e.g.
+hms_archive_2023.db for 2023-24, and registered in the archives table.
+Patients, doctors and the rollup tables stay in the main database, so the
+dashboard and report totals are unaffected.
+
+Reads that may reach into archived years wrap their queries in
+archive_reads(db, start_day, end_day). For the archives overlapping that
+range it ATTACHes the files and shadows op_bills, op_bill_items, ip_bills
+and ip_bill_items with TEMP views that UNION ALL the main and archived
+tables. Unqualified names resolve to temp objects first, so existing ORM
+queries read the union unchanged, and SQLite pushes their filters and
+joins into each side of it. Ranges that touch no archive cost one lookup
+in the archives table.
+
+The bill and item ids are plain INTEGER PRIMARY KEYs: SQLite gives a new
+row max(id) + 1 of the main table. A year is therefore only archived while
+the main table keeps a row with a higher id than every row it moves (that
+row is the floor), or new bills would reuse ids the archive holds and
+id lookups through the UNION ALL views would find two rows. A year refused
+for that (typically imported history holding the newest ids) can be
+archived once newer bills have been saved.
+
+Moving a year runs in chunks of archive_batch_days. Each chunk copies bills
+and items into the archive and commits, then deletes them from the main
+database and commits. A run cut short between the two is repeated safely:
+the copy replaces by id and the delete only removes rows the archive holds.
+The two commits stay separate because the main database is in WAL mode,
+where a transaction over several files is not atomic as a whole. Until a
+run finishes (archived_at is set) the views leave out archived rows whose
+id the main table still has, so readers never count a chunk twice.
+
+    python -m app.core.archive list
+    python -m app.core.archive run [--vacuum]
+"""
+import logging
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import create_engine, event, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import Pool
+
+from .config import settings
+from ..models import Base, OPBill, OPBillItem, IPBill, IPBillItem, Archive
+
+logger = logging.getLogger(__name__)
+
+# (bill table, item table) pairs moved together
+ARCHIVED_TABLES = [
+    (OPBill.__table__, OPBillItem.__table__),
+    (IPBill.__table__, IPBillItem.__table__),
+]
+ARCHIVED_VIEWS = [table for pair in ARCHIVED_TABLES for table in pair]
+
+# Pooled connection info key listing the archives attached to it
+ATTACHED_INFO_KEY = "hms_archives"
+
+
+def financial_year_of(day: date) -> int:
+    """Start year of the April-March financial year containing day."""
+    return day.year if day.month >= 4 else day.year - 1
+
+
+def financial_year_bounds(start_year: int):
+    return date(start_year, 4, 1), date(start_year + 1, 3, 31)
+
+
+def archive_filename(start_year: int) -> str:
+    return f"hms_archive_{start_year}.db"
+
+
+def _schema_name(start_year: int) -> str:
+    return f"archive_{start_year}"
+
+
+def _columns(table) -> List[str]:
+    return [column.name for column in table.columns]
+
+
+# ---------------------------------------------------------------- reading
+
+
+def _overlapping_archives(conn, start_day: Optional[date], end_day: Optional[date]):
+    query = select(Archive.financial_year, Archive.filename, Archive.archived_at)
+    if start_day is not None:
+        query = query.where(Archive.end_day >= start_day)
+    if end_day is not None:
+        query = query.where(Archive.start_day <= end_day)
+    return conn.execute(query.order_by(Archive.financial_year)).all()
+
+
+def _archive_select(conn, schema: str, table, in_progress: bool) -> str:
+    # Archives keep the columns their table had when they were written;
+    # columns added to the model since then read as NULL
+    present = {row[1] for row in conn.exec_driver_sql(f"PRAGMA {schema}.table_info({table.name})")}
+    columns = ", ".join(name if name in present else f"NULL AS {name}" for name in _columns(table))
+    select_ = f"SELECT {columns} FROM {schema}.{table.name}"
+    if in_progress:
+        # Rows of a chunk copied but not yet deleted from main are read there
+        select_ += (f" WHERE NOT EXISTS (SELECT 1 FROM main.{table.name} AS kept "
+                    f"WHERE kept.id = {schema}.{table.name}.id)")
+    return select_
+
+
+@contextmanager
+def archive_reads(db: Session, start_day: Optional[date] = None, end_day: Optional[date] = None):
+    """
+    Make op_bills, op_bill_items, ip_bills and ip_bill_items include the
+    archived years overlapping [start_day, end_day] (all of them if no range
+    is given) for queries run on db inside the block.
+    """
+    conn = db.connection()
+    archives = _overlapping_archives(conn, start_day, end_day)
+    if not archives:
+        yield
+        return
+
+    # The pool's checkin hook drops whatever is still attached when the
+    # connection goes back, e.g. if the block committed and released it
+    conn.connection.info[ATTACHED_INFO_KEY] = schemas = []
+    attached = {row[1] for row in conn.exec_driver_sql("PRAGMA database_list")}
+    in_progress = set()
+    for financial_year, filename, archived_at in archives:
+        schema = _schema_name(financial_year)
+        if archived_at is None:
+            in_progress.add(schema)
+        path = os.path.join(settings.data_dir, filename)
+        if not os.path.exists(path):
+            raise RuntimeError(f"Archive for {financial_year}-{(financial_year + 1) % 100:02d} is missing: {path}")
+        if schema not in attached:
+            # Inherits the connection's flags, so read-only connections attach read-only
+            conn.exec_driver_sql(f"ATTACH DATABASE ? AS {schema}", (path,))
+        schemas.append(schema)
+
+    try:
+        for table in ARCHIVED_VIEWS:
+            parts = [f"SELECT {', '.join(_columns(table))} FROM main.{table.name}"]
+            parts += [_archive_select(conn, schema, table, schema in in_progress) for schema in schemas]
+            conn.exec_driver_sql(f"DROP VIEW IF EXISTS temp.{table.name}")
+            conn.exec_driver_sql(f"CREATE TEMP VIEW {table.name} AS {' UNION ALL '.join(parts)}")
+        yield
+    finally:
+        # SQLite won't detach a file the open transaction has read, or one a
+        # statement is still reading; those wait for the checkin
+        if not conn.closed and not conn.connection.dbapi_connection.in_transaction:
+            try:
+                _detach_archives(conn.connection.dbapi_connection, schemas)
+                conn.connection.info.pop(ATTACHED_INFO_KEY, None)
+            except sqlite3.Error:
+                pass
+
+
+def _detach_archives(dbapi_connection, schemas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for table in ARCHIVED_VIEWS:
+            cursor.execute(f"DROP VIEW IF EXISTS temp.{table.name}")
+        for schema in schemas:
+            cursor.execute(f"DETACH DATABASE {schema}")
+    finally:
+        cursor.close()
+
+
+@event.listens_for(Pool, "checkin")
+def _detach_on_checkin(dbapi_connection, connection_record):
+    schemas = connection_record.info.pop(ATTACHED_INFO_KEY, None)
+    if schemas is None or dbapi_connection is None:
+        return
+    try:
+        _detach_archives(dbapi_connection, schemas)
+    except sqlite3.Error:
+        # Don't hand out a connection that still has the views in place
+        logger.exception("Could not detach archives, discarding the connection")
+        connection_record.invalidate()
+
+
+# ---------------------------------------------------------------- archiving
+
+
+def closed_financial_years(conn, today: Optional[date] = None) -> List[int]:
+    """
+    Financial years that still have bills in the main database and ended
+    more than settings.archive_keep_years years before the current one.
+    """
+    oldest = None
+    for bill_table, _ in ARCHIVED_TABLES:
+        day = conn.exec_driver_sql(f"SELECT min(bill_day) FROM main.{bill_table.name}").scalar()
+        if day is not None:
+            day = date.fromisoformat(day) if isinstance(day, str) else day
+            oldest = day if oldest is None or day < oldest else oldest
+    if oldest is None:
+        return []
+
+    years = []
+    for year in range(financial_year_of(oldest), financial_year_of(today or date.today()) - settings.archive_keep_years):
+        first_day, last_day = financial_year_bounds(year)
+        for bill_table, _ in ARCHIVED_TABLES:
+            if conn.exec_driver_sql(
+                f"SELECT 1 FROM main.{bill_table.name} WHERE bill_day >= ? AND bill_day <= ? LIMIT 1",
+                (first_day.isoformat(), last_day.isoformat())
+            ).first():
+                years.append(year)
+                break
+    return years
+
+
+def _create_archive_file(path: str):
+    archive_engine = create_engine(f"sqlite:///{path}")
+    try:
+        Base.metadata.create_all(
+            archive_engine, tables=ARCHIVED_VIEWS
+        )
+    finally:
+        archive_engine.dispose()
+
+
+@contextmanager
+def _attached(engine, path: str, schema: str):
+    with engine.connect() as conn:
+        conn.exec_driver_sql(f"ATTACH DATABASE ? AS {schema}", (path,))
+        conn.commit()
+        try:
+            yield conn
+        finally:
+            conn.rollback()
+            conn.exec_driver_sql(f"DETACH DATABASE {schema}")
+
+
+def _move_chunk(conn, schema: str, bill_table, item_table, start_day: date, end_day: date) -> int:
+    bills = f"SELECT id FROM main.{bill_table.name} WHERE bill_day >= ? AND bill_day <= ?"
+    params = (start_day.isoformat(), end_day.isoformat())
+    bill_columns = ", ".join(_columns(bill_table))
+    item_columns = ", ".join(_columns(item_table))
+
+    moved = conn.exec_driver_sql(
+        f"INSERT OR REPLACE INTO {schema}.{bill_table.name} ({bill_columns}) "
+        f"SELECT {bill_columns} FROM main.{bill_table.name} WHERE bill_day >= ? AND bill_day <= ?",
+        params
+    ).rowcount
+    conn.exec_driver_sql(
+        f"INSERT OR REPLACE INTO {schema}.{item_table.name} ({item_columns}) "
+        f"SELECT {item_columns} FROM main.{item_table.name} WHERE bill_id IN ({bills})",
+        params
+    )
+    conn.commit()
+    if not moved:
+        return 0
+
+    # Only what the archive now holds, in case the copy above was partial
+    conn.exec_driver_sql(
+        f"DELETE FROM main.{item_table.name} WHERE bill_id IN ({bills}) "
+        f"AND id IN (SELECT id FROM {schema}.{item_table.name})",
+        params
+    )
+    conn.exec_driver_sql(
+        f"DELETE FROM main.{bill_table.name} WHERE bill_day >= ? AND bill_day <= ? "
+        f"AND id IN (SELECT id FROM {schema}.{bill_table.name})",
+        params
+    )
+    conn.commit()
+    return moved
+
+
+def reusable_id_tables(conn, first_day: date, last_day: date) -> List[str]:
+    """
+    Tables whose ids SQLite would hand out again if the bills of
+    [first_day, last_day] (and their items) left the main database: no row
+    staying behind has a higher id than the highest one moved.
+    """
+    in_year = "bill_day >= ? AND bill_day <= ?"
+    params = (first_day.isoformat(), last_day.isoformat())
+    tables = []
+    for bill_table, item_table in ARCHIVED_TABLES:
+        bills = f"SELECT id FROM main.{bill_table.name} WHERE {in_year}"
+        checks = [
+            (bill_table.name, f"WHERE {in_year}", f"WHERE bill_day IS NULL OR NOT ({in_year})"),
+            (item_table.name, f"WHERE bill_id IN ({bills})", f"WHERE bill_id NOT IN ({bills})"),
+        ]
+        for table, moved_rows, kept_rows in checks:
+            moved = conn.exec_driver_sql(f"SELECT max(id) FROM main.{table} {moved_rows}", params).scalar()
+            if moved is None:
+                continue
+            kept = conn.exec_driver_sql(
+                f"SELECT id FROM main.{table} {kept_rows} ORDER BY id DESC LIMIT 1", params
+            ).scalar()
+            if kept is None or kept < moved:
+                tables.append(table)
+    return tables
+
+
+def archive_financial_year(engine, start_year: int) -> dict:
+    """
+    Move the bills of the financial year starting in April of start_year
+    (and their items) into its archive file. Returns the bills moved per
+    table. The writer connection is taken per chunk, so other writes only
+    ever wait behind one chunk. Raises ValueError for a year that isn't
+    closed, or whose move would let ids be reused.
+    """
+    if start_year >= financial_year_of(date.today()):
+        raise ValueError(f"Financial year {start_year} is not closed yet")
+
+    first_day, last_day = financial_year_bounds(start_year)
+    with engine.connect() as conn:
+        reusable = reusable_id_tables(conn, first_day, last_day)
+    if reusable:
+        raise ValueError(
+            f"Financial year {start_year} holds the newest ids of {', '.join(reusable)}; archiving it "
+            f"would let new bills reuse them. Archive it once newer bills have been saved."
+        )
+
+    filename = archive_filename(start_year)
+    path = os.path.join(settings.data_dir, filename)
+    schema = _schema_name(start_year)
+    _create_archive_file(path)
+
+    # Register first: readers must find the archive before any row leaves
+    # the main database. archived_at is cleared (also when a year is
+    # archived again) until the run finishes, see the views above
+    with engine.begin() as conn:
+        conn.execute(sqlite_insert(Archive).values(
+            financial_year=start_year, filename=filename, start_day=first_day, end_day=last_day,
+            op_bills=0, ip_bills=0, archived_at=None
+        ).on_conflict_do_update(index_elements=[Archive.financial_year], set_={"archived_at": None}))
+
+    moved = {bill_table.name: 0 for bill_table, _ in ARCHIVED_TABLES}
+    chunk_start = first_day
+    while chunk_start <= last_day:
+        chunk_end = min(chunk_start + timedelta(days=settings.archive_batch_days - 1), last_day)
+        with _attached(engine, path, schema) as conn:
+            for bill_table, item_table in ARCHIVED_TABLES:
+                moved[bill_table.name] += _move_chunk(
+                    conn, schema, bill_table, item_table, chunk_start, chunk_end
+                )
+        logger.info("Archived %s to %s into %s", chunk_start, chunk_end, filename)
+        chunk_start = chunk_end + timedelta(days=1)
+
+    with _attached(engine, path, schema) as conn:
+        counts = {
+            bill_table.name: conn.exec_driver_sql(f"SELECT count(*) FROM {schema}.{bill_table.name}").scalar()
+            for bill_table, _ in ARCHIVED_TABLES
+        }
+        conn.execute(Archive.__table__.update().where(Archive.financial_year == start_year).values(
+            op_bills=counts["op_bills"], ip_bills=counts["ip_bills"], archived_at=datetime.utcnow()
+        ))
+        conn.commit()
+    return moved
+
+
+def archive_closed_years(engine) -> dict:
+    with engine.connect() as conn:
+        years = closed_financial_years(conn)
+    moved = {}
+    for year in years:
+        try:
+            moved[year] = archive_financial_year(engine, year)
+        except ValueError as e:
+            logger.warning("Skipped %s: %s", year, e)
+    return moved
+
+
+if __name__ == "__main__":
+    import sys
+    from database import engine, create_tables
+
+    command = sys.argv[1:2]
+    if command not in (["list"], ["run"]) or sys.argv[2:] not in ([], ["--vacuum"]):
+        sys.exit("usage: python -m app.core.archive list | run [--vacuum]")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    create_tables()
+    if command == ["list"]:
+        with engine.connect() as conn:
+            for row in conn.execute(select(Archive).order_by(Archive.financial_year)):
+                print(f"{row.financial_year}-{(row.financial_year + 1) % 100:02d}: {row.filename}, "
+                      f"{row.op_bills} OP / {row.ip_bills} IP bills")
+            print(f"closed years still in {settings.db_filename}: {closed_financial_years(conn) or 'none'}")
+    else:
+        for year, moved in archive_closed_years(engine).items():
+            print(f"{year}: moved {moved}")
+        if "--vacuum" in sys.argv:
+            # Gives the freed pages back to the file system; needs the
+            # database to itself, so only run it with the backend stopped
+            with engine.connect() as conn:
+                conn.exec_driver_sql("VACUUM")
@@ -0,0 +1,476 @@
+"""
+Online backups of hms_lite.db with point-in-time restore.
+
+Two kinds of files go to settings.backup_dir while the backend runs:
+
+    base/hms_lite-20261017T043000123456Z.db
+        Full copies made with the SQLite online backup API, a few hundred
+        pages per step. In WAL mode the copy reads one snapshot (a read
+        transaction, which never blocks writers), so it does not restart
+        when bills are saved meanwhile. Taken every backup_interval_hours;
+        the newest backup_keep are kept.
+
+    wal/20261017T043000123456Z-<salts>/header
+    wal/.../<start>-<end>-20261017T043030123456Z.frames
+        Committed WAL frames, copied every backup_wal_interval seconds. Each
+        directory is one lifetime of the -wal file (SQLite rewrites it from
+        the start after a complete checkpoint, with new salts). While
+        shipping is on, connections don't checkpoint by themselves
+        (wal_autocheckpoint=0); the shipper checkpoints right after a copy,
+        while it holds the write lock, so no frame is ever checkpointed and
+        overwritten before it was copied.
+
+A restore copies the newest base taken before the requested time and
+replays the WAL lifetimes after it, up to the last segment shipped by then,
+so the restore point is accurate to backup_wal_interval. Frames written
+while the backend is stopped (e.g. by a CLI tool) are only covered by the
+next base backup. With the rollback journal ("default" profile) only base
+backups are taken.
+
+    python -m app.core.backup backup
+    python -m app.core.backup list
+    python -m app.core.backup restore [--at "2026-10-17 09:30"] [--to PATH]
+"""
+import logging
+import os
+import shutil
+import sqlite3
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = "base"
+WAL_DIR = "wal"
+WAL_HEADER_SIZE = 32
+WAL_FRAME_HEADER_SIZE = 24
+
+# Only one base backup at a time, whoever asks for it
+_base_lock = threading.Lock()
+
+
+def _stamp(when: datetime) -> str:
+    return when.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+
+
+def _parse_stamp(text: str) -> datetime:
+    return datetime.strptime(text, "%Y%m%dT%H%M%S%fZ").replace(tzinfo=timezone.utc)
+
+
+def _connect(path: str, read_only: bool = False) -> sqlite3.Connection:
+    if read_only:
+        uri = f"{Path(path).resolve().as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, isolation_level=None, check_same_thread=False)
+    else:
+        conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    conn.execute(f"PRAGMA busy_timeout={settings.sqlite_busy_timeout or 5000}")
+    return conn
+
+
+def wal_enabled(db_path: str) -> bool:
+    conn = _connect(db_path, read_only=True)
+    try:
+        return conn.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal"
+    finally:
+        conn.close()
+
+
+# ---------------------------------------------------------------- base backups
+
+
+def list_base_backups(backup_dir: str) -> List[dict]:
+    directory = os.path.join(backup_dir, BASE_DIR)
+    if not os.path.isdir(directory):
+        return []
+    backups = []
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith(".db"):
+            path = os.path.join(directory, filename)
+            backups.append({
+                "path": path,
+                "taken_at": _parse_stamp(filename.rsplit("-", 1)[1][:-len(".db")]),
+                "size": os.path.getsize(path),
+            })
+    return backups
+
+
+def backup_database(db_path: str, backup_dir: str,
+                    pages_per_step: Optional[int] = None, step_pause: Optional[float] = None) -> dict:
+    """
+    Copy the live database into backup_dir/base with the online backup API.
+    Returns the new backup's path, snapshot time, size and duration.
+    """
+    pages_per_step = pages_per_step or settings.backup_pages_per_step
+    step_pause = settings.backup_step_pause if step_pause is None else step_pause
+    directory = os.path.join(backup_dir, BASE_DIR)
+    os.makedirs(directory, exist_ok=True)
+
+    with _base_lock:
+        started = time.perf_counter()
+        source = _connect(db_path, read_only=True)
+        try:
+            wal = source.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal"
+            if wal:
+                # Pin one snapshot for the whole copy; WAL readers don't
+                # block writers, and the copy can't be restarted by them
+                source.execute("BEGIN")
+                source.execute("SELECT count(*) FROM sqlite_master").fetchone()
+            taken_at = datetime.now(timezone.utc)
+            name = os.path.basename(db_path).rsplit(".", 1)[0]
+            path = os.path.join(directory, f"{name}-{_stamp(taken_at)}.db")
+
+            target = sqlite3.connect(path + ".partial")
+            try:
+                # The pause between steps lets writers in on rollback-journal
+                # databases, where the copy's read lock blocks them
+                source.backup(
+                    target, pages=pages_per_step,
+                    progress=(lambda status, remaining, total: time.sleep(step_pause)) if step_pause else None
+                )
+            finally:
+                target.close()
+            if wal:
+                source.execute("COMMIT")
+        finally:
+            source.close()
+        os.replace(path + ".partial", path)
+
+    return {
+        "path": path,
+        "taken_at": taken_at,
+        "size": os.path.getsize(path),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+# ---------------------------------------------------------------- WAL shipping
+
+
+def _wal_generations(backup_dir: str) -> List[str]:
+    directory = os.path.join(backup_dir, WAL_DIR)
+    if not os.path.isdir(directory):
+        return []
+    return [os.path.join(directory, name) for name in sorted(os.listdir(directory))]
+
+
+def _segments(generation: str) -> List[dict]:
+    segments = []
+    for filename in sorted(os.listdir(generation)):
+        if filename.endswith(".frames"):
+            start, end, stamp = filename[:-len(".frames")].split("-")
+            segments.append({
+                "path": os.path.join(generation, filename),
+                "start": int(start),
+                "end": int(end),
+                "shipped_at": _parse_stamp(stamp),
+            })
+    return segments
+
+
+class WalShipper:
+    """
+    Copies newly committed frames of the live -wal file into backup_dir/wal.
+    Not thread-safe; the backup scheduler owns one.
+    """
+    def __init__(self, db_path: str, backup_dir: str):
+        self.db_path = db_path
+        self.wal_path = db_path + "-wal"
+        self.backup_dir = backup_dir
+        self.salts = None
+        self.generation = None
+        self.offset = WAL_HEADER_SIZE
+        self._conn = None
+        self._checkpointer = None
+
+    def _resume(self, salts: bytes, header: bytes):
+        # Same -wal file as before a restart: carry on after what's shipped
+        suffix = salts.hex()
+        for generation in _wal_generations(self.backup_dir):
+            if generation.endswith(suffix):
+                segments = _segments(generation)
+                self.generation = generation
+                self.offset = segments[-1]["end"] if segments else WAL_HEADER_SIZE
+                break
+        else:
+            self.generation = os.path.join(
+                self.backup_dir, WAL_DIR, f"{_stamp(datetime.now(timezone.utc))}-{suffix}"
+            )
+            os.makedirs(self.generation)
+            with open(os.path.join(self.generation, "header"), "wb") as f:
+                f.write(header)
+            self.offset = WAL_HEADER_SIZE
+        self.salts = salts
+
+    def _committed_end(self, wal, page_size: int) -> int:
+        # Walk frame headers from the shipped offset; frames belong to this
+        # lifetime while their salts match, and only whole transactions
+        # (up to a commit frame) are shipped
+        frame_size = WAL_FRAME_HEADER_SIZE + page_size
+        offset = end = self.offset
+        wal.seek(offset)
+        while True:
+            frame_header = wal.read(WAL_FRAME_HEADER_SIZE)
+            if len(frame_header) < WAL_FRAME_HEADER_SIZE or frame_header[8:16] != self.salts:
+                return end
+            commit_size = struct.unpack(">I", frame_header[4:8])[0]
+            offset += frame_size
+            if commit_size:
+                end = offset
+            wal.seek(offset)
+
+    def ship(self, checkpoint_pages: Optional[int] = None) -> int:
+        """
+        Copy frames committed since the last call into a new segment, then
+        checkpoint if the -wal holds more than checkpoint_pages frames.
+        Holds the database write lock meanwhile. Returns bytes shipped.
+        """
+        checkpoint_pages = settings.backup_checkpoint_pages if checkpoint_pages is None else checkpoint_pages
+        if self._conn is None:
+            self._conn = _connect(self.db_path)
+            self._checkpointer = _connect(self.db_path)
+
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            if not os.path.exists(self.wal_path):
+                return 0
+            with open(self.wal_path, "rb") as wal:
+                header = wal.read(WAL_HEADER_SIZE)
+                if len(header) < WAL_HEADER_SIZE:
+                    return 0
+                page_size = struct.unpack(">I", header[8:12])[0]
+                if header[16:24] != self.salts:
+                    self._resume(header[16:24], header)
+
+                end = self._committed_end(wal, page_size)
+                shipped = end - self.offset
+                if shipped:
+                    wal.seek(self.offset)
+                    name = f"{self.offset:012d}-{end:012d}-{_stamp(datetime.now(timezone.utc))}.frames"
+                    path = os.path.join(self.generation, name)
+                    with open(path + ".partial", "wb") as segment:
+                        remaining = shipped
+                        while remaining:
+                            chunk = wal.read(min(remaining, 1 << 20))
+                            segment.write(chunk)
+                            remaining -= len(chunk)
+                    os.replace(path + ".partial", path)
+                    self.offset = end
+
+            frames = (self.offset - WAL_HEADER_SIZE) // (WAL_FRAME_HEADER_SIZE + page_size)
+            if frames >= checkpoint_pages:
+                # Everything up to here is shipped and nobody can commit
+                # until we release the lock; the next writer after a
+                # complete checkpoint starts a new -wal lifetime
+                self._checkpointer.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+            return shipped
+        finally:
+            self._conn.execute("ROLLBACK")
+
+    def close(self):
+        for conn in (self._conn, self._checkpointer):
+            if conn is not None:
+                conn.close()
+        self._conn = self._checkpointer = None
+
+
+# ---------------------------------------------------------------- retention
+
+
+def prune_backups(backup_dir: str, keep: Optional[int] = None) -> int:
+    """
+    Keep the newest `keep` base backups and the WAL lifetimes a restore
+    from any of them needs. Returns the number of files and directories
+    removed.
+    """
+    keep = max(1, keep or settings.backup_keep)
+    bases = list_base_backups(backup_dir)
+    removed = 0
+    for base in bases[:-keep]:
+        os.remove(base["path"])
+        removed += 1
+    kept = bases[-keep:]
+    if not kept:
+        return removed
+
+    oldest = kept[0]["taken_at"]
+    generations = _wal_generations(backup_dir)
+    # The current lifetime is never removed, whatever its last segment
+    for generation in generations[:-1]:
+        segments = _segments(generation)
+        if not segments or segments[-1]["shipped_at"] < oldest:
+            shutil.rmtree(generation)
+            removed += 1
+    return removed
+
+
+# ---------------------------------------------------------------- restore
+
+
+def restore_database(backup_dir: str, target: str, at: Optional[datetime] = None) -> dict:
+    """
+    Rebuild the database as of `at` (an aware datetime; latest if None)
+    into target, which must not exist. The live database is never touched;
+    swap the file in with the backend stopped.
+    """
+    at = at or datetime.now(timezone.utc)
+    if os.path.exists(target):
+        raise FileExistsError(f"{target} already exists")
+    bases = [base for base in list_base_backups(backup_dir) if base["taken_at"] <= at]
+    if not bases:
+        raise FileNotFoundError(f"No base backup taken before {at.isoformat()}")
+    base = bases[-1]
+
+    shutil.copyfile(base["path"], target)
+    conn = sqlite3.connect(target)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.close()
+
+    applied, restored_to = 0, base["taken_at"]
+    for generation in _wal_generations(backup_dir):
+        segments = [segment for segment in _segments(generation) if segment["shipped_at"] <= at]
+        # Lifetimes that ended before the base are already in it
+        if not segments or segments[-1]["shipped_at"] < base["taken_at"]:
+            continue
+
+        with open(target + "-wal", "wb") as wal:
+            with open(os.path.join(generation, "header"), "rb") as header:
+                wal.write(header.read())
+            for segment in segments:
+                if segment["start"] != wal.tell():
+                    # A gap means frames are missing; stop at what's certain
+                    logger.warning("Gap in %s at %d, restoring up to %s", generation, wal.tell(), restored_to)
+                    break
+                with open(segment["path"], "rb") as frames:
+                    shutil.copyfileobj(frames, wal)
+                applied += 1
+                restored_to = max(restored_to, segment["shipped_at"])
+        # Opening the database recovers the -wal; the checkpoint folds it in
+        conn = sqlite3.connect(target)
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        conn.close()
+
+    conn = sqlite3.connect(target)
+    try:
+        check = conn.execute("PRAGMA quick_check").fetchone()[0]
+    finally:
+        conn.close()
+    return {
+        "path": target,
+        "base": base["path"],
+        "segments": applied,
+        "restored_to": restored_to,
+        "quick_check": check,
+    }
+
+
+# ---------------------------------------------------------------- scheduler
+
+
+class BackupScheduler:
+    """
+    Background thread that ships WAL segments every backup_wal_interval
+    seconds and takes a base backup (then prunes) every
+    backup_interval_hours. Started from the app lifespan when backup_dir
+    is set.
+    """
+    def __init__(self, db_path: str, backup_dir: str):
+        self.db_path = db_path
+        self.backup_dir = backup_dir
+        self.shipper = WalShipper(db_path, backup_dir) if wal_enabled(db_path) else None
+        self._ship_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="hms-backup", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def ship_now(self) -> int:
+        if self.shipper is None:
+            return 0
+        with self._ship_lock:
+            return self.shipper.ship()
+
+    def _base_due(self) -> bool:
+        bases = list_base_backups(self.backup_dir)
+        if not bases:
+            return True
+        age = datetime.now(timezone.utc) - bases[-1]["taken_at"]
+        return age.total_seconds() >= settings.backup_interval_hours * 3600
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.ship_now()
+                if self._base_due():
+                    backup = backup_database(self.db_path, self.backup_dir)
+                    logger.info("Base backup %s (%d bytes) in %ss", backup["path"], backup["size"], backup["seconds"])
+                    prune_backups(self.backup_dir)
+            except Exception:
+                logger.exception("Backup failed")
+            self._stop.wait(settings.backup_wal_interval)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        # Last frames before the connections close and checkpoint the -wal away
+        try:
+            self.ship_now()
+        except Exception:
+            logger.exception("Final WAL shipment failed")
+        if self.shipper is not None:
+            self.shipper.close()
+
+
+def start_backups() -> Optional[BackupScheduler]:
+    if not settings.backup_dir:
+        return None
+    os.makedirs(settings.backup_dir, exist_ok=True)
+    return BackupScheduler(settings.db_path, settings.backup_dir).start()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m app.core.backup")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("backup", help="take a base backup now")
+    commands.add_parser("list", help="list base backups and WAL segments")
+    restore = commands.add_parser("restore", help="rebuild the database as of a point in time")
+    restore.add_argument("--at", help="local time, e.g. '2026-10-17 09:30' (default: latest)")
+    restore.add_argument("--to", help="output file (default: restored-<time>.db in the data directory)")
+    args = parser.parse_args()
+
+    if not settings.backup_dir:
+        parser.exit(1, "Set HMS_BACKUP_DIR first\n")
+
+    if args.command == "backup":
+        if not os.path.exists(settings.db_path):
+            parser.exit(1, f"No database at {settings.db_path}\n")
+        backup = backup_database(settings.db_path, settings.backup_dir)
+        print(f"{backup['path']}: {backup['size']} bytes in {backup['seconds']}s")
+        prune_backups(settings.backup_dir)
+    elif args.command == "list":
+        for base in list_base_backups(settings.backup_dir):
+            print(f"base {base['taken_at'].astimezone():%Y-%m-%d %H:%M:%S}  {base['size']:>12}  {base['path']}")
+        for generation in _wal_generations(settings.backup_dir):
+            segments = _segments(generation)
+            if segments:
+                print(f"wal  {segments[0]['shipped_at'].astimezone():%Y-%m-%d %H:%M:%S} .. "
+                      f"{segments[-1]['shipped_at'].astimezone():%Y-%m-%d %H:%M:%S}  "
+                      f"{len(segments)} segments  {os.path.basename(generation)}")
+    else:
+        # Naive times are local, like the desk's clock
+        at = datetime.fromisoformat(args.at).astimezone(timezone.utc) if args.at else None
+        target = args.to or os.path.join(
+            settings.data_dir, f"restored-{datetime.now():%Y%m%d-%H%M%S}.db"
+        )
+        result = restore_database(settings.backup_dir, target, at)
+        print(f"Restored {result['base']} + {result['segments']} WAL segments to {result['path']}")
+        print(f"Up to {result['restored_to'].astimezone():%Y-%m-%d %H:%M:%S}, quick_check: {result['quick_check']}")
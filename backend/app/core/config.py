@@ -0,0 +1,198 @@
+import os
+from typing import Optional
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+def default_data_dir() -> str:
+    base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    return os.path.join(base, "HMSLite")
+
+
+# PRAGMA sets applied to every new SQLite connection.
+# "default" keeps SQLite's stock rollback journal (the old behaviour),
+# "safe" switches to WAL but still fsyncs on every commit,
+# "performance" is WAL + synchronous=NORMAL with a larger page cache and mmap.
+SQLITE_PROFILES = {
+    "default": {},
+    "safe": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+    },
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+}
+
+
+class Settings(BaseSettings):
+    """
+    Backend settings, read from HMS_* environment variables or a .env file.
+    """
+    model_config = SettingsConfigDict(env_prefix="HMS_", env_file=".env", extra="ignore")
+
+    data_dir: str = default_data_dir()
+    db_filename: str = "hms_lite.db"
+
+    # SQLite engine profile, see SQLITE_PROFILES
+    db_profile: str = "performance"
+    # Per-pragma overrides on top of the selected profile
+    sqlite_journal_mode: Optional[str] = None
+    sqlite_synchronous: Optional[str] = None
+    sqlite_mmap_size: Optional[int] = None
+    sqlite_cache_size: Optional[int] = None
+    sqlite_temp_store: Optional[str] = None
+    sqlite_busy_timeout: Optional[int] = None
+
+    sql_echo: bool = False
+
+    # Backend log (app/core/logs.py): JSON lines in log_file, default
+    # <data_dir>/logs/backend.log, rotated at log_file_bytes; plain text on
+    # the console too unless log_console is off. Records are written by a
+    # background thread; past log_queue_size waiting records new ones are
+    # dropped instead of blocking requests.
+    log_level: str = "INFO"
+    log_file: Optional[str] = None
+    log_file_bytes: int = 10 * 1024 * 1024
+    log_file_backups: int = 5
+    log_console: bool = True
+    log_queue_size: int = 10000
+    # Warn when one statement shape runs more than this many times within
+    # a request (app/core/dbstats.py); 0 turns the warning off
+    n_plus_one_threshold: int = 10
+
+    # Statements taking at least this many ms go to the slow-query log with
+    # their parameters, route and query plan (app/core/slowqueries.py); 0
+    # turns the log off. sql_echo logs every statement and is for
+    # debugging only.
+    slow_query_ms: float = 200
+    # <data_dir>/logs/slow-queries.log if unset, rotated at
+    # slow_query_log_bytes with slow_query_log_backups old files kept
+    slow_query_log: Optional[str] = None
+    slow_query_log_bytes: int = 5 * 1024 * 1024
+    slow_query_log_backups: int = 3
+    # Each statement shape is written at most once per this many seconds
+    slow_query_log_interval: float = 60
+    # Bound parameters hold patient names and phone numbers
+    slow_query_log_parameters: bool = True
+
+    # ?__profile=1 (or X-HMS-Profile: 1) from an admin samples that request's
+    # stacks every profile_interval_ms into <data_dir>/profiles
+    # (app/core/profiler.py); the newest profile_keep are kept
+    profiling_enabled: bool = True
+    profile_interval_ms: float = 2
+    profile_keep: int = 50
+
+    # tracemalloc allocation tracking (app/core/memory.py): per-route peak
+    # memory and allocation sites at /diagnostics/memory. It slows every
+    # allocation, so it only runs from startup when memory_tracking is set;
+    # admins can also switch it on and off at runtime. memory_trace_frames
+    # frames are kept per allocation, the last memory_snapshots snapshots
+    memory_tracking: bool = False
+    memory_trace_frames: int = 1
+    memory_snapshots: int = 5
+
+    # GET /metrics (Prometheus text format, no login) and the request
+    # metrics middleware feeding it
+    metrics_enabled: bool = True
+
+    # Spans (handler, auth, statements, commit, serialization) of the last
+    # trace_buffer_size requests, kept in memory (app/core/tracing.py) and
+    # exported as Chrome trace JSON from /diagnostics/traces; 0 turns it off
+    trace_buffer_size: int = 200
+    # Spans recorded per request at most; a bulk import stops adding there
+    trace_max_spans: int = 2000
+
+    # Reports and dashboards read through their own pool of read-only
+    # connections; all mutations share a single writer connection.
+    read_pool_size: int = 4
+    read_pool_overflow: int = 4
+    write_pool_timeout: float = 30
+
+    # Worker threads for the sync route handlers; each one holds at most one
+    # database session while it runs.
+    threadpool_size: int = 40
+
+    # Rows per transaction for migration backfills, and an optional pause
+    # (seconds) between batches
+    migration_batch_size: int = 5000
+    migration_batch_pause: float = 0
+
+    # Source rows per transaction when the rollups are rebuilt while the
+    # backend serves (POST /dashboard/stats/rebuild, the seeders)
+    rollup_rebuild_batch_size: int = 20000
+
+    # OP/IP/bill numbers reserved per trip to the sequences table. Numbers
+    # left in a block when the backend stops are skipped; 1 makes them
+    # gapless at the cost of a write per allocation.
+    sequence_block_size: int = 10
+
+    # Parquet snapshots of the billing tables (app/core/analytics.py);
+    # <data_dir>/analytics if unset
+    analytics_dir: Optional[str] = None
+
+    # Bills of closed financial years move to hms_archive_<year>.db
+    # (app/core/archive.py); this many of the latest closed years stay in
+    # the main database, and a year is moved this many days at a time
+    archive_keep_years: int = 1
+    archive_batch_days: int = 31
+
+    # Online backups (app/core/backup.py), off unless backup_dir is set.
+    # Base copies every backup_interval_hours, the newest backup_keep kept,
+    # copied backup_pages_per_step pages at a time
+    backup_dir: Optional[str] = None
+    backup_interval_hours: float = 24
+    backup_keep: int = 7
+    backup_pages_per_step: int = 256
+    backup_step_pause: float = 0.005
+    # WAL segments are shipped this often (the point-in-time restore
+    # granularity); the shipper checkpoints once the -wal holds this many
+    # frames
+    backup_wal_interval: float = 30
+    backup_checkpoint_pages: int = 1000
+
+    @property
+    def db_path(self) -> str:
+        return os.path.join(self.data_dir, self.db_filename)
+
+    @property
+    def log_file_path(self) -> str:
+        return self.log_file or os.path.join(self.data_dir, "logs", "backend.log")
+
+    @property
+    def slow_query_log_path(self) -> str:
+        return self.slow_query_log or os.path.join(self.data_dir, "logs", "slow-queries.log")
+
+    @property
+    def analytics_path(self) -> str:
+        return self.analytics_dir or os.path.join(self.data_dir, "analytics")
+
+    def sqlite_pragmas(self) -> dict:
+        if self.db_profile not in SQLITE_PROFILES:
+            raise ValueError(
+                f"Unknown db_profile '{self.db_profile}', "
+                f"expected one of {', '.join(SQLITE_PROFILES)}"
+            )
+
+        pragmas = dict(SQLITE_PROFILES[self.db_profile])
+        overrides = {
+            "journal_mode": self.sqlite_journal_mode,
+            "synchronous": self.sqlite_synchronous,
+            "mmap_size": self.sqlite_mmap_size,
+            "cache_size": self.sqlite_cache_size,
+            "temp_store": self.sqlite_temp_store,
+            "busy_timeout": self.sqlite_busy_timeout,
+        }
+        for name, value in overrides.items():
+            if value is not None:
+                pragmas[name] = value
+        return pragmas
+
+
+settings = Settings()
@@ -0,0 +1,136 @@
+"""
+Per-request database statement counts and time.
+
+Engine event hooks record every statement run while a request is being
+handled; QueryStatsMiddleware sends the totals back as X-DB-Queries and
+X-DB-Time (milliseconds) and logs a warning when one statement shape runs
+more than settings.n_plus_one_threshold times in a request, which is what a
+lazy load inside a loop (N+1) looks like.
+
+The collector lives in a context variable set by the middleware; the sync
+handlers and their dependencies run in worker threads that inherit it.
+Statements outside a request (CLIs, backup threads) are not counted.
+"""
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Optional
+
+from sqlalchemy import event
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_HEADER = "X-DB-Queries"
+QUERY_TIME_HEADER = "X-DB-Time"
+
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_SPACES = re.compile(r"\s+")
+
+
+class QueryStats:
+    __slots__ = ("scope", "count", "seconds", "shapes")
+
+    def __init__(self, scope=None):
+        self.scope = scope
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    @property
+    def route(self) -> str:
+        """Method and route template (GET /patients/{patient_id}), or the raw path before routing"""
+        if not self.scope:
+            return ""
+        route = self.scope.get("route")
+        return f"{self.scope['method']} {getattr(route, 'path', None) or self.scope['path']}"
+
+    def repeated(self, threshold: int):
+        """(shape, count) of the statements run more than threshold times"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > threshold]
+
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def current_stats() -> Optional[QueryStats]:
+    return _current.get()
+
+
+@lru_cache(maxsize=1024)
+def statement_shape(statement: str) -> str:
+    """
+    The statement with IN lists of any length folded to one placeholder, so
+    a lookup per id and a batch of ids don't look alike only by accident.
+    """
+    return _IN_LIST.sub("IN (?)", _SPACES.sub(" ", statement).strip())
+
+
+# Start times live on the execution context, not the connection: a statement
+# that raises never reaches after_cursor_execute, and its start time must
+# not be paired with the next statement's end
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None and context is not None:
+        context.hms_query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    started = getattr(context, "hms_query_started", None)
+    if started is not None:
+        stats.seconds += time.perf_counter() - started
+    stats.count += 1
+    stats.shapes[statement_shape(statement)] += 1
+
+
+def instrument(*engines):
+    """Count statements run on these engines towards the current request"""
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+class QueryStatsMiddleware:
+    """
+    ASGI middleware adding X-DB-Queries / X-DB-Time to every HTTP response.
+
+    The headers carry what ran before the response started; statements run
+    while a streaming body is produced only show up in the N+1 warning.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats(scope)
+        token = _current.set(stats)
+
+        async def send_with_stats(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((QUERY_COUNT_HEADER.encode(), str(stats.count).encode()))
+                headers.append((QUERY_TIME_HEADER.encode(), f"{stats.seconds * 1000:.2f}".encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            _current.reset(token)
+            threshold = settings.n_plus_one_threshold
+            if threshold:
+                for shape, count in stats.repeated(threshold):
+                    logger.warning(
+                        "%s ran the same statement %d times (N+1?): %.300s",
+                        stats.route, count, shape
+                    )
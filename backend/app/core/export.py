@@ -0,0 +1,186 @@
+"""
+Row-by-row CSV and XLSX writers for streaming exports.
+
+Both take a header and an iterator of row tuples and yield encoded chunks,
+so a StreamingResponse can send a year of bills while only one chunk is in
+memory. The XLSX is written by hand: a minimal workbook (one sheet, inline
+strings, no styles) zipped on the fly without seeking.
+"""
+import csv
+import io
+import re
+import zipfile
+from datetime import date, datetime
+from typing import Iterable, Iterator, Optional, Sequence
+from xml.sax.saxutils import escape
+
+from .archive import archive_reads
+
+CHUNK_SIZE = 64 * 1024
+
+# Each chunk from the read cursor; rows are fetched lazily by sqlite3
+DEFAULT_BATCH_SIZE = 1000
+
+
+def stream_rows(session_factory, statements, start_day: Optional[date] = None, end_day: Optional[date] = None,
+                batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[tuple]:
+    """
+    Execute Core statements one after another in a single read transaction
+    (one consistent snapshot) and yield their rows. The bill tables include
+    the archived years overlapping [start_day, end_day]. The session is
+    held only while the response is being sent.
+    """
+    with session_factory() as db, archive_reads(db, start_day, end_day):
+        conn = db.connection()
+        # pysqlite doesn't begin a transaction for SELECTs, so each statement
+        # would read its own snapshot; an explicit (deferred) BEGIN keeps the
+        # first statement's WAL snapshot until the last row is sent. It comes
+        # after archive_reads: SQLite can't ATTACH inside a transaction
+        conn.exec_driver_sql("BEGIN")
+        for statement in statements:
+            result = conn.execution_options(yield_per=batch_size).execute(statement)
+            for row in result:
+                yield tuple(row)
+
+
+def _text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ", timespec="seconds")
+    if isinstance(value, date):
+        return value.isoformat()
+    return str(value)
+
+
+def csv_stream(header: Sequence[str], rows: Iterable[tuple]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so Excel opens the UTF-8 file with the right encoding
+    buffer.write("\ufeff")
+    writer.writerow(header)
+    for row in rows:
+        # csv formats numbers and None itself; only dates need converting
+        writer.writerow([_text(value) if isinstance(value, date) else value for value in row])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+class _ChunkSink:
+    """
+    Write-only file object for ZipFile. It has no tell/seek, so ZipFile
+    writes data descriptors instead of going back to patch headers.
+    """
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{name}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetData>'
+)
+
+_SHEET_END = '</sheetData></worksheet>'
+
+# Characters XML 1.0 does not allow, even escaped
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _column_letters(index: int) -> str:
+    letters = ""
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def _cell(ref: str, value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c r="{ref}"><v>{value}</v></c>'
+    text = escape(_INVALID_XML.sub("", _text(value)))
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def xlsx_stream(header: Sequence[str], rows: Iterable[tuple], sheet_name: str = "Export") -> Iterator[bytes]:
+    letters = [_column_letters(i) for i in range(len(header))]
+
+    def row_xml(number: int, values) -> bytes:
+        cells = "".join(_cell(f"{letter}{number}", value) for letter, value in zip(letters, values))
+        return f'<row r="{number}">{cells}</row>'.encode("utf-8")
+
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as workbook:
+        workbook.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        workbook.writestr("_rels/.rels", _ROOT_RELS)
+        workbook.writestr("xl/workbook.xml", _WORKBOOK.format(name=escape(sheet_name[:31])))
+        workbook.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+
+        with workbook.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(_SHEET_START.encode("utf-8"))
+            sheet.write(row_xml(1, header))
+            for number, row in enumerate(rows, start=2):
+                sheet.write(row_xml(number, row))
+                if sink.size >= CHUNK_SIZE:
+                    yield sink.take()
+            sheet.write(_SHEET_END.encode("utf-8"))
+    yield sink.take()
@@ -0,0 +1,498 @@
+"""
+Bulk import of legacy patients and OP/IP bills from CSV or NDJSON.
+
+Records are validated with the import schemas (app/schemas), which extend
+the create schemas with the legacy OP/IP and bill numbers and dates. Valid
+records are written with Core executemany, batch_size records per
+transaction. Between chunks the writer connection goes back to the pool, so
+billing continues while a long import runs.
+
+Each job's progress is kept in import_jobs and committed with the chunk it
+covers; running the same job again skips the records already settled
+(imported or rejected). Rejected records are counted and reported with
+their record number, and never stop the import.
+
+NDJSON has one record per line; bills carry their items as a list. CSV has
+one row per patient, or one row per bill item: consecutive rows with the
+same bill_number form one bill, and item fields are prefixed with "item_"
+(item_particular, item_rate, ...). Empty cells count as missing.
+Timestamps without a timezone are taken as local time.
+
+Bills find their patient by patient_id or op_number, so import patients
+first. Each chunk adds its rows to the rollups in its own transaction, per
+day as the routers do; numbering sequences are moved past the imported
+numbers once a job finishes.
+
+    python -m app.core.importer patients patients.csv
+    python -m app.core.importer op-bills op_bills.ndjson --job op-2019
+"""
+import csv
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import func, insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .rollups import record_daily_stats_many, record_particular_stats_many
+from ..models import Patient, Doctor, OPBill, OPBillItem, IPBill, IPBillItem, ImportJob
+from ..models.models import local_business_day
+from ..schemas import PatientImport, OPBillImport, IPBillImport
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+# Rejected records listed in a job's result; the rest are only counted
+MAX_ERRORS = 100
+ITEM_PREFIX = "item_"
+
+
+def _utc(timestamp: Optional[datetime]) -> datetime:
+    # Stored timestamps are naive UTC (datetime.utcnow)
+    if timestamp is None:
+        return datetime.utcnow()
+    return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _describe(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in detail['loc']) or 'record'}: {detail['msg']}"
+        for detail in error.errors()
+    )
+
+
+class _Rejections:
+    def __init__(self):
+        self.count = 0
+        self.errors = []
+
+    def add(self, number: int, message: str):
+        self.count += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({"record": number, "error": message})
+
+
+class _Importer(ABC):
+    schema = None
+
+    def validate(self, record: dict):
+        return self.schema.model_validate(record)
+
+    @abstractmethod
+    def insert(self, conn, records: List[Tuple[int, object]], doctor_ids: set,
+               created_by: str, rejections: _Rejections) -> int:
+        """Insert the valid records of one chunk; returns how many were written."""
+
+
+class _PatientImporter(_Importer):
+    schema = PatientImport
+
+    def insert(self, conn, records, doctor_ids, created_by, rejections):
+        numbers = [patient.op_number for _, patient in records]
+        ip_numbers = [patient.ip_number for _, patient in records if patient.ip_number]
+        taken = set(conn.execute(
+            select(Patient.op_number).where(Patient.op_number.in_(numbers))
+        ).scalars())
+        taken_ip = set(conn.execute(
+            select(Patient.ip_number).where(Patient.ip_number.in_(ip_numbers))
+        ).scalars()) if ip_numbers else set()
+
+        now = datetime.utcnow()
+        rows = []
+        for number, patient in records:
+            if patient.doctor_id not in doctor_ids:
+                rejections.add(number, f"doctor {patient.doctor_id} not found")
+                continue
+            if patient.op_number in taken:
+                rejections.add(number, f"OP number {patient.op_number} already exists")
+                continue
+            if patient.ip_number and patient.ip_number in taken_ip:
+                rejections.add(number, f"IP number {patient.ip_number} already exists")
+                continue
+            taken.add(patient.op_number)
+            if patient.ip_number:
+                taken_ip.add(patient.ip_number)
+
+            registered = _utc(patient.registration_date)
+            rows.append({
+                **patient.model_dump(exclude={"registration_date", "created_by"}),
+                "registration_date": registered,
+                "registration_day": local_business_day(registered),
+                "created_by": patient.created_by or created_by,
+                "created_at": now,
+            })
+
+        if rows:
+            conn.execute(insert(Patient), rows)
+
+        registered = defaultdict(lambda: {"patients_registered": 0})
+        for row in rows:
+            registered[(row["registration_day"], row["doctor_id"])]["patients_registered"] += 1
+        record_daily_stats_many(conn, registered)
+        return len(rows)
+
+
+class _BillImporter(_Importer):
+    bill_type = None
+    bill_model = None
+    item_model = None
+
+    @abstractmethod
+    def bill_values(self, bill) -> Tuple[dict, List[dict]]:
+        """Columns of the bill and its items, with totals computed as the routers do."""
+
+    def _patient_ids(self, conn, records) -> Dict[str, int]:
+        op_numbers = {bill.op_number for _, bill in records if bill.patient_id is None}
+        if not op_numbers:
+            return {}
+        return dict(conn.execute(
+            select(Patient.op_number, Patient.id).where(Patient.op_number.in_(op_numbers))
+        ).all())
+
+    def insert(self, conn, records, doctor_ids, created_by, rejections):
+        bill_model = self.bill_model
+        by_op_number = self._patient_ids(conn, records)
+        given_ids = {bill.patient_id for _, bill in records if bill.patient_id is not None}
+        known_ids = set(conn.execute(
+            select(Patient.id).where(Patient.id.in_(given_ids))
+        ).scalars()) if given_ids else set()
+        taken = set(conn.execute(
+            select(bill_model.bill_number).where(
+                bill_model.bill_number.in_([bill.bill_number for _, bill in records])
+            )
+        ).scalars())
+
+        # Ids are assigned here so items can be inserted with executemany
+        # too; import_records holds the write lock since before this read
+        next_id = (conn.execute(select(func.max(bill_model.id))).scalar() or 0) + 1
+        now = datetime.utcnow()
+        bill_rows, item_rows = [], []
+        for number, bill in records:
+            if bill.patient_id is not None:
+                patient_id = bill.patient_id if bill.patient_id in known_ids else None
+            else:
+                patient_id = by_op_number.get(bill.op_number)
+            if patient_id is None:
+                rejections.add(number, f"patient {bill.patient_id or bill.op_number} not found")
+                continue
+            if bill.doctor_id not in doctor_ids:
+                rejections.add(number, f"doctor {bill.doctor_id} not found")
+                continue
+            if bill.bill_number in taken:
+                rejections.add(number, f"bill number {bill.bill_number} already exists")
+                continue
+            taken.add(bill.bill_number)
+
+            billed = _utc(bill.bill_date)
+            values, items = self.bill_values(bill)
+            bill_rows.append({
+                **values,
+                "id": next_id,
+                "bill_number": bill.bill_number,
+                "bill_date": billed,
+                "bill_day": local_business_day(billed),
+                "patient_id": patient_id,
+                "created_by": bill.created_by or created_by,
+                "created_at": now,
+            })
+            item_rows.extend({**item, "bill_id": next_id, "created_at": now} for item in items)
+            next_id += 1
+
+        if bill_rows:
+            conn.execute(insert(bill_model), bill_rows)
+        if item_rows:
+            conn.execute(insert(self.item_model), item_rows)
+        self._record_rollups(conn, bill_rows, item_rows)
+        return len(bill_rows)
+
+    def _record_rollups(self, conn, bill_rows: List[dict], item_rows: List[dict]):
+        """Add the inserted bills and items to the rollups, grouped per day"""
+        kind = self.bill_type.lower()
+        bills_counter, revenue_counter = f"{kind}_bills", f"{kind}_revenue"
+        daily = defaultdict(lambda: {bills_counter: 0, revenue_counter: 0.0})
+        for row in bill_rows:
+            counters = daily[(row["bill_day"], row["doctor_id"])]
+            counters[bills_counter] += 1
+            counters[revenue_counter] += row["net_amount"]
+        record_daily_stats_many(conn, daily)
+
+        by_id = {row["id"]: row for row in bill_rows}
+        items = []
+        for item in item_rows:
+            bill = by_id[item["bill_id"]]
+            # OP items may carry their own doctor, otherwise they are the bill's
+            doctor_id = (item.get("doctor_id") if self.bill_type == "OP" else None) or bill["doctor_id"]
+            items.append((bill["bill_day"], item["particular"], doctor_id, item["total"]))
+        record_particular_stats_many(conn, self.bill_type, items)
+
+
+class _OPBillImporter(_BillImporter):
+    schema = OPBillImport
+    bill_type = "OP"
+    bill_model = OPBill
+    item_model = OPBillItem
+
+    def bill_values(self, bill):
+        total_amount = 0
+        discount_amount = 0
+        items = []
+        for item in bill.items:
+            amount = item.unit * item.rate
+            discount_amt = amount * (item.discount_percent / 100)
+            total_amount += amount
+            discount_amount += discount_amt
+            items.append({
+                "particular": item.particular,
+                "doctor": item.doctor,
+                "department": item.department,
+                "unit": item.unit,
+                "rate": item.rate,
+                "amount": amount,
+                "discount_percent": item.discount_percent,
+                "discount_amount": discount_amt,
+                "total": amount - discount_amt,
+            })
+        return {
+            "bill_type": bill.bill_type,
+            "category": bill.category,
+            "doctor_id": bill.doctor_id,
+            "discount_type": bill.discount_type,
+            "total_amount": total_amount,
+            "discount_amount": discount_amount,
+            "net_amount": total_amount - discount_amount,
+        }, items
+
+
+class _IPBillImporter(_BillImporter):
+    schema = IPBillImport
+    bill_type = "IP"
+    bill_model = IPBill
+    item_model = IPBillItem
+
+    def bill_values(self, bill):
+        total_amount = 0
+        discount_amount = 0
+        items = []
+        for item in bill.items:
+            discount_amt = item.amount * (item.discount_percent / 100)
+            total_amount += item.amount
+            discount_amount += discount_amt
+            items.append({
+                "particular": item.particular,
+                "department": item.department,
+                "amount": item.amount,
+                "discount_percent": item.discount_percent,
+                "discount_amount": discount_amt,
+                "total": item.amount - discount_amt,
+            })
+        net_amount = (
+            total_amount
+            - discount_amount
+            + bill.service_tax
+            + bill.education_cess
+            + bill.she_education_cess
+        )
+        return {
+            "is_credit": bill.is_credit,
+            "is_insurance": bill.is_insurance,
+            "category": bill.category,
+            "doctor_id": bill.doctor_id,
+            "discount_type": bill.discount_type,
+            "room": bill.room,
+            "admission_date": bill.admission_date,
+            "insurance_company": bill.insurance_company,
+            "third_party": bill.third_party,
+            "total_amount": total_amount,
+            "service_tax": bill.service_tax,
+            "education_cess": bill.education_cess,
+            "she_education_cess": bill.she_education_cess,
+            "net_amount": net_amount,
+        }, items
+
+
+IMPORTERS = {
+    "patients": _PatientImporter(),
+    "op-bills": _OPBillImporter(),
+    "ip-bills": _IPBillImporter(),
+}
+
+FORMATS = ("csv", "ndjson")
+
+
+def read_ndjson(lines: Iterable[str]) -> Iterator[dict]:
+    for line in lines:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_csv(lines: Iterable[str], kind: str) -> Iterator[dict]:
+    rows = (
+        {name: value for name, value in row.items() if name and value not in ("", None)}
+        for row in csv.DictReader(lines)
+    )
+    if kind == "patients":
+        yield from rows
+        return
+
+    bill = None
+    for row in rows:
+        item = {
+            name[len(ITEM_PREFIX):]: row.pop(name)
+            for name in list(row) if name.startswith(ITEM_PREFIX)
+        }
+        if bill is None or row.get("bill_number") != bill.get("bill_number"):
+            if bill is not None:
+                yield bill
+            bill = {**row, "items": []}
+        if item:
+            bill["items"].append(item)
+    if bill is not None:
+        yield bill
+
+
+def read_records(lines: Iterable[str], kind: str, format: str) -> Iterator[dict]:
+    if format == "ndjson":
+        return read_ndjson(lines)
+    if format == "csv":
+        return read_csv(lines, kind)
+    raise ValueError(f"Unknown format '{format}', expected one of {', '.join(FORMATS)}")
+
+
+def format_of(filename: str) -> str:
+    # .jsonl is the other common name for NDJSON
+    extension = filename.rsplit(".", 1)[-1].lower()
+    return "ndjson" if extension in ("ndjson", "jsonl", "json") else "csv"
+
+
+def _validated(importer: _Importer, chunk, rejections: _Rejections) -> list:
+    valid = []
+    for number, record in chunk:
+        try:
+            valid.append((number, importer.validate(record)))
+        except ValidationError as e:
+            rejections.add(number, _describe(e))
+    return valid
+
+
+def _save_progress(conn, job: str, kind: str, records_done: int, imported: int,
+                   rejected: int, finished: bool = False):
+    now = datetime.utcnow()
+    statement = sqlite_insert(ImportJob).values(
+        job=job, kind=kind, records_done=records_done, imported=imported,
+        rejected=rejected, started_at=now, updated_at=now,
+        finished_at=now if finished else None
+    )
+    conn.execute(statement.on_conflict_do_update(
+        index_elements=[ImportJob.job],
+        set_={
+            "records_done": statement.excluded.records_done,
+            "imported": ImportJob.imported + statement.excluded.imported,
+            "rejected": ImportJob.rejected + statement.excluded.rejected,
+            "updated_at": statement.excluded.updated_at,
+            "finished_at": statement.excluded.finished_at,
+        }
+    ))
+
+
+def import_records(engine, kind: str, records: Iterable[dict], job: str,
+                   batch_size: int = DEFAULT_BATCH_SIZE, created_by: str = "import",
+                   sequences=None) -> dict:
+    """
+    Import records of one kind ("patients", "op-bills", "ip-bills") as job,
+    resuming after the records an earlier run of the job already settled.
+    Returns the counts for this run, the first rejections and rows/sec.
+    Not safe to run the same job twice at the same time.
+    """
+    importer = IMPORTERS.get(kind)
+    if importer is None:
+        raise ValueError(f"Unknown import kind '{kind}', expected one of {', '.join(IMPORTERS)}")
+
+    with engine.connect() as conn:
+        previous = conn.execute(
+            select(ImportJob.kind, ImportJob.records_done).where(ImportJob.job == job)
+        ).first()
+        doctor_ids = set(conn.execute(select(Doctor.id)).scalars())
+    if previous and previous.kind != kind:
+        raise ValueError(f"Job '{job}' is a {previous.kind} import")
+    skipped = previous.records_done if previous else 0
+
+    started = time.perf_counter()
+    numbered = enumerate(islice(records, skipped, None), start=skipped + 1)
+    records_done, imported = skipped, 0
+    rejections = _Rejections()
+    while True:
+        chunk = list(islice(numbered, batch_size))
+        if not chunk:
+            break
+        rejected_before = rejections.count
+        # Validation needs no lock; only the lookups and inserts hold the writer
+        valid = _validated(importer, chunk, rejections)
+        with engine.begin() as conn:
+            # Write lock first: bill ids are allocated from max(id), which a
+            # writer in another process could otherwise take in between
+            conn.exec_driver_sql("BEGIN IMMEDIATE")
+            inserted = importer.insert(conn, valid, doctor_ids, created_by, rejections) if valid else 0
+            records_done = chunk[-1][0]
+            _save_progress(conn, job, kind, records_done, inserted, rejections.count - rejected_before)
+        imported += inserted
+        elapsed = time.perf_counter() - started
+        logger.info(
+            "Import %s: %d records, %d imported, %d rejected, %.0f records/s",
+            job, records_done, imported, rejections.count, (records_done - skipped) / elapsed
+        )
+
+    with engine.begin() as conn:
+        _save_progress(conn, job, kind, records_done, 0, 0, finished=True)
+
+    if imported and sequences is not None:
+        # The imported records kept their own numbers
+        sequences.resync()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "job": job,
+        "kind": kind,
+        "skipped": skipped,
+        "records": records_done - skipped,
+        "imported": imported,
+        "rejected": rejections.count,
+        "errors": rejections.errors,
+        "seconds": round(elapsed, 3),
+        "records_per_sec": round((records_done - skipped) / elapsed, 1) if elapsed else None,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    from database import create_tables, engine, sequences
+
+    parser = argparse.ArgumentParser(prog="python -m app.core.importer")
+    parser.add_argument("kind", choices=list(IMPORTERS))
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the file extension")
+    parser.add_argument("--job", help="resume key, default: <kind>:<file name>")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    create_tables()
+    with open(args.path, encoding="utf-8-sig", newline="") as source:
+        result = import_records(
+            engine, args.kind,
+            read_records(source, args.kind, args.format or format_of(args.path)),
+            job=args.job or f"{args.kind}:{os.path.basename(args.path)}",
+            batch_size=args.batch_size, sequences=sequences
+        )
+
+    for error in result["errors"]:
+        print(f"record {error['record']}: {error['error']}")
+    print(f"{result['imported']} imported, {result['rejected']} rejected, "
+          f"{result['skipped']} skipped as already done, "
+          f"{result['records_per_sec']} records/s")
@@ -0,0 +1,195 @@
+"""
+Backend logging: JSON lines written by a background thread.
+
+setup_logging() routes the root logger (and uvicorn's loggers) through a
+queue: a log call only formats its message and enqueues the record, and a
+QueueListener thread writes it to <data_dir>/logs/backend.log (rotated by
+size) and, unless turned off, the console. When the queue is full records
+are dropped and counted rather than blocking the request.
+
+RequestIdMiddleware gives every HTTP request an id (a client-sent
+X-Request-ID is kept) that is returned in X-Request-ID and added to every
+log line written while the request is handled, from any worker thread.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+from .config import settings
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+CONSOLE_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_request_id: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# LogRecord attributes that aren't extra= fields
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, with the request id and any extra= fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).astimezone().isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES and not name.startswith("_"):
+                entry[name] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the id of the request being handled, if any"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        return True
+
+
+class LogQueueHandler(QueueHandler):
+    """
+    Enqueues records for a QueueListener. Never blocks: with the queue full
+    the record is dropped and counted.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.addFilter(RequestIdFilter())
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the arguments and render the traceback here, where they are
+        # still valid, but leave the JSON/text formatting to the writer thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_queue_handlers = []
+
+
+def dropped_records() -> int:
+    """Records dropped so far because a log queue was full"""
+    return sum(handler.dropped for handler in _queue_handlers)
+
+
+def queued(*handlers: logging.Handler) -> LogQueueHandler:
+    """
+    A handler that hands records to a background thread writing them to
+    handlers; the thread is flushed and stopped at exit.
+    """
+    log_queue = queue.Queue(maxsize=settings.log_queue_size)
+    handler = LogQueueHandler(log_queue)
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    _queue_handlers.append(handler)
+    return handler
+
+
+def rotating_file_handler(path: str, max_bytes: int, backups: int) -> RotatingFileHandler:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    return RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8", delay=True)
+
+
+def setup_logging():
+    """Send the backend's logging (root and uvicorn loggers) through the queue"""
+    root = logging.getLogger()
+    if any(isinstance(handler, LogQueueHandler) for handler in root.handlers):
+        # Already set up (module reloaded)
+        return
+
+    handlers = []
+    try:
+        file_handler = rotating_file_handler(settings.log_file_path, settings.log_file_bytes, settings.log_file_backups)
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+    except OSError:
+        # Read-only or missing data directory: console only
+        pass
+    if settings.log_console or not handlers:
+        console = logging.StreamHandler()
+        console.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+        handlers.append(console)
+
+    root.handlers = [queued(*handlers)]
+    root.setLevel(settings.log_level.upper())
+
+    # uvicorn installs its own console handlers; write its lines through the
+    # queue like everything else
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = []
+        uvicorn_logger.propagate = True
+
+
+class RequestIdMiddleware:
+    """ASGI middleware assigning each HTTP request the id its log lines carry"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        header = REQUEST_ID_HEADER.lower().encode()
+        for name, value in scope.get("headers", ()):
+            if name == header:
+                # Keep a caller's id if it is short and printable
+                candidate = value.decode("latin-1")
+                if 0 < len(candidate) <= 64 and candidate.isprintable():
+                    request_id = candidate
+                break
+        request_id = request_id or uuid.uuid4().hex[:16]
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [
+                    *message.get("headers", []), (header, request_id.encode())
+                ]}
+            await send(message)
+
+        token = _request_id.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _request_id.reset(token)
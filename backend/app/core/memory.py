@@ -0,0 +1,230 @@
+"""
+Python allocation tracking with tracemalloc.
+
+tracemalloc makes every allocation slower, so it is off unless
+settings.memory_tracking is set or an admin turns it on at runtime
+(POST /diagnostics/memory/tracking). While it is on:
+
+- MemoryMiddleware records, per route, the peak traced memory a request
+  reached above what was in use when it started: the ORM objects, encoded
+  dicts and response body it had alive at once.
+- take_snapshot() keeps the last settings.memory_snapshots snapshots, so
+  allocation sites can be listed and two points in time compared (what a
+  report left behind, what grows between two runs).
+
+Peaks include garbage waiting for the cyclic collector, so the same
+request can peak at twice the memory when no collection happened to run
+during it. tracemalloc's peak is process wide: a request that ran
+alongside others is counted in `overlapped`, and its peak includes their
+allocations, so it is an upper bound. Only memory allocated by Python is
+traced; the process's RSS is reported next to it where /proc is available.
+"""
+import os
+import sys
+import tracemalloc
+from collections import OrderedDict
+from datetime import datetime
+from functools import lru_cache
+from itertools import count
+from typing import Dict, List, Optional
+
+from .config import settings
+
+# tracemalloc's own bookkeeping and the import machinery
+_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+class RouteMemory:
+    __slots__ = ("requests", "max_bytes", "total_bytes", "last_bytes", "overlapped")
+
+    def __init__(self):
+        self.requests = 0
+        self.max_bytes = 0
+        self.total_bytes = 0
+        self.last_bytes = 0
+        self.overlapped = 0
+
+
+# Only touched from the event loop thread (MemoryMiddleware), no lock needed
+_routes: Dict[str, RouteMemory] = {}
+_in_flight = 0
+_started = 0
+
+_snapshots: "OrderedDict[int, tuple]" = OrderedDict()
+_snapshot_ids = count(1)
+
+
+def tracking() -> bool:
+    return tracemalloc.is_tracing()
+
+
+def start():
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(max(settings.memory_trace_frames, 1))
+
+
+def stop():
+    """Stop tracking; the route peaks and snapshots taken so far are kept"""
+    tracemalloc.stop()
+
+
+def rss_bytes() -> Optional[int]:
+    """Resident set size of this process, None where /proc isn't available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def usage() -> dict:
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        "tracking": tracking(),
+        "traced_bytes": current,
+        "traced_peak_bytes": peak,
+        "rss_bytes": rss_bytes(),
+    }
+
+
+def route_peaks() -> List[dict]:
+    """Per-route peak memory, largest first"""
+    items = sorted(_routes.items(), key=lambda item: item[1].max_bytes, reverse=True)
+    return [
+        {
+            "route": route,
+            "requests": stats.requests,
+            "max_bytes": stats.max_bytes,
+            "mean_bytes": stats.total_bytes // stats.requests,
+            "last_bytes": stats.last_bytes,
+            "overlapped": stats.overlapped,
+        }
+        for route, stats in items
+    ]
+
+
+@lru_cache(maxsize=4096)
+def _short_path(filename: str) -> str:
+    for root in sorted({os.path.abspath(path) for path in sys.path if path}, key=len, reverse=True):
+        if filename.startswith(root + os.sep):
+            return filename[len(root) + 1:]
+    return filename
+
+
+def _site(traceback: tracemalloc.Traceback, group_by: str) -> str:
+    # Frames run from the oldest call to the allocation; show the allocation first
+    if group_by == "filename":
+        return _short_path(traceback[-1].filename)
+    frames = traceback if group_by == "traceback" else traceback[-1:]
+    return " <- ".join(f"{_short_path(frame.filename)}:{frame.lineno}" for frame in reversed(frames))
+
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(_FILTERS)
+
+
+def top_sites(limit: int = 20, group_by: str = "lineno", snapshot=None) -> List[dict]:
+    """The allocation sites holding the most memory right now (or in snapshot)"""
+    snapshot = snapshot or _snapshot()
+    return [
+        {"site": _site(stat.traceback, group_by), "bytes": stat.size, "blocks": stat.count}
+        for stat in snapshot.statistics(group_by)[:limit]
+    ]
+
+
+def take_snapshot() -> dict:
+    """Take and keep a snapshot; the oldest beyond settings.memory_snapshots are dropped"""
+    snapshot = _snapshot()
+    snapshot_id = next(_snapshot_ids)
+    _snapshots[snapshot_id] = (datetime.now(), snapshot)
+    while len(_snapshots) > max(settings.memory_snapshots, 1):
+        _snapshots.popitem(last=False)
+    return _snapshot_info(snapshot_id)
+
+
+def _snapshot_info(snapshot_id: int) -> dict:
+    taken_at, snapshot = _snapshots[snapshot_id]
+    return {
+        "id": snapshot_id,
+        "taken_at": taken_at.isoformat(timespec="milliseconds"),
+        "traced_bytes": sum(trace.size for trace in snapshot.traces),
+    }
+
+
+def list_snapshots() -> List[dict]:
+    return [_snapshot_info(snapshot_id) for snapshot_id in reversed(_snapshots)]
+
+
+def has_snapshot(snapshot_id: int) -> bool:
+    return snapshot_id in _snapshots
+
+
+def diff(snapshot_id: int, against: Optional[int] = None, limit: int = 20, group_by: str = "lineno") -> dict:
+    """
+    What changed from snapshot_id to against (a newer snapshot, or a fresh
+    one when None), biggest changes first
+    """
+    old = _snapshots[snapshot_id][1]
+    new = _snapshots[against][1] if against is not None else _snapshot()
+    stats = new.compare_to(old, group_by)
+    return {
+        "from": snapshot_id,
+        "to": against,
+        "size_diff_bytes": sum(stat.size_diff for stat in stats),
+        "sites": [
+            {
+                "site": _site(stat.traceback, group_by),
+                "size_diff_bytes": stat.size_diff,
+                "blocks_diff": stat.count_diff,
+                "bytes": stat.size,
+                "blocks": stat.count,
+            }
+            for stat in stats[:limit]
+        ],
+    }
+
+
+class MemoryMiddleware:
+    """ASGI middleware recording each route's peak traced memory while tracking is on"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _in_flight, _started
+        if scope["type"] != "http" or not tracemalloc.is_tracing():
+            await self.app(scope, receive, send)
+            return
+
+        if not _in_flight:
+            tracemalloc.reset_peak()
+        _in_flight += 1
+        _started += 1
+        started = _started
+        overlapped = _in_flight > 1
+        baseline, _ = tracemalloc.get_traced_memory()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _in_flight -= 1
+            route = scope.get("route")
+            # Tracking may have been switched off by this very request;
+            # unmatched paths (404s) aren't recorded, so the table can't grow
+            if tracemalloc.is_tracing() and route is not None:
+                _, peak = tracemalloc.get_traced_memory()
+                key = f"{scope['method']} {route.path}"
+                stats = _routes.get(key)
+                if stats is None:
+                    stats = _routes[key] = RouteMemory()
+                grown = max(peak - baseline, 0)
+                stats.requests += 1
+                stats.max_bytes = max(stats.max_bytes, grown)
+                stats.total_bytes += grown
+                stats.last_bytes = grown
+                if overlapped or _started != started:
+                    stats.overlapped += 1
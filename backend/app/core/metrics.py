@@ -0,0 +1,302 @@
+"""
+In-process metrics, served by GET /metrics in the Prometheus text format.
+
+A small registry of counters, gauges and histograms, enough for one backend
+process: per-route request counts, latency and in-flight requests
+(MetricsMiddleware), connection pool checkout wait (TimedQueuePool), SQLite
+busy/locked errors (instrument) and bills created (the billing routes).
+
+Routes are labelled by their path template (/bills/op/{patient_id}), not the
+URL, so the number of series stays fixed.
+"""
+import bisect
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+from .logs import dropped_records
+
+# Starlette adds the charset
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}")
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            children = list(self._children.items())
+        return [line for key, child in children for line in self._child_samples(key, child)]
+
+    def _child_samples(self, key, child) -> List[str]:
+        return [f"{self.name}{_label_text(self.labelnames, key)} {_format_value(child.value)}"]
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class _Value:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self, lock):
+        self.value = 0.0
+        self._lock = lock
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self.value -= amount
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return _Value(self._lock)
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def _new_child(self):
+        return _Value(self._lock)
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+
+class GaugeFunction(_Metric):
+    """A gauge read at scrape time: callback() returns {label values: value}"""
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 callback: Callable[[], Dict[Tuple[str, ...], float]]):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def _samples(self) -> List[str]:
+        return [
+            f"{self.name}{_label_text(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self.callback().items()
+        ]
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "_lock")
+
+    def __init__(self, buckets, lock):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = lock
+
+    def observe(self, value: float):
+        # First bucket whose upper bound is >= value, or +Inf
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets, self._lock)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _child_samples(self, key, child) -> List[str]:
+        with self._lock:
+            counts, total = list(child.counts), child.sum
+        names = self.labelnames + ("le",)
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_label_text(names, key + (_format_value(bound),))} {cumulative}")
+        labels = _label_text(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = Registry()
+
+REQUESTS = registry.register(Counter(
+    "hms_http_requests_total", "HTTP requests handled, by route and status", ("method", "route", "status")
+))
+REQUEST_SECONDS = registry.register(Histogram(
+    "hms_http_request_duration_seconds", "Time to handle an HTTP request, body included", ("method", "route")
+))
+IN_PROGRESS = registry.register(Gauge(
+    "hms_http_requests_in_progress", "HTTP requests being handled"
+))
+POOL_WAIT_SECONDS = registry.register(Histogram(
+    "hms_db_pool_checkout_wait_seconds", "Time to get a pooled connection, opening it included",
+    ("pool",), buckets=POOL_WAIT_BUCKETS
+))
+POOL_TIMEOUTS = registry.register(Counter(
+    "hms_db_pool_timeouts_total", "Connection checkouts that gave up after the pool timeout", ("pool",)
+))
+SQLITE_BUSY = registry.register(Counter(
+    "hms_sqlite_busy_errors_total",
+    "Statements that failed with SQLITE_BUSY/LOCKED after busy_timeout ran out", ("engine",)
+))
+BILLS_CREATED = registry.register(Counter(
+    "hms_bills_created_total", "Bills created through the API", ("type",)
+))
+
+LOG_RECORDS_DROPPED = registry.register(GaugeFunction(
+    "hms_log_records_dropped", "Log records dropped because the log queue was full", (),
+    lambda: {(): dropped_records()}
+))
+
+_pools: Dict[str, object] = {}
+
+registry.register(GaugeFunction(
+    "hms_db_pool_connections_in_use", "Connections currently checked out", ("pool",),
+    lambda: {(name,): engine.pool.checkedout() for name, engine in _pools.items()}
+))
+
+
+class TimedQueuePool(QueuePool):
+    """
+    QueuePool recording how long each checkout waited for a connection,
+    labelled with the engine's pool_logging_name.
+    """
+
+    def _do_get(self):
+        started = time.perf_counter()
+        name = self._orig_logging_name or "default"
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            POOL_TIMEOUTS.labels(name).inc()
+            raise
+        finally:
+            POOL_WAIT_SECONDS.labels(name).observe(time.perf_counter() - started)
+
+
+def instrument(**engines):
+    """Track pool usage and SQLite busy/locked errors of the named engines"""
+    for name, engine in engines.items():
+        _pools[name] = engine
+        event.listen(engine, "handle_error", _busy_counter(name))
+
+
+def _busy_counter(name: str):
+    def handle_error(context):
+        message = str(context.original_exception).lower()
+        if "database is locked" in message or "database is busy" in message or "database table is locked" in message:
+            SQLITE_BUSY.labels(name).inc()
+    return handle_error
+
+
+class MetricsMiddleware:
+    """ASGI middleware feeding the request count, latency and in-flight metrics"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = "500"
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        IN_PROGRESS.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            IN_PROGRESS.dec()
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            REQUESTS.labels(method, path, status).inc()
+            REQUEST_SECONDS.labels(method, path).observe(elapsed)
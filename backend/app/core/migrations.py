@@ -0,0 +1,331 @@
+"""
+Versioned schema migrations for deployed hms_lite.db files.
+
+Base.metadata.create_all only creates missing tables, so every change to an
+existing table (new column, new index, backfilled data) is listed here as a
+numbered Migration. run_migrations applies the ones a database hasn't seen
+yet, in order, and records them in schema_migrations.
+
+Backfills, and the rollups filled from history, run in rowid batches, each
+in its own short transaction, so the write lock is released between
+batches and the WAL stays small. The last finished batch is checkpointed
+in migration_progress; if the backend is stopped half way, the next start
+resumes from there.
+
+A migration with an optional step that was skipped (see RunSQL) is not
+recorded, so it is tried again at every start until it succeeds.
+"""
+import logging
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy.exc import OperationalError
+
+from ..models.models import Base
+from .config import settings
+from .rollups import DAILY_STATS_SOURCES, PARTICULAR_STATS_SOURCES
+from .search import PATIENT_FTS_SQL, PATIENT_NUMBERS_SQL
+
+logger = logging.getLogger(__name__)
+
+
+class StepSkipped(Exception):
+    """An optional step could not run on this database; retried next start"""
+
+
+class AddColumn:
+    def __init__(self, table: str, column: str, ddl_type: str):
+        self.table = table
+        self.column = column
+        self.ddl_type = ddl_type
+
+    def describe(self) -> str:
+        return f"add column {self.table}.{self.column}"
+
+    def apply(self, engine, progress_key: str):
+        with engine.begin() as conn:
+            existing = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({self.table})")}
+            if self.column not in existing:
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {self.table} ADD COLUMN {self.column} {self.ddl_type}"
+                )
+
+
+def _in_rowid_batches(engine, table: str, progress_key: str, description: str, batch):
+    """
+    Walk table in rowid ranges of settings.migration_batch_size, calling
+    batch(conn, lower, upper) for rows with rowid in (lower, upper] in its
+    own transaction together with the progress checkpoint. batch returns
+    the rows it wrote.
+    """
+    batch_size = settings.migration_batch_size
+
+    with engine.connect() as conn:
+        max_id = conn.exec_driver_sql(f"SELECT max(rowid) FROM {table}").scalar() or 0
+    last_id = _get_progress(engine, progress_key) or 0
+    if last_id:
+        logger.info("%s: resuming after rowid %s of %s", description, last_id, max_id)
+
+    started = time.perf_counter()
+    written = 0
+    while last_id < max_id:
+        upper = min(last_id + batch_size, max_id)
+        with engine.begin() as conn:
+            written += batch(conn, last_id, upper)
+            _set_progress(conn, progress_key, upper)
+        last_id = upper
+
+        elapsed = time.perf_counter() - started
+        logger.info(
+            "%s: %d/%d rowids (%.0f%%), %d rows written, %.0f rows/s",
+            description, last_id, max_id, 100.0 * last_id / max_id,
+            written, written / elapsed if elapsed else 0
+        )
+        if settings.migration_batch_pause:
+            # Let waiting writers take the lock between batches
+            time.sleep(settings.migration_batch_pause)
+
+
+class Backfill:
+    """
+    UPDATE table SET column = expression for every row where column IS NULL,
+    walking the table in rowid batches.
+    """
+    def __init__(self, table: str, column: str, expression: str):
+        self.table = table
+        self.column = column
+        self.expression = expression
+
+    def describe(self) -> str:
+        return f"backfill {self.table}.{self.column}"
+
+    def apply(self, engine, progress_key: str):
+        _in_rowid_batches(engine, self.table, progress_key, self.describe(), self._batch)
+
+    def _batch(self, conn, lower, upper):
+        return conn.exec_driver_sql(
+            f"UPDATE {self.table} SET {self.column} = {self.expression} "
+            f"WHERE rowid > ? AND rowid <= ? AND {self.column} IS NULL",
+            (lower, upper)
+        ).rowcount
+
+
+class Accumulate:
+    """
+    Add the rows of a source table to a rollup with statement, an INSERT ...
+    SELECT ... ON CONFLICT DO UPDATE over source ids in (?, ?] that adds to
+    existing rollup rows. Each batch commits with its checkpoint, so a
+    resumed migration never adds a batch twice.
+    """
+    def __init__(self, table: str, statement: str, description: str):
+        self.table = table
+        self.statement = statement
+        self.description = description
+
+    def describe(self) -> str:
+        return self.description
+
+    def apply(self, engine, progress_key: str):
+        _in_rowid_batches(engine, self.table, progress_key, self.describe(), self._batch)
+
+    def _batch(self, conn, lower, upper):
+        return conn.exec_driver_sql(self.statement, (lower, upper)).rowcount
+
+
+class ClearTable:
+    """
+    Empty a table the following Accumulate steps fill. Runs once per
+    migration: on a resumed run it keeps what they already added.
+    """
+    def __init__(self, table: str):
+        self.table = table
+
+    def describe(self) -> str:
+        return f"clear {self.table}"
+
+    def apply(self, engine, progress_key: str):
+        if _get_progress(engine, progress_key) is not None:
+            return
+        with engine.begin() as conn:
+            conn.exec_driver_sql(f"DELETE FROM {self.table}")
+            _set_progress(conn, progress_key, 0)
+
+
+class CreateIndex:
+    """
+    Create an index declared on the models, by name, if it doesn't exist.
+
+    SQLite builds an index in a single statement; on millions of rows this
+    takes seconds, not minutes, and runs before the backend starts serving.
+    """
+    def __init__(self, index_name: str):
+        self.index_name = index_name
+
+    def describe(self) -> str:
+        return f"create index {self.index_name}"
+
+    def apply(self, engine, progress_key: str):
+        index = _model_index(self.index_name)
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            index.create(conn, checkfirst=True)
+        logger.info("%s: done in %.1fs", self.describe(), time.perf_counter() - started)
+
+
+class RunSQL:
+    """
+    Run statements in one transaction. An optional step that fails (e.g. a
+    virtual table module missing from this SQLite build) is rolled back and
+    logged instead of stopping startup, and its migration is left pending.
+    """
+    def __init__(self, statements: List[str], description: str, optional: bool = False):
+        self.statements = statements
+        self.description = description
+        self.optional = optional
+
+    def describe(self) -> str:
+        return self.description
+
+    def apply(self, engine, progress_key: str):
+        try:
+            with engine.begin() as conn:
+                for statement in self.statements:
+                    conn.exec_driver_sql(statement)
+        except OperationalError as e:
+            if not self.optional:
+                raise
+            raise StepSkipped(str(e.orig)) from e
+
+
+class Migration:
+    def __init__(self, version: int, name: str, steps: list):
+        self.version = version
+        self.name = name
+        self.steps = steps
+
+
+MIGRATIONS = [
+    Migration(1, "business_day_columns", [
+        AddColumn("patients", "registration_day", "DATE"),
+        AddColumn("op_bills", "bill_day", "DATE"),
+        AddColumn("ip_bills", "bill_day", "DATE"),
+        Backfill("patients", "registration_day", "date(registration_date, 'localtime')"),
+        Backfill("op_bills", "bill_day", "date(bill_date, 'localtime')"),
+        Backfill("ip_bills", "bill_day", "date(bill_date, 'localtime')"),
+        CreateIndex("ix_patients_registration_date"),
+        CreateIndex("ix_patients_registration_day"),
+        CreateIndex("ix_op_bills_bill_date"),
+        CreateIndex("ix_op_bills_bill_day"),
+        CreateIndex("ix_op_bills_patient_id"),
+        CreateIndex("ix_ip_bills_bill_date"),
+        CreateIndex("ix_ip_bills_bill_day"),
+        CreateIndex("ix_ip_bills_patient_id"),
+        CreateIndex("ix_op_bill_items_bill_id"),
+        CreateIndex("ix_ip_bill_items_bill_id"),
+    ]),
+    # daily_stats itself comes from create_all; seed it from existing history
+    Migration(2, "daily_stats_rollup", [
+        ClearTable("daily_stats"),
+        *(Accumulate(source, statement, f"add {source} to daily_stats")
+          for source, statement in DAILY_STATS_SOURCES),
+    ]),
+    Migration(3, "particular_daily_stats", [
+        ClearTable("particular_daily_stats"),
+        *(Accumulate(source, statement, f"add {source} to particular_daily_stats")
+          for source, statement in PARTICULAR_STATS_SOURCES),
+    ]),
+    # Without FTS5, patient search keeps using the LIKE scan
+    Migration(4, "patients_fts", [
+        RunSQL(PATIENT_FTS_SQL, "create and populate patients_fts", optional=True),
+    ]),
+    # Needs the FTS5 trigram tokenizer (SQLite 3.34+); lookups fall back to LIKE
+    Migration(5, "patient_numbers", [
+        RunSQL(PATIENT_NUMBERS_SQL, "create and populate patient_numbers", optional=True),
+    ]),
+    # OP items saved through the API were rolled up under doctor 0 instead of
+    # the bill's doctor; refill with the corrected attribution
+    Migration(6, "particular_daily_stats_op_doctor", [
+        ClearTable("particular_daily_stats"),
+        *(Accumulate(source, statement, f"add {source} to particular_daily_stats")
+          for source, statement in PARTICULAR_STATS_SOURCES),
+    ]),
+]
+
+
+def _model_index(name: str):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name == name:
+                return index
+    raise ValueError(f"Index {name} is not declared on any model")
+
+
+def _ensure_bookkeeping_tables(engine):
+    with engine.begin() as conn:
+        conn.exec_driver_sql(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TEXT NOT NULL)"
+        )
+        conn.exec_driver_sql(
+            "CREATE TABLE IF NOT EXISTS migration_progress ("
+            "key TEXT PRIMARY KEY, last_id INTEGER NOT NULL, updated_at TEXT NOT NULL)"
+        )
+
+
+def _get_progress(engine, key: str) -> Optional[int]:
+    with engine.connect() as conn:
+        return conn.exec_driver_sql(
+            "SELECT last_id FROM migration_progress WHERE key = ?", (key,)
+        ).scalar()
+
+
+def _set_progress(conn, key: str, last_id: int):
+    conn.exec_driver_sql(
+        "INSERT INTO migration_progress (key, last_id, updated_at) VALUES (?, ?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET last_id = excluded.last_id, updated_at = excluded.updated_at",
+        (key, last_id, datetime.utcnow().isoformat())
+    )
+
+
+def applied_versions(engine) -> set:
+    _ensure_bookkeeping_tables(engine)
+    with engine.connect() as conn:
+        return {row[0] for row in conn.exec_driver_sql("SELECT version FROM schema_migrations")}
+
+
+def run_migrations(engine, migrations: List[Migration] = MIGRATIONS):
+    """
+    Apply every migration not yet recorded in schema_migrations. Each step is
+    idempotent, so a migration interrupted part way is simply run again.
+    """
+    applied = applied_versions(engine)
+    pending = [m for m in sorted(migrations, key=lambda m: m.version) if m.version not in applied]
+    if not pending:
+        return
+
+    for migration in pending:
+        logger.info("Applying migration %d (%s)", migration.version, migration.name)
+        started = time.perf_counter()
+        try:
+            for number, step in enumerate(migration.steps):
+                logger.info("  %s", step.describe())
+                step.apply(engine, progress_key=f"{migration.version}.{number}")
+        except StepSkipped as e:
+            logger.warning(
+                "Migration %d (%s) skipped, will retry at next start: %s",
+                migration.version, migration.name, e
+            )
+            continue
+
+        with engine.begin() as conn:
+            conn.exec_driver_sql(
+                "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+                (migration.version, migration.name, datetime.utcnow().isoformat())
+            )
+            conn.exec_driver_sql(
+                "DELETE FROM migration_progress WHERE key LIKE ?", (f"{migration.version}.%",)
+            )
+        logger.info(
+            "Migration %d applied in %.1fs", migration.version, time.perf_counter() - started
+        )
@@ -0,0 +1,93 @@
+"""
+Keyset (cursor) pagination for list endpoints.
+
+Pages are ordered newest first on an indexed key ending in the primary key,
+e.g. (bill_date, id), and each page starts strictly after the last row of
+the previous one. Fetching page N is an index seek, not a walk over the
+N * limit rows an OFFSET would skip.
+
+The list body is unchanged; the cursor for the next page travels in the
+X-Next-Cursor response header (absent on the last page) and is passed back
+as ?cursor=. X-Total-Count-Estimate carries the total when it can be had
+cheaply, from the rollup tables.
+"""
+import base64
+import json
+from datetime import date, datetime
+from typing import Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import Date, DateTime, tuple_
+
+from .responses import encoded_response
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+TOTAL_ESTIMATE_HEADER = "X-Total-Count-Estimate"
+
+
+def encode_cursor(values) -> str:
+    values = [value.isoformat() if isinstance(value, (date, datetime)) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError("cursor does not match this list")
+        return [_from_json(column, value) for column, value in zip(columns, values)]
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _from_json(column, value):
+    if value is None:
+        raise ValueError("null key")
+    column_type = column.property.columns[0].type
+    if isinstance(column_type, DateTime):
+        return datetime.fromisoformat(value)
+    if isinstance(column_type, Date):
+        return date.fromisoformat(value)
+    return value
+
+
+def paginate(query, keys: Sequence, cursor: Optional[str], limit: Optional[int],
+             offset: int = 0) -> Tuple[list, Optional[str]]:
+    """
+    Apply descending keyset pagination on keys (model attributes, the last
+    one unique) to an ORM query. With no limit, every row after the cursor
+    is returned. offset only exists for endpoints that still accept skip.
+    Returns (rows, next_cursor).
+    """
+    if cursor:
+        values = decode_cursor(cursor, keys)
+        if len(keys) == 1:
+            query = query.filter(keys[0] < values[0])
+        else:
+            # Row value comparison; SQLite seeks the (key, ..., rowid) index
+            query = query.filter(tuple_(*keys) < tuple_(*values))
+
+    query = query.order_by(*(key.desc() for key in keys))
+    if offset:
+        query = query.offset(offset)
+    if limit is None:
+        return query.all(), None
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([getattr(rows[-1], key.key) for key in keys])
+
+
+def set_page_headers(response, next_cursor: Optional[str], total_estimate: Optional[int] = None):
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    if total_estimate is not None:
+        response.headers[TOTAL_ESTIMATE_HEADER] = str(total_estimate)
+    return response
+
+
+def page_response(rows, next_cursor: Optional[str], total_estimate: Optional[int] = None):
+    return set_page_headers(encoded_response(rows), next_cursor, total_estimate)
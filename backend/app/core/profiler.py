@@ -0,0 +1,245 @@
+"""
+On-demand profiling of single requests.
+
+An admin adds ?__profile=1 (or the X-HMS-Profile: 1 header) to any request;
+ProfilingMiddleware then samples the Python stacks working on that request
+every settings.profile_interval_ms and writes them, in the folded format read
+by flamegraph.pl, speedscope and inferno, to <data_dir>/profiles. The
+profile id comes back in X-HMS-Profile; GET /diagnostics/profiles lists
+them and GET /diagnostics/profiles/{id} downloads one.
+
+Sampling instead of cProfile because the route handlers run in worker
+threads: a sampler thread reads every thread's stack from
+sys._current_frames() and keeps the worker threads whose current job was
+submitted from the profiled request (anyio runs each job in a copy of the
+request's context, which holds the profile). Stacks of the event loop
+thread are kept under an "[event loop]" root (idle waits left out); that
+thread is shared, so they can include other requests' async work.
+"""
+import contextvars
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from functools import lru_cache
+from typing import List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "X-HMS-Profile"
+PROFILE_QUERY_FLAG = "__profile"
+PROFILE_SUFFIX = ".folded"
+
+_current: contextvars.ContextVar[Optional["Sampler"]] = contextvars.ContextVar("profile", default=None)
+
+_PROFILE_ID = re.compile(r"^\d{8}-\d{6}-\d{6}$")
+
+
+@lru_cache(maxsize=8192)
+def _frame_label(code) -> str:
+    # Folded stacks separate frames with ';' and end with ' <count>'
+    filename = code.co_filename
+    for root in sorted({os.path.abspath(path) for path in sys.path if path}, key=len, reverse=True):
+        if filename.startswith(root + os.sep):
+            filename = filename[len(root) + 1:]
+            break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+def _request_context(frame) -> Optional[contextvars.Context]:
+    """The context a worker thread's current job runs in, from anyio's WorkerThread.run"""
+    while frame is not None:
+        if frame.f_code.co_name == "run" and "context" in frame.f_code.co_varnames:
+            context = frame.f_locals.get("context")
+            if isinstance(context, contextvars.Context):
+                return context
+        frame = frame.f_back
+    return None
+
+
+class Sampler:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._loop_thread = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                if thread_id == self._loop_thread:
+                    if frame.f_code.co_name == "select":
+                        continue
+                    root = "[event loop]"
+                else:
+                    context = _request_context(frame)
+                    if context is None or context.get(_current) is not self:
+                        continue
+                    root = "[worker]"
+                self.stacks[self._fold(root, frame)] += 1
+
+    @staticmethod
+    def _fold(root: str, frame) -> str:
+        labels = []
+        while frame is not None:
+            labels.append(_frame_label(frame.f_code))
+            frame = frame.f_back
+        labels.append(root)
+        return ";".join(reversed(labels))
+
+
+def profiles_dir() -> str:
+    return os.path.join(settings.data_dir, "profiles")
+
+
+def new_profile_id() -> str:
+    return f"{datetime.now():%Y%m%d-%H%M%S-%f}"
+
+
+def write_profile(profile_id: str, sampler: Sampler, info: dict) -> str:
+    """
+    Write <id>.folded and its <id>.json details, then prune the oldest
+    beyond settings.profile_keep. Returns the .folded path.
+    """
+    directory = profiles_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, profile_id + PROFILE_SUFFIX)
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in sampler.stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    info = dict(info, id=profile_id, samples=sampler.samples, interval_ms=sampler.interval * 1000)
+    with open(os.path.join(directory, profile_id + ".json"), "w", encoding="utf-8") as f:
+        json.dump(info, f)
+
+    for old in list_profiles()[settings.profile_keep:]:
+        for suffix in (PROFILE_SUFFIX, ".json"):
+            try:
+                os.remove(os.path.join(directory, old["id"] + suffix))
+            except OSError:
+                pass
+    return path
+
+
+def list_profiles() -> List[dict]:
+    """Saved profiles, newest first"""
+    directory = profiles_dir()
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in os.listdir(directory):
+        if not name.endswith(".json") or not _PROFILE_ID.match(name[:-5]):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    profiles.sort(key=lambda profile: profile["id"], reverse=True)
+    return profiles
+
+
+def profile_path(profile_id: str) -> Optional[str]:
+    """Path of a saved profile's folded stacks, None for unknown ids"""
+    if not _PROFILE_ID.match(profile_id):
+        return None
+    path = os.path.join(profiles_dir(), profile_id + PROFILE_SUFFIX)
+    return path if os.path.isfile(path) else None
+
+
+def _wants_profile(scope) -> bool:
+    header = PROFILE_HEADER.lower().encode()
+    for name, value in scope.get("headers", ()):
+        if name == header and value == b"1":
+            return True
+    query = scope.get("query_string", b"").decode("latin-1")
+    return f"{PROFILE_QUERY_FLAG}=1" in query.split("&")
+
+
+def _bearer_token(scope) -> Optional[str]:
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                return token
+    return None
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling the requests that ask for it. is_admin(token)
+    is a blocking check of the bearer token; requests from anyone else are
+    served as usual, unprofiled. The profile id is returned in X-HMS-Profile.
+    """
+
+    def __init__(self, app, is_admin):
+        self.app = app
+        self.is_admin = is_admin
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.profiling_enabled or not _wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        token = _bearer_token(scope)
+        if not token or not await run_in_threadpool(self.is_admin, token):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = new_profile_id()
+        status = 500
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [
+                    *message.get("headers", []), (PROFILE_HEADER.encode(), profile_id.encode())
+                ]}
+            await send(message)
+
+        sampler = Sampler(settings.profile_interval_ms / 1000)
+        context_token = _current.set(sampler)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            sampler.stop()
+            _current.reset(context_token)
+            elapsed = time.perf_counter() - started
+            route = scope.get("route")
+            info = {
+                "created_at": datetime.now().isoformat(timespec="milliseconds"),
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": getattr(route, "path", None),
+                "status": status,
+                "duration_ms": round(elapsed * 1000, 1),
+            }
+            try:
+                path = await run_in_threadpool(write_profile, profile_id, sampler, info)
+                logger.info("Profiled %s %s (%.0fms) into %s", scope["method"], scope["path"], elapsed * 1000, path)
+            except OSError as e:
+                logger.warning("Could not write profile %s: %s", profile_id, e)
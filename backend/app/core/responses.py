@@ -0,0 +1,16 @@
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from .tracing import span
+
+
+def encoded_response(content) -> JSONResponse:
+    """
+    Encode a handler result (ORM objects, dicts, lists) into a JSONResponse.
+
+    FastAPI runs jsonable_encoder on the event loop for routes without a
+    response_model. Calling this from a sync handler does that work in the
+    worker thread instead, so large lists don't stall other requests.
+    """
+    with span("encoded_response", "serialize"):
+        return JSONResponse(content=jsonable_encoder(content))
@@ -0,0 +1,250 @@
+"""
+Incrementally maintained rollup tables.
+
+The write paths call record_daily_stats inside their own transaction, so the
+rollup commits (or rolls back) together with the patient or bill it counts.
+rebuild_rollups recomputes everything from the raw tables in short
+batches; use it after bulk loads that bypass the routers.
+
+    python -m app.core.rollups rebuild
+"""
+import re
+from collections import defaultdict
+
+from sqlalchemy import func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .archive import archive_reads
+from .config import settings
+from ..models import DailyStat, ParticularDailyStat
+
+DAILY_STATS_COUNTERS = (
+    "patients_registered", "op_bills", "ip_bills", "op_revenue", "ip_revenue"
+)
+
+_COUNTER_COLUMNS = ", ".join(DAILY_STATS_COUNTERS)
+_ADD_COUNTERS = ", ".join(f"{name} = {name} + excluded.{name}" for name in DAILY_STATS_COUNTERS)
+
+# Each statement adds the rows of one source table with id in (?, ?] to the
+# rollup, so a rebuild can walk the sources in short batches
+DAILY_STATS_SOURCES = [
+    ("patients", f"""
+    INSERT INTO daily_stats (day, doctor_id, {_COUNTER_COLUMNS})
+    SELECT registration_day, coalesce(doctor_id, 0), count(*), 0, 0, 0, 0
+    FROM patients
+    WHERE id > ? AND id <= ? AND registration_day IS NOT NULL
+    GROUP BY 1, 2
+    ON CONFLICT (day, doctor_id) DO UPDATE SET {_ADD_COUNTERS}
+    """),
+    ("op_bills", f"""
+    INSERT INTO daily_stats (day, doctor_id, {_COUNTER_COLUMNS})
+    SELECT bill_day, coalesce(doctor_id, 0), 0, count(*), 0, coalesce(sum(net_amount), 0), 0
+    FROM op_bills
+    WHERE id > ? AND id <= ? AND bill_day IS NOT NULL
+    GROUP BY 1, 2
+    ON CONFLICT (day, doctor_id) DO UPDATE SET {_ADD_COUNTERS}
+    """),
+    ("ip_bills", f"""
+    INSERT INTO daily_stats (day, doctor_id, {_COUNTER_COLUMNS})
+    SELECT bill_day, coalesce(doctor_id, 0), 0, 0, count(*), 0, coalesce(sum(net_amount), 0)
+    FROM ip_bills
+    WHERE id > ? AND id <= ? AND bill_day IS NOT NULL
+    GROUP BY 1, 2
+    ON CONFLICT (day, doctor_id) DO UPDATE SET {_ADD_COUNTERS}
+    """),
+]
+
+_ADD_ITEMS = "item_count = item_count + excluded.item_count, total = total + excluded.total"
+
+PARTICULAR_STATS_SOURCES = [
+    ("op_bill_items", f"""
+    INSERT INTO particular_daily_stats (particular_id, day, doctor_id, bill_type, item_count, total)
+    SELECT CAST(i.particular AS INTEGER), b.bill_day, coalesce(i.doctor_id, b.doctor_id, 0), 'OP',
+           count(*), coalesce(sum(i.total), 0)
+    FROM op_bill_items i JOIN op_bills b ON b.id = i.bill_id
+    WHERE i.id > ? AND i.id <= ? AND b.bill_day IS NOT NULL
+    GROUP BY 1, 2, 3
+    ON CONFLICT (particular_id, day, doctor_id, bill_type) DO UPDATE SET {_ADD_ITEMS}
+    """),
+    ("ip_bill_items", f"""
+    INSERT INTO particular_daily_stats (particular_id, day, doctor_id, bill_type, item_count, total)
+    SELECT CAST(i.particular AS INTEGER), b.bill_day, coalesce(b.doctor_id, 0), 'IP',
+           count(*), coalesce(sum(i.total), 0)
+    FROM ip_bill_items i JOIN ip_bills b ON b.id = i.bill_id
+    WHERE i.id > ? AND i.id <= ? AND b.bill_day IS NOT NULL
+    GROUP BY 1, 2, 3
+    ON CONFLICT (particular_id, day, doctor_id, bill_type) DO UPDATE SET {_ADD_ITEMS}
+    """),
+]
+
+_LEADING_INTEGER = re.compile(r"\s*([+-]?\d+)")
+
+
+def particular_id(particular) -> int:
+    """
+    Python equivalent of SQLite's CAST(particular AS INTEGER): the leading
+    integer of the text, or 0.
+    """
+    match = _LEADING_INTEGER.match(particular or "")
+    return int(match.group(1)) if match else 0
+
+
+def record_daily_stats(db: Session, day, doctor_id, **counters):
+    """
+    Add counters (patients_registered=1, op_revenue=..., ...) to the rollup row
+    for (day, doctor_id), creating it if needed. Does not commit.
+    """
+    values = {name: counters.get(name, 0) for name in DAILY_STATS_COUNTERS}
+    if not any(values.values()):
+        return
+    stmt = sqlite_insert(DailyStat).values(day=day, doctor_id=doctor_id or 0, **values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DailyStat.day, DailyStat.doctor_id],
+        set_={
+            name: getattr(DailyStat, name) + getattr(stmt.excluded, name)
+            for name in DAILY_STATS_COUNTERS if values[name]
+        }
+    )
+    db.execute(stmt)
+
+
+def record_daily_stats_many(db: Session, counters_by_key):
+    """
+    Add counters to many rollup rows with one executemany: counters_by_key
+    maps (day, doctor_id) to {counter: value}. For bulk writes that cover
+    many days. Does not commit.
+    """
+    rows = [
+        {"day": day, "doctor_id": doctor_id or 0,
+         **{name: counters.get(name, 0) for name in DAILY_STATS_COUNTERS}}
+        for (day, doctor_id), counters in counters_by_key.items()
+    ]
+    if not rows:
+        return
+    stmt = sqlite_insert(DailyStat)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[DailyStat.day, DailyStat.doctor_id],
+        set_={
+            name: getattr(DailyStat, name) + getattr(stmt.excluded, name)
+            for name in DAILY_STATS_COUNTERS
+        }
+    )
+    db.execute(stmt, rows)
+
+
+def record_particular_stats(db: Session, day, bill_type: str, items):
+    """
+    Add bill items, given as (particular, doctor_id, total) tuples, to
+    particular_daily_stats. Does not commit.
+    """
+    record_particular_stats_many(db, bill_type, [(day, *item) for item in items])
+
+
+def record_particular_stats_many(db: Session, bill_type: str, items):
+    """
+    Like record_particular_stats for items of any day, given as (day,
+    particular, doctor_id, total) tuples; one executemany for all of them.
+    """
+    grouped = defaultdict(lambda: [0, 0.0])
+    for day, particular, doctor_id, total in items:
+        key = (particular_id(particular), day, doctor_id or 0)
+        grouped[key][0] += 1
+        grouped[key][1] += total or 0
+    if not grouped:
+        return
+
+    stmt = sqlite_insert(ParticularDailyStat)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[
+            ParticularDailyStat.particular_id, ParticularDailyStat.day,
+            ParticularDailyStat.doctor_id, ParticularDailyStat.bill_type
+        ],
+        set_={
+            "item_count": ParticularDailyStat.item_count + stmt.excluded.item_count,
+            "total": ParticularDailyStat.total + stmt.excluded.total,
+        }
+    )
+    db.execute(stmt, [
+        {"particular_id": particular, "day": day, "doctor_id": doctor_id,
+         "bill_type": bill_type, "item_count": count, "total": total}
+        for (particular, day, doctor_id), (count, total) in grouped.items()
+    ])
+
+
+def daily_stats_total(db: Session, counter: str, start_day=None, end_day=None) -> int:
+    """
+    Sum of one daily_stats counter over an optional day range; a cheap total
+    for list endpoints (X-Total-Count-Estimate).
+    """
+    query = db.query(func.coalesce(func.sum(getattr(DailyStat, counter)), 0))
+    if start_day is not None:
+        query = query.filter(DailyStat.day >= start_day)
+    if end_day is not None:
+        query = query.filter(DailyStat.day <= end_day)
+    return int(query.scalar())
+
+
+def _rebuild(db: Session, table: str, sources):
+    """
+    Empty the rollup and add every source back in batches of
+    settings.rollup_rebuild_batch_size ids, one transaction each, so writers
+    only wait behind one batch. The last id of each source is read in the
+    transaction that empties the rollup: rows saved after it count
+    themselves (record_daily_stats and friends), rows up to it are added by
+    the batches. Totals read during a rebuild are partial.
+    """
+    batch_size = max(settings.rollup_rebuild_batch_size, 1)
+    # Archived years still count; their bills are read from the archive files
+    with archive_reads(db):
+        conn = db.connection()
+        conn.exec_driver_sql(f"DELETE FROM {table}")
+        last_ids = [
+            conn.exec_driver_sql(f"SELECT max(id) FROM {source}").scalar() or 0
+            for source, _ in sources
+        ]
+    db.commit()
+
+    for (source, statement), last_id in zip(sources, last_ids):
+        for lower in range(0, last_id, batch_size):
+            with archive_reads(db):
+                db.connection().exec_driver_sql(statement, (lower, min(lower + batch_size, last_id)))
+            db.commit()
+
+
+def rebuild_daily_stats(db: Session):
+    """
+    Recompute daily_stats from patients, op_bills and ip_bills and commit.
+    """
+    _rebuild(db, "daily_stats", DAILY_STATS_SOURCES)
+    return db.query(DailyStat).count()
+
+
+def rebuild_particular_stats(db: Session):
+    """
+    Recompute particular_daily_stats from the OP/IP bill items and commit.
+    """
+    _rebuild(db, "particular_daily_stats", PARTICULAR_STATS_SOURCES)
+    return db.query(ParticularDailyStat).count()
+
+
+def rebuild_rollups(db: Session):
+    return {
+        "daily_stats": rebuild_daily_stats(db),
+        "particular_daily_stats": rebuild_particular_stats(db),
+    }
+
+
+if __name__ == "__main__":
+    import sys
+    from database import SessionLocal
+
+    if sys.argv[1:] != ["rebuild"]:
+        sys.exit("usage: python -m app.core.rollups rebuild")
+
+    session = SessionLocal()
+    try:
+        for table, rows in rebuild_rollups(session).items():
+            print(f"{table} rebuilt: {rows} rows")
+    finally:
+        session.close()
@@ -0,0 +1,236 @@
+"""
+Full-text patient search backed by an SQLite FTS5 index.
+
+patients_fts is an external-content FTS5 table over the searchable patient
+columns; triggers on patients keep it in sync, so every write path (routers,
+seeders, imports) is covered. Queries are token-prefix matches ranked by
+bm25 within the most recent SEARCH_CANDIDATES matches of the requested
+patient type. If the SQLite build has no FTS5, the migration skips the
+index (and retries at the next start) and the search falls back to the old
+LIKE scan.
+"""
+import re
+from typing import Optional
+
+from sqlalchemy import column, literal_column, or_, table, text
+from sqlalchemy.orm import Session
+
+from ..models import Patient
+
+FTS_COLUMNS = (
+    "name", "complaint", "house", "street", "place", "phone",
+    "referred_by", "room", "op_number", "ip_number",
+)
+
+_columns = ", ".join(FTS_COLUMNS)
+_new_values = ", ".join(f"new.{name}" for name in FTS_COLUMNS)
+_old_values = ", ".join(f"old.{name}" for name in FTS_COLUMNS)
+
+PATIENT_FTS_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS patients_fts USING fts5(
+        {_columns},
+        content='patients', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS patients_fts_insert AFTER INSERT ON patients BEGIN
+        INSERT INTO patients_fts (rowid, {_columns}) VALUES (new.id, {_new_values});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS patients_fts_delete AFTER DELETE ON patients BEGIN
+        INSERT INTO patients_fts (patients_fts, rowid, {_columns})
+        VALUES ('delete', old.id, {_old_values});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS patients_fts_update AFTER UPDATE ON patients BEGIN
+        INSERT INTO patients_fts (patients_fts, rowid, {_columns})
+        VALUES ('delete', old.id, {_old_values});
+        INSERT INTO patients_fts (rowid, {_columns}) VALUES (new.id, {_new_values});
+    END
+    """,
+    "INSERT INTO patients_fts (patients_fts) VALUES ('rebuild')",
+]
+
+# bm25 needs per-row statistics, so ranking every hit of a common word
+# ('kumar', a place name) costs ~100ms at 500k patients. Only the newest
+# matches are ranked; a desk user refines the text rather than paging on.
+SEARCH_CANDIDATES = 500
+
+patients_fts = table("patients_fts", column("rowid"), column("rank"))
+
+NUMBER_COLUMNS = ("phone", "op_number", "ip_number")
+
+# Removed from numbers before indexing and from lookup fragments, so
+# '98470 12345', '+91-98470-12345' and '9847012345' all contain '7012'
+NUMBER_PUNCTUATION = " -+()./"
+
+
+def _normalized_sql(expression: str) -> str:
+    for char in NUMBER_PUNCTUATION:
+        expression = f"replace({expression}, '{char}', '')"
+    return expression
+
+
+def normalize_number(value: str) -> str:
+    for char in NUMBER_PUNCTUATION:
+        value = value.replace(char, "")
+    return value
+
+
+_number_columns = ", ".join(NUMBER_COLUMNS)
+_new_numbers = ", ".join(_normalized_sql(f"new.{name}") for name in NUMBER_COLUMNS)
+_old_numbers = ", ".join(_normalized_sql(f"old.{name}") for name in NUMBER_COLUMNS)
+
+# The triggers index normalized values, so the index can't be refilled with
+# the 'rebuild' command (it would read the raw columns); it is populated
+# with the same expressions instead. Nothing ever reads columns back from it.
+PATIENT_NUMBERS_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS patient_numbers USING fts5(
+        {_number_columns},
+        content='patients', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS patient_numbers_insert AFTER INSERT ON patients BEGIN
+        INSERT INTO patient_numbers (rowid, {_number_columns}) VALUES (new.id, {_new_numbers});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS patient_numbers_delete AFTER DELETE ON patients BEGIN
+        INSERT INTO patient_numbers (patient_numbers, rowid, {_number_columns})
+        VALUES ('delete', old.id, {_old_numbers});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS patient_numbers_update
+    AFTER UPDATE OF {_number_columns} ON patients BEGIN
+        INSERT INTO patient_numbers (patient_numbers, rowid, {_number_columns})
+        VALUES ('delete', old.id, {_old_numbers});
+        INSERT INTO patient_numbers (rowid, {_number_columns}) VALUES (new.id, {_new_numbers});
+    END
+    """,
+    "INSERT INTO patient_numbers (patient_numbers) VALUES ('delete-all')",
+    f"""
+    INSERT INTO patient_numbers (rowid, {_number_columns})
+    SELECT id, {", ".join(_normalized_sql(name) for name in NUMBER_COLUMNS)} FROM patients
+    """,
+]
+
+patient_numbers = table("patient_numbers", column("rowid"))
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def fts_match_expression(searchtext: str) -> str:
+    """
+    Turn free text into an FTS5 query: every word must match the start of a
+    token, e.g. 'ram 98470' -> '"ram"* "98470"*'.
+    """
+    return " ".join(f'"{token}"*' for token in _TOKEN.findall(searchtext))
+
+
+_available_indexes = set()
+
+
+def fts_available(db: Session, name: str = "patients_fts") -> bool:
+    # The indexes only ever appear (at startup migration), so a positive
+    # answer is cached for the life of the process
+    if name not in _available_indexes:
+        found = db.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": name}
+        ).first()
+        if found:
+            _available_indexes.add(name)
+    return name in _available_indexes
+
+
+def search_patients(db: Session, searchtext: str, is_ip: bool, limit: int, offset: int):
+    """
+    Best matches first, paginated. The number column (op_number or
+    ip_number) only takes part in the LIKE fallback for the matching type,
+    as before; FTS matches both.
+    """
+    if not fts_available(db):
+        return _like_search(db, searchtext, is_ip, limit, offset)
+
+    expression = fts_match_expression(searchtext)
+    if not expression:
+        return []
+    match = literal_column("patients_fts").op("MATCH")(expression)
+
+    # Lowest rowid of the newest candidates of this type (0 if there are
+    # fewer); FTS5 applies the rowid bound while walking the index. The type
+    # is filtered here, or OP matches would crowd older IP ones out
+    oldest = db.query(patients_fts.c.rowid).join(
+        Patient, Patient.id == patients_fts.c.rowid
+    ).filter(match, Patient.is_ip == is_ip).order_by(
+        patients_fts.c.rowid.desc()
+    ).offset(max(SEARCH_CANDIDATES, offset + limit) - 1).limit(1).scalar() or 0
+
+    return db.query(Patient).join(
+        patients_fts, patients_fts.c.rowid == Patient.id
+    ).filter(
+        match,
+        patients_fts.c.rowid >= oldest,
+        Patient.is_ip == is_ip
+    ).order_by(
+        patients_fts.c.rank
+    ).offset(offset).limit(limit).all()
+
+
+def _like_search(db: Session, searchtext: str, is_ip: bool, limit: int, offset: int):
+    number = Patient.ip_number if is_ip else Patient.op_number
+    return db.query(Patient).filter(
+        or_(
+            Patient.name.contains(searchtext),
+            Patient.complaint.contains(searchtext),
+            Patient.house.contains(searchtext),
+            Patient.street.contains(searchtext),
+            Patient.place.contains(searchtext),
+            Patient.phone.contains(searchtext),
+            Patient.referred_by.contains(searchtext),
+            Patient.room.contains(searchtext),
+            number.contains(searchtext),
+        ),
+        Patient.is_ip == is_ip
+    ).order_by(Patient.id.desc()).offset(offset).limit(limit).all()
+
+
+def lookup_patients(db: Session, fragment: str, is_ip: Optional[bool], limit: int):
+    """
+    Newest patients whose phone, OP or IP number contains fragment (at least
+    3 characters after normalize_number). FTS5 walks the trigram doclists
+    lazily in rowid order and stops at limit, so the work done depends on the
+    page size rather than on the number of patients.
+    """
+    fragment = normalize_number(fragment)
+    if len(fragment) < 3:
+        return []
+    if not fts_available(db, "patient_numbers"):
+        return _like_lookup(db, fragment, is_ip, limit)
+
+    # One quoted phrase: its trigrams must appear consecutively
+    expression = '"' + fragment.replace('"', '""') + '"'
+    query = db.query(Patient).join(
+        patient_numbers, patient_numbers.c.rowid == Patient.id
+    ).filter(
+        literal_column("patient_numbers").op("MATCH")(expression)
+    )
+    if is_ip is not None:
+        query = query.filter(Patient.is_ip == is_ip)
+    return query.order_by(patient_numbers.c.rowid.desc()).limit(limit).all()
+
+
+def _like_lookup(db: Session, fragment: str, is_ip: Optional[bool], limit: int):
+    query = db.query(Patient).filter(
+        or_(*(getattr(Patient, name).contains(fragment) for name in NUMBER_COLUMNS))
+    )
+    if is_ip is not None:
+        query = query.filter(Patient.is_ip == is_ip)
+    return query.order_by(Patient.id.desc()).limit(limit).all()
@@ -0,0 +1,142 @@
+"""
+Collision-free OP, IP and bill numbers.
+
+Each sequence has a period (day, month or financial year) that is part of
+the number, and a counter per period in the sequences table. The allocator
+reserves blocks of settings.sequence_block_size values in a short
+transaction on its own connection, then hands them out from memory under a
+lock, so most allocations never touch the database and a request's own
+transaction can roll back without returning (or reusing) its number.
+
+The first reservation in a period starts after the highest number already
+stored for it, so databases with older, randomly generated numbers carry on
+without clashing.
+"""
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Optional, Tuple
+
+
+def day_period(when: datetime) -> str:
+    return when.strftime("%Y%m%d")
+
+
+def month_period(when: datetime) -> str:
+    return when.strftime("%Y%m")
+
+
+def financial_year_period(when: datetime) -> str:
+    # April to March, e.g. "2526" for 2025-26
+    start = when.year if when.month >= 4 else when.year - 1
+    return f"{start % 100:02d}{(start + 1) % 100:02d}"
+
+
+class Sequence:
+    def __init__(self, name: str, period: Callable[[datetime], str], template: str,
+                 table: str, column: str):
+        # template is formatted with period and value, e.g. "OP{period}-{value:04d}"
+        self.name = name
+        self.period = period
+        self.template = template
+        self.table = table
+        self.column = column
+
+    def format(self, period: str, value: int) -> str:
+        return self.template.format(period=period, value=value)
+
+    def prefix(self, period: str) -> str:
+        return self.template.split("{value", 1)[0].format(period=period)
+
+
+SEQUENCES = {
+    sequence.name: sequence for sequence in (
+        Sequence("op_number", month_period, "{period}-{value:06d}", "patients", "op_number"),
+        Sequence("ip_number", month_period, "{period}-{value:06d}", "patients", "ip_number"),
+        Sequence("op_bill", day_period, "OP{period}-{value:04d}", "op_bills", "bill_number"),
+        Sequence("ip_bill", day_period, "IP{period}-{value:04d}", "ip_bills", "bill_number"),
+    )
+}
+
+
+class SequenceAllocator:
+    def __init__(self, engine, block_size: int, sequences: Dict[str, Sequence] = SEQUENCES):
+        self.engine = engine
+        self.block_size = max(1, block_size)
+        self.sequences = sequences
+        self._lock = threading.Lock()
+        # name -> (period, next value, end of block (exclusive))
+        self._blocks: Dict[str, Tuple[str, int, int]] = {}
+
+    def next_number(self, name: str, when: Optional[datetime] = None) -> str:
+        """
+        Allocate the next number of a sequence, formatted, e.g.
+        next_number("op_bill") -> "OP20251017-0042". Periods use local time.
+
+        Safe to call from any thread. Call it before the request's session
+        writes anything: a reservation needs the write lock on another
+        connection and would wait behind the caller's own transaction.
+        """
+        sequence = self.sequences[name]
+        period = sequence.period(when or datetime.now())
+
+        with self._lock:
+            block_period, value, end = self._blocks.get(name, (None, 0, 0))
+            if block_period != period or value >= end:
+                value, end = self._reserve(sequence, period)
+            self._blocks[name] = (period, value + 1, end)
+
+        return sequence.format(period, value)
+
+    def resync(self):
+        """
+        Move stored counters past numbers written without the allocator
+        (bulk imports keep their original numbers) and drop the blocks held
+        in memory, so the next allocation reserves from the table again.
+        """
+        with self._lock:
+            self._blocks.clear()
+            with self.engine.begin() as conn:
+                counters = conn.exec_driver_sql(
+                    "SELECT name, period, next_value FROM sequences"
+                ).fetchall()
+                for name, period, next_value in counters:
+                    sequence = self.sequences.get(name)
+                    if sequence is None:
+                        continue
+                    highest = self._highest_existing(conn, sequence, period)
+                    if highest >= next_value:
+                        conn.exec_driver_sql(
+                            "UPDATE sequences SET next_value = ? WHERE name = ? AND period = ?",
+                            (highest + 1, name, period)
+                        )
+
+    def _reserve(self, sequence: Sequence, period: str) -> Tuple[int, int]:
+        with self.engine.begin() as conn:
+            exists = conn.exec_driver_sql(
+                "SELECT 1 FROM sequences WHERE name = ? AND period = ?",
+                (sequence.name, period)
+            ).first()
+            if not exists:
+                conn.exec_driver_sql(
+                    "INSERT INTO sequences (name, period, next_value) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name, period) DO NOTHING",
+                    (sequence.name, period, self._highest_existing(conn, sequence, period) + 1)
+                )
+            conn.exec_driver_sql(
+                "UPDATE sequences SET next_value = next_value + ? WHERE name = ? AND period = ?",
+                (self.block_size, sequence.name, period)
+            )
+            end = conn.exec_driver_sql(
+                "SELECT next_value FROM sequences WHERE name = ? AND period = ?",
+                (sequence.name, period)
+            ).scalar()
+        return end - self.block_size, end
+
+    def _highest_existing(self, conn, sequence: Sequence, period: str) -> int:
+        # Range on the unique column's index instead of LIKE 'prefix%'
+        prefix = sequence.prefix(period)
+        return conn.exec_driver_sql(
+            f"SELECT max(CAST(substr({sequence.column}, ?) AS INTEGER)) FROM {sequence.table} "
+            f"WHERE {sequence.column} >= ? AND {sequence.column} < ?",
+            (len(prefix) + 1, prefix, prefix + "\uffff")
+        ).scalar() or 0
@@ -0,0 +1,188 @@
+"""
+Slow-query log and per-statement timings.
+
+Cursor events time every statement on the instrumented engines. Each
+statement shape (see dbstats.statement_shape) keeps its count, total and
+worst time since startup; GET /diagnostics/slow-queries lists the slowest.
+
+Statements taking settings.slow_query_ms or longer are logged to a rotating
+file, one JSON object per line, with their bound parameters, the route and
+request id that ran them and SQLite's EXPLAIN QUERY PLAN. The file is
+sampled: a shape is written at most once per settings.slow_query_log_interval
+seconds, so a slow report polled by every desk doesn't flood it, and the
+EXPLAIN (run on the same connection, right after the statement) is only paid
+for those. The file itself is written by a log queue thread (see logs.py).
+
+Times are cursor.execute() times. SQLite runs a statement up to its first
+row there, which covers sorting, grouping and aggregation, but stepping
+through the remaining rows happens while they are fetched and isn't counted.
+"""
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import event
+
+from .config import settings
+from .dbstats import current_stats, statement_shape
+from .logs import current_request_id, queued, rotating_file_handler
+
+logger = logging.getLogger(__name__)
+
+# Written to the slow-query file only, never to the console
+slow_log = logging.getLogger(f"{__name__}.file")
+slow_log.propagate = False
+
+# Statements EXPLAIN QUERY PLAN has something to say about
+_PLANNED = ("SELECT", "WITH", "INSERT", "REPLACE", "UPDATE", "DELETE")
+
+# Shapes tracked at most; statements built with literals can't grow it forever
+MAX_SHAPES = 2000
+MAX_PARAMETER_LENGTH = 200
+
+
+class ShapeTiming:
+    __slots__ = ("count", "seconds", "max_seconds", "slow", "route", "logged_at")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.slow = 0
+        self.route = ""
+        self.logged_at = 0.0
+
+
+_lock = threading.Lock()
+_shapes: Dict[str, ShapeTiming] = {}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Per execution: a statement that raises never gets its after event
+    if context is not None:
+        context.hms_slow_query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "hms_slow_query_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    shape = statement_shape(statement)
+    slow = bool(settings.slow_query_ms) and elapsed * 1000 >= settings.slow_query_ms
+    stats = current_stats()
+    route = stats.route if stats else ""
+
+    with _lock:
+        timing = _shapes.get(shape)
+        if timing is None and len(_shapes) < MAX_SHAPES:
+            timing = _shapes[shape] = ShapeTiming()
+        write = slow
+        if timing is not None:
+            timing.count += 1
+            timing.seconds += elapsed
+            timing.max_seconds = max(timing.max_seconds, elapsed)
+            if slow:
+                timing.slow += 1
+                timing.route = route
+                now = time.monotonic()
+                write = not timing.logged_at or now - timing.logged_at >= settings.slow_query_log_interval
+                if write:
+                    timing.logged_at = now
+
+    if write and slow_log.handlers:
+        _write(cursor, statement, parameters, executemany, elapsed, route)
+
+
+def _printable(parameters):
+    if isinstance(parameters, dict):
+        return {name: _printable(value) for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [_printable(value) for value in parameters]
+    if isinstance(parameters, (int, float, bool)) or parameters is None:
+        return parameters
+    if isinstance(parameters, bytes):
+        return f"<{len(parameters)} bytes>"
+    return str(parameters)[:MAX_PARAMETER_LENGTH]
+
+
+def query_plan(dbapi_connection, statement: str, parameters) -> List[str]:
+    """EXPLAIN QUERY PLAN as indented lines, like the sqlite3 shell's .eqp"""
+    rows = dbapi_connection.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ()).fetchall()
+    depth = {0: -1}
+    lines = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node] + detail)
+    return lines
+
+
+def _write(cursor, statement, parameters, executemany, elapsed, route):
+    # executemany: one row of parameters stands for the batch
+    first = parameters[0] if executemany and parameters else parameters
+    if statement.lstrip().upper().startswith(_PLANNED):
+        try:
+            plan = query_plan(cursor.connection, statement, first)
+        except Exception as e:
+            plan = [f"EXPLAIN failed: {e}"]
+    else:
+        plan = []
+
+    entry = {
+        "time": datetime.now().isoformat(timespec="milliseconds"),
+        "ms": round(elapsed * 1000, 2),
+        "route": route or None,
+        "request_id": current_request_id(),
+        "statement": statement,
+        "plan": plan,
+    }
+    if settings.slow_query_log_parameters:
+        entry["parameters"] = _printable(first)
+        if executemany:
+            entry["rows"] = len(parameters)
+    slow_log.warning(json.dumps(entry))
+
+
+def slowest(limit: int = 20, order_by: str = "max") -> List[dict]:
+    """The statement shapes with the highest max, total or mean time"""
+    keys = {
+        "max": lambda item: item[1].max_seconds,
+        "total": lambda item: item[1].seconds,
+        "mean": lambda item: item[1].seconds / item[1].count,
+    }
+    with _lock:
+        items = [(shape, timing) for shape, timing in _shapes.items() if timing.count]
+        items.sort(key=keys[order_by], reverse=True)
+        return [
+            {
+                "statement": shape,
+                "count": timing.count,
+                "total_ms": round(timing.seconds * 1000, 2),
+                "mean_ms": round(timing.seconds * 1000 / timing.count, 3),
+                "max_ms": round(timing.max_seconds * 1000, 2),
+                "slow": timing.slow,
+                "last_slow_route": timing.route or None,
+            }
+            for shape, timing in items[:limit]
+        ]
+
+
+def _open_log(path: str):
+    handler = rotating_file_handler(path, settings.slow_query_log_bytes, settings.slow_query_log_backups)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    slow_log.addHandler(queued(handler))
+
+
+def instrument(*engines):
+    """Time statements on these engines and log the slow ones"""
+    if settings.slow_query_ms and not slow_log.handlers:
+        try:
+            _open_log(settings.slow_query_log_path)
+        except OSError as e:
+            logger.warning("Slow-query log disabled, cannot open %s: %s", settings.slow_query_log_path, e)
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
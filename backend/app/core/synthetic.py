@@ -0,0 +1,495 @@
+"""
+Deterministic synthetic hospital data at benchmark scale.
+
+generate() fills an empty database with years of OP/IP activity ending
+on end_date, DEFAULT_END_DATE unless given. Volumes follow a desk's week (Monday rush, quiet Sunday), the
+monsoon fever season, year-on-year growth and a couple of outbreak weeks
+per year. Doctors get Zipf-like popularity and a weekly day off, and most
+OP bills are for newly registered or recently seen patients. Numbers use
+the live formats (202510-000123, OP20251017-0042), so the sequence
+allocator carries on after them.
+
+The same seed and end date give the same rows, whatever the day it runs
+and the number of workers. The
+timeline is cut into blocks of days; every id and number a block uses is
+fixed up front from per-day counts, and each block draws from its own
+seeded random generator. Blocks are generated in worker processes and
+written in order by this process, the only writer, with executemany and
+one transaction per block.
+
+    python -m app.core.synthetic --patients 1000000 --bills 5000000 --workers 4
+"""
+import logging
+import math
+import random
+import time
+from datetime import date, datetime, timedelta, timezone
+from itertools import accumulate
+from multiprocessing import Pool
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from .rollups import rebuild_rollups
+from .search import PATIENT_FTS_SQL, PATIENT_NUMBERS_SQL
+
+logger = logging.getLogger(__name__)
+
+BLOCK_DAYS = 7
+# A fixed end keeps weekdays, months and financial years where they were
+# for a given seed; the last day of the 2024-25 financial year
+DEFAULT_END_DATE = date(2025, 3, 31)
+IP_SHARE = 0.1
+CREATED_BY = "Synthetic"
+
+# Monday .. Sunday
+WEEKDAY_FACTORS = (1.35, 1.15, 1.05, 1.0, 1.05, 0.9, 0.35)
+# Monsoon fevers from June, a dip over the year-end holidays
+MONTH_FACTORS = (0.95, 0.95, 1.0, 0.95, 1.0, 1.15, 1.35, 1.4, 1.25, 1.05, 1.0, 0.85)
+ANNUAL_GROWTH = 0.08
+OUTBREAKS_PER_YEAR = 2
+# OP desk hours, busiest mid-morning with a smaller evening session
+HOUR_WEIGHTS = {8: 6, 9: 12, 10: 14, 11: 13, 12: 9, 13: 4, 14: 3, 15: 4, 16: 7, 17: 8, 18: 6, 19: 3, 20: 1}
+# Share of OP bills for a patient registered that day; the rest are revisits
+# within REVISIT_DAYS
+NEW_PATIENT_SHARE = 0.55
+REVISIT_DAYS = 120
+
+FIRST_NAMES = (
+    "Abdul", "Ajay", "Akhil", "Aleena", "Amal", "Anand", "Anil", "Anitha", "Anju", "Anu",
+    "Arjun", "Babu", "Beena", "Biju", "Bindu", "Deepa", "Devi", "Divya", "Fathima", "Gopal",
+    "Hari", "Jaya", "Jose", "Kavitha", "Krishnan", "Lakshmi", "Latha", "Manoj", "Mary", "Meera",
+    "Mohan", "Nisha", "Pradeep", "Priya", "Radha", "Rahul", "Rajesh", "Ramesh", "Sanjay", "Suresh",
+)
+LAST_NAMES = (
+    "Abraham", "Antony", "Chacko", "Cherian", "Das", "George", "Jacob", "John", "Joseph", "Kumar",
+    "Kurian", "Mathew", "Menon", "Nair", "Panicker", "Paul", "Philip", "Pillai", "Thomas", "Varghese",
+)
+PLACES = (
+    "Adoor", "Alappuzha", "Aluva", "Chengannur", "Cherthala", "Kayamkulam", "Kottayam", "Kollam",
+    "Mavelikara", "Pala", "Pandalam", "Pathanamthitta", "Ranni", "Thiruvalla", "Thrissur", "Vaikom",
+)
+COMPLAINTS = ("Fever", "Cough", "Headache", "Body pain", "Back pain", "Check-up", "Diabetes review",
+              "BP review", "Skin rash", "Injury")
+SPECIALTIES = ("General Medicine", "Cardiology", "Pediatrics", "Orthopedics", "Dermatology",
+               "Neurology", "ENT", "Ophthalmology", "Gynecology", "Dentistry")
+ROOMS = ("Ward 1", "Ward 2", "Ward 3", "ICU", "Deluxe")
+
+# name, OP rate, IP amount; items reference particulars by id, as the UI does
+PARTICULARS = (
+    ("Consultation", None, 500), ("Review", 150, 300), ("Procedure", 800, 2500),
+    ("Medicine", 250, 1200), ("Test", 350, 900), ("X-Ray", 400, 600), ("ECG", 300, 400),
+    ("Ultrasound", 900, 1100), ("Injection", 100, 200), ("Dressing", 120, 250),
+    ("Room Charges", None, 1500), ("Professional Fee", None, 2000),
+)
+
+PATIENT_COLUMNS = (
+    "id", "op_number", "ip_number", "registration_date", "registration_day", "name", "age",
+    "gender", "complaint", "house", "street", "place", "phone", "doctor_id", "referred_by",
+    "room", "is_ip", "created_by", "created_at",
+)
+OP_BILL_COLUMNS = (
+    "id", "bill_number", "bill_date", "bill_day", "patient_id", "bill_type", "category",
+    "doctor_id", "discount_type", "total_amount", "discount_amount", "net_amount",
+    "created_by", "created_at",
+)
+OP_ITEM_COLUMNS = (
+    "bill_id", "particular", "doctor", "department", "unit", "rate", "amount",
+    "discount_percent", "discount_amount", "total", "created_at",
+)
+IP_BILL_COLUMNS = (
+    "id", "bill_number", "bill_date", "bill_day", "patient_id", "is_credit", "is_insurance",
+    "category", "doctor_id", "discount_type", "room", "admission_date", "insurance_company",
+    "third_party", "total_amount", "service_tax", "education_cess", "she_education_cess",
+    "net_amount", "created_by", "created_at",
+)
+IP_ITEM_COLUMNS = (
+    "bill_id", "particular", "department", "amount", "discount_percent", "discount_amount",
+    "total", "created_at",
+)
+
+
+def _insert_sql(table: str, columns) -> str:
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+
+def _timestamp(value: datetime) -> str:
+    # SQLAlchemy's SQLite DateTime storage format
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def _allocate(total: int, weights: List[float]) -> List[int]:
+    """Split total into integer counts proportional to weights (largest remainder)."""
+    scale = total / sum(weights)
+    shares = [weight * scale for weight in weights]
+    counts = [int(share) for share in shares]
+    by_remainder = sorted(range(len(shares)), key=lambda i: counts[i] - shares[i])
+    for i in by_remainder[:total - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+
+def _day_weights(days: List[date], rng: random.Random) -> List[float]:
+    outbreaks = {}
+    for year in sorted({day.year for day in days}):
+        for _ in range(OUTBREAKS_PER_YEAR):
+            start = date(year, 1, 1) + timedelta(days=rng.randrange(365))
+            length, peak = rng.randint(7, 21), rng.uniform(1.5, 2.2)
+            for offset in range(length):
+                # Rises and falls over the outbreak
+                boost = 1 + (peak - 1) * math.sin(math.pi * (offset + 0.5) / length)
+                day = start + timedelta(days=offset)
+                outbreaks[day] = max(outbreaks.get(day, 1), boost)
+
+    first = days[0]
+    return [
+        WEEKDAY_FACTORS[day.weekday()]
+        * MONTH_FACTORS[day.month - 1]
+        * (1 + ANNUAL_GROWTH) ** ((day - first).days / 365)
+        * outbreaks.get(day, 1)
+        * rng.uniform(0.9, 1.1)
+        for day in days
+    ]
+
+
+def _period_offsets(days: List[date], counts: List[int], period) -> List[int]:
+    # Numbers already used in each day's period (month or day) by earlier days
+    offsets, used, current = [], 0, None
+    for day, count in zip(days, counts):
+        if period(day) != current:
+            current, used = period(day), 0
+        offsets.append(used)
+        used += count
+    return offsets
+
+
+def _starts(counts: List[int]) -> List[int]:
+    # First id of each day, ids starting at 1
+    return [total - count + 1 for total, count in zip(accumulate(counts), counts)]
+
+
+class _Plan:
+    """Everything a block needs besides its own random draws; sent to each worker once."""
+    def __init__(self, seed: int, days: List[date], patients: List[int], ip_patients: List[int],
+                 op_bills: List[int], ip_bills: List[int], doctors: list, particulars: dict):
+        self.seed = seed
+        self.days = days
+        # Local midnight in UTC; stored timestamps are naive UTC
+        self.day_starts = [
+            datetime.combine(day, datetime.min.time()).astimezone(timezone.utc).replace(tzinfo=None)
+            for day in days
+        ]
+        self.patients = patients
+        self.ip_patients = ip_patients
+        self.patient_starts = _starts(patients)
+        self.patient_offsets = _period_offsets(days, patients, lambda day: (day.year, day.month))
+        self.ip_offsets = _period_offsets(days, ip_patients, lambda day: (day.year, day.month))
+        self.op_bills = op_bills
+        self.op_bill_starts = _starts(op_bills)
+        self.ip_bills = ip_bills
+        self.ip_bill_starts = _starts(ip_bills)
+        # (id, booking code, department, consultation fee)
+        self.doctors = doctors
+        popularity = [1 / (rank + 1) ** 0.8 for rank in range(len(doctors))]
+        # Each doctor has one day off a week
+        self.doctor_weights = [
+            [weight if index % 7 != weekday else 0 for index, weight in enumerate(popularity)]
+            for weekday in range(7)
+        ]
+        self.particulars = particulars
+
+
+_plan: Optional[_Plan] = None
+
+
+def _init_worker(plan: _Plan):
+    global _plan
+    _plan = plan
+
+
+def _times(rng: random.Random, start: datetime, count: int) -> List[datetime]:
+    hours = rng.choices(list(HOUR_WEIGHTS), weights=list(HOUR_WEIGHTS.values()), k=count)
+    return sorted(start + timedelta(hours=hour, seconds=rng.randrange(3600)) for hour in hours)
+
+
+def _generate_block(block) -> dict:
+    index, first_day, end_day = block
+    plan = _plan
+    rng = random.Random(f"{plan.seed}:{index}")
+    rows = {"patients": [], "op_bills": [], "op_bill_items": [], "ip_bills": [], "ip_bill_items": []}
+    particulars = plan.particulars
+
+    for d in range(first_day, end_day):
+        day = plan.days[d]
+        day_text = day.isoformat()
+        weekday = day.weekday()
+        doctor_weights = plan.doctor_weights[weekday]
+        month = f"{day:%Y%m}"
+        first_patient = plan.patient_starts[d]
+        last_patient = first_patient + plan.patients[d] - 1
+        revisit_from = plan.patient_starts[max(0, d - REVISIT_DAYS)]
+
+        ip_positions = set(rng.sample(range(plan.patients[d]), plan.ip_patients[d]))
+        ip_number = plan.ip_offsets[d]
+        for position, registered in enumerate(_times(rng, plan.day_starts[d], plan.patients[d])):
+            doctor = rng.choices(plan.doctors, weights=doctor_weights)[0]
+            is_ip = position in ip_positions
+            if is_ip:
+                ip_number += 1
+            stamp = _timestamp(registered)
+            rows["patients"].append((
+                first_patient + position,
+                f"{month}-{plan.patient_offsets[d] + position + 1:06d}",
+                f"{month}-{ip_number:06d}" if is_ip else None,
+                stamp, day_text,
+                f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                str(rng.randint(1, 90)), rng.choice(("Male", "Female")), rng.choice(COMPLAINTS),
+                f"House {rng.randint(1, 999)}", "Main Road", rng.choice(PLACES),
+                f"9{rng.randrange(10 ** 9):09d}", doctor[0], None,
+                rng.choice(ROOMS) if is_ip else None, is_ip, CREATED_BY, stamp,
+            ))
+
+        op_day = f"OP{day:%Y%m%d}"
+        for position, billed in enumerate(_times(rng, plan.day_starts[d], plan.op_bills[d])):
+            if last_patient >= first_patient and rng.random() < NEW_PATIENT_SHARE:
+                patient_id = rng.randint(first_patient, last_patient)
+            else:
+                patient_id = rng.randint(min(revisit_from, max(last_patient, 1)), max(last_patient, 1))
+            doctor_id, booking_code, department, fee = rng.choices(plan.doctors, weights=doctor_weights)[0]
+            bill_id = plan.op_bill_starts[d] + position
+            stamp = _timestamp(billed)
+
+            lines = [(particulars["Consultation"][0], 1, fee)]
+            for _ in range(rng.choices((0, 1, 2, 3), weights=(45, 30, 17, 8))[0]):
+                name = rng.choice(("Review", "Procedure", "Medicine", "Test", "X-Ray", "ECG",
+                                   "Ultrasound", "Injection", "Dressing"))
+                lines.append((particulars[name][0], rng.choice((1, 1, 1, 2, 3)), particulars[name][1]))
+            discount_percent = rng.choices((0, 5, 10), weights=(85, 10, 5))[0]
+
+            total_amount = discount_amount = 0
+            for particular_id, unit, rate in lines:
+                amount = unit * rate
+                discount_amt = amount * (discount_percent / 100)
+                total_amount += amount
+                discount_amount += discount_amt
+                rows["op_bill_items"].append((
+                    bill_id, str(particular_id), booking_code, department, unit, rate, amount,
+                    discount_percent, discount_amt, amount - discount_amt, stamp,
+                ))
+            rows["op_bills"].append((
+                bill_id, f"{op_day}-{position + 1:04d}", stamp, day_text, patient_id, "OP",
+                "Consultation", doctor_id, "Percent", total_amount, discount_amount,
+                total_amount - discount_amount, CREATED_BY, stamp,
+            ))
+
+        ip_day = f"IP{day:%Y%m%d}"
+        for position, billed in enumerate(_times(rng, plan.day_starts[d], plan.ip_bills[d])):
+            # Discharge bill for an admission some days back
+            stay = rng.choices((1, 2, 3, 4, 5, 7, 10, 14), weights=(20, 22, 18, 12, 10, 8, 6, 4))[0]
+            admitted = max(0, d - stay)
+            admitted_to = plan.patient_starts[admitted] + plan.patients[admitted] - 1
+            patient_id = rng.randint(min(plan.patient_starts[admitted], max(admitted_to, 1)), max(admitted_to, 1))
+            doctor_id, _, department, fee = rng.choices(plan.doctors, weights=doctor_weights)[0]
+            bill_id = plan.ip_bill_starts[d] + position
+            stamp = _timestamp(billed)
+            insured = rng.random() < 0.25
+
+            lines = [("Room Charges", particulars["Room Charges"][2] * stay),
+                     ("Professional Fee", particulars["Professional Fee"][2]),
+                     ("Consultation", fee)]
+            for _ in range(rng.randint(1, 4)):
+                name = rng.choice(("Procedure", "Medicine", "Test", "X-Ray", "ECG", "Ultrasound",
+                                   "Injection", "Dressing"))
+                lines.append((name, particulars[name][2] * rng.randint(1, 3)))
+            discount_percent = rng.choices((0, 5, 10), weights=(80, 12, 8))[0]
+
+            total_amount = discount_amount = 0
+            for name, amount in lines:
+                discount_amt = amount * (discount_percent / 100)
+                total_amount += amount
+                discount_amount += discount_amt
+                rows["ip_bill_items"].append((
+                    bill_id, str(particulars[name][0]), department, amount, discount_percent,
+                    discount_amt, amount - discount_amt, stamp,
+                ))
+            rows["ip_bills"].append((
+                bill_id, f"{ip_day}-{position + 1:04d}", stamp, day_text, patient_id, False, insured,
+                "IP", doctor_id, "Percent", rng.choice(ROOMS), plan.days[admitted].isoformat(),
+                "Star Health" if insured else None, None, total_amount, 0, 0, 0,
+                total_amount - discount_amount, CREATED_BY, stamp,
+            ))
+
+    return rows
+
+
+INSERTS = {
+    "patients": _insert_sql("patients", PATIENT_COLUMNS),
+    "op_bills": _insert_sql("op_bills", OP_BILL_COLUMNS),
+    "op_bill_items": _insert_sql("op_bill_items", OP_ITEM_COLUMNS),
+    "ip_bills": _insert_sql("ip_bills", IP_BILL_COLUMNS),
+    "ip_bill_items": _insert_sql("ip_bill_items", IP_ITEM_COLUMNS),
+}
+
+# Insert triggers that keep the search indexes current; dropped while
+# loading and recreated (with a full rebuild of both indexes) afterwards
+SEARCH_TRIGGERS = ("patients_fts_insert", "patient_numbers_insert")
+
+
+def _masters(conn, doctors: int, created_at: str) -> tuple:
+    """Synthetic doctors and the particulars, created if missing."""
+    rng = random.Random(f"doctors:{doctors}")
+    existing = {code for (code,) in conn.exec_driver_sql("SELECT code FROM doctors")}
+    new_doctors = []
+    for i in range(1, doctors + 1):
+        code = f"SYN-{i:03d}"
+        if code in existing:
+            continue
+        specialty = SPECIALTIES[(i - 1) % len(SPECIALTIES)]
+        fee = rng.choice((300, 400, 500, 600, 800))
+        new_doctors.append((
+            code, f"Dr {rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}", rng.choice(PLACES),
+            "MBBS, MD", f"9{rng.randrange(10 ** 9):09d}", f"syn{i:03d}@example.com", specialty,
+            specialty, 30, f"S{i:03d}", 50, fee * 0.8, fee * 0.2, fee * 0.4, fee * 0.1, "09:00", "17:00",
+            False, False, created_at,
+        ))
+    if new_doctors:
+        conn.exec_driver_sql(
+            "INSERT INTO doctors (code, name, address, qualification, phone, email, specialty, department, "
+            "op_validity, booking_code, max_tokens, doctor_amount, hospital_amount, doctor_revisit, "
+            "hospital_revisit, from_time, to_time, is_resigned, is_discontinued, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            new_doctors
+        )
+    doctor_rows = [
+        (doctor_id, booking_code, department, doctor_amount + hospital_amount)
+        for doctor_id, booking_code, department, doctor_amount, hospital_amount in conn.exec_driver_sql(
+            "SELECT id, booking_code, department, doctor_amount, hospital_amount FROM doctors "
+            "WHERE code LIKE 'SYN-%' ORDER BY code LIMIT ?", (doctors,)
+        )
+    ]
+
+    existing = dict(conn.exec_driver_sql("SELECT name, id FROM particulars").fetchall())
+    for order, (name, _, _) in enumerate(PARTICULARS):
+        if name not in existing:
+            existing[name] = conn.exec_driver_sql(
+                "INSERT INTO particulars (name, opdefault, ipdefault, sortorder, created_at) VALUES (?, ?, ?, ?, ?)",
+                (name, name == "Consultation", name == "Room Charges", order, created_at)
+            ).lastrowid
+    particulars = {name: (existing[name], op_rate, ip_amount) for name, op_rate, ip_amount in PARTICULARS}
+    return doctor_rows, particulars
+
+
+def generate(engine, patients: int, bills: int, years: float = 5, doctors: int = 25,
+             seed: int = 42, workers: int = 1, ip_share: float = IP_SHARE,
+             sequences=None, end_date: date = DEFAULT_END_DATE) -> dict:
+    """
+    Fill an empty database with `patients` patients and `bills` OP/IP bills
+    (ip_share of them IP) spread over the `years` up to end_date. Returns
+    the row counts and timings. Refuses to run if there are patients or
+    bills.
+    """
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        for table in ("patients", "op_bills", "ip_bills"):
+            if conn.exec_driver_sql(f"SELECT 1 FROM {table} LIMIT 1").first():
+                raise ValueError(f"{table} is not empty; synthetic data needs an empty database")
+
+    days = [end_date - timedelta(days=offset) for offset in range(max(1, round(years * 365)) - 1, -1, -1)]
+    rng = random.Random(seed)
+    weights = _day_weights(days, rng)
+    ip_bill_total = round(bills * ip_share)
+    patient_counts = _allocate(patients, weights)
+    op_bill_counts = _allocate(bills - ip_bill_total, weights)
+    ip_bill_counts = _allocate(ip_bill_total, weights)
+    ip_patient_counts = [min(count, ip) for count, ip in zip(patient_counts, ip_bill_counts)]
+
+    with engine.begin() as conn:
+        # Dated at the start of the timeline, like everything else generated
+        doctor_rows, particulars = _masters(conn, doctors, _timestamp(datetime.combine(days[0], datetime.min.time())))
+        search_triggers = [
+            name for (name,) in conn.exec_driver_sql(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name IN (?, ?)", SEARCH_TRIGGERS
+            )
+        ]
+        for name in search_triggers:
+            conn.exec_driver_sql(f"DROP TRIGGER {name}")
+
+    plan = _Plan(seed, days, patient_counts, ip_patient_counts, op_bill_counts, ip_bill_counts,
+                 doctor_rows, particulars)
+    blocks = [(index, first, min(first + BLOCK_DAYS, len(days)))
+              for index, first in enumerate(range(0, len(days), BLOCK_DAYS))]
+
+    written = dict.fromkeys(INSERTS, 0)
+    pool = Pool(workers, initializer=_init_worker, initargs=(plan,)) if workers > 1 else None
+    try:
+        if pool is None:
+            _init_worker(plan)
+            generated = map(_generate_block, blocks)
+        else:
+            generated = pool.imap(_generate_block, blocks)
+        for number, rows in enumerate(generated, start=1):
+            with engine.begin() as conn:
+                for table, sql in INSERTS.items():
+                    if rows[table]:
+                        conn.exec_driver_sql(sql, rows[table])
+                        written[table] += len(rows[table])
+            if number % 10 == 0 or number == len(blocks):
+                elapsed = time.perf_counter() - started
+                logger.info("Synthetic data: %d/%d blocks, %d bills, %.0f bills/s",
+                            number, len(blocks), written["op_bills"] + written["ip_bills"],
+                            (written["op_bills"] + written["ip_bills"]) / elapsed)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if search_triggers:
+            # Recreates the triggers and rebuilds both indexes in one pass
+            with engine.begin() as conn:
+                for statement in PATIENT_FTS_SQL + PATIENT_NUMBERS_SQL:
+                    conn.exec_driver_sql(statement)
+    loaded = time.perf_counter()
+
+    db = Session(bind=engine)
+    try:
+        rebuild_rollups(db)
+    finally:
+        db.close()
+    if sequences is not None:
+        sequences.resync()
+
+    return {
+        "seed": seed,
+        "first_day": days[0].isoformat(),
+        "last_day": days[-1].isoformat(),
+        "doctors": len(doctor_rows),
+        "rows": written,
+        "workers": workers,
+        "load_seconds": round(loaded - started, 1),
+        "total_seconds": round(time.perf_counter() - started, 1),
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+    from database import create_tables, engine, sequences
+
+    parser = argparse.ArgumentParser(prog="python -m app.core.synthetic")
+    parser.add_argument("--patients", type=int, default=100_000)
+    parser.add_argument("--bills", type=int, default=500_000)
+    parser.add_argument("--years", type=float, default=5)
+    parser.add_argument("--doctors", type=int, default=25)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workers", type=int, default=1, help="generator processes")
+    parser.add_argument("--ip-share", type=float, default=IP_SHARE)
+    parser.add_argument("--end-date", type=date.fromisoformat, default=DEFAULT_END_DATE,
+                        help=f"last day of the timeline (default {DEFAULT_END_DATE})")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    create_tables()
+    try:
+        result = generate(engine, args.patients, args.bills, args.years, args.doctors,
+                          args.seed, args.workers, args.ip_share, sequences, args.end_date)
+    except ValueError as e:
+        parser.exit(1, f"{e}\n")
+    print(result)
@@ -0,0 +1,286 @@
+"""
+In-process request tracing, exported as Chrome trace-event JSON.
+
+TracingMiddleware starts a trace per HTTP request; spans are added to it
+from whichever thread does the work:
+
+- the route handler (trace_routes wraps every endpoint)
+- get_current_user (auth), encoded_response (JSON encoding)
+- each SQL statement (cursor events) and each Session commit, which
+  includes the flush
+- "parse + validate request": from the last span that ended before the
+  handler started (or the request start) to the handler start. That is
+  FastAPI reading and validating the body, plus waiting for a worker
+  thread.
+- "serialize response": from the handler's return to the response start.
+  That is response_model validation and rendering.
+
+Finished traces are kept in a ring buffer of settings.trace_buffer_size
+requests. chrome_trace() turns them into the JSON that chrome://tracing,
+Perfetto and speedscope open: one process per request, one track per thread.
+"""
+import asyncio
+import functools
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .config import settings
+from .logs import current_request_id
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+
+MAX_STATEMENT_LENGTH = 500
+
+_FROM_TABLE = re.compile(r"\bFROM\s+(\S+)", re.IGNORECASE)
+
+
+class Trace:
+    __slots__ = (
+        "request_id", "method", "path", "route", "status", "started_at",
+        "start_ns", "end_ns", "loop_thread", "spans", "dropped", "handler_end_ns",
+    )
+
+    def __init__(self, request_id: str, method: str, path: str):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.route = None
+        self.status = None
+        self.started_at = datetime.now()
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = None
+        self.loop_thread = threading.get_ident()
+        # (name, category, thread id, start ns, duration ns, args)
+        self.spans = []
+        self.dropped = 0
+        self.handler_end_ns = None
+
+    def add(self, name: str, category: str, start_ns: int, end_ns: int, args=None, thread=None):
+        if len(self.spans) >= settings.trace_max_spans:
+            self.dropped += 1
+            return
+        self.spans.append((name, category, thread or threading.get_ident(), start_ns, end_ns - start_ns, args))
+
+    def summary(self) -> dict:
+        return {
+            "request_id": self.request_id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(timespec="milliseconds"),
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 2) if self.end_ns else None,
+            "spans": len(self.spans),
+            "dropped_spans": self.dropped,
+        }
+
+
+_traces = deque(maxlen=max(settings.trace_buffer_size, 1))
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, category: str = "app", **args):
+    """Time the block as a span of the current request's trace, if any"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        trace.add(name, category, start, time.perf_counter_ns(), args or None)
+
+
+def traces(limit: Optional[int] = None, request_id: Optional[str] = None) -> List[Trace]:
+    """Buffered traces, newest first"""
+    selected = [trace for trace in reversed(_traces) if request_id is None or trace.request_id == request_id]
+    return selected[:limit] if limit else selected
+
+
+def _traced_endpoint(call, name: str):
+    def handler_started(trace):
+        # Everything since the last finished span (or the request start),
+        # before the handler runs, is FastAPI parsing and validating
+        now = time.perf_counter_ns()
+        last_end = max((start + duration for _, _, _, start, duration, _ in trace.spans), default=trace.start_ns)
+        trace.add("parse + validate request", "fastapi", min(last_end, now), now, thread=trace.loop_thread)
+
+    if asyncio.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def traced(*args, **kwargs):
+            trace = _current.get()
+            if trace is None:
+                return await call(*args, **kwargs)
+            handler_started(trace)
+            start = time.perf_counter_ns()
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                trace.handler_end_ns = time.perf_counter_ns()
+                trace.add(name, "handler", start, trace.handler_end_ns)
+    else:
+        @functools.wraps(call)
+        def traced(*args, **kwargs):
+            trace = _current.get()
+            if trace is None:
+                return call(*args, **kwargs)
+            handler_started(trace)
+            start = time.perf_counter_ns()
+            try:
+                return call(*args, **kwargs)
+            finally:
+                trace.handler_end_ns = time.perf_counter_ns()
+                trace.add(name, "handler", start, trace.handler_end_ns)
+    return traced
+
+
+def trace_routes(app):
+    """
+    Wrap every API route's endpoint in a handler span. FastAPI reads
+    route.dependant.call on each request, so this works after the routes
+    are registered; call it once, after the last include_router.
+    """
+    from fastapi.routing import APIRoute
+
+    for route in app.routes:
+        if isinstance(route, APIRoute) and not hasattr(route.dependant.call, "__wrapped__"):
+            route.dependant.call = _traced_endpoint(route.dependant.call, route.name)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Per execution: a statement that raises never gets its after event
+    if _current.get() is not None and context is not None:
+        context.hms_trace_started = time.perf_counter_ns()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = _current.get()
+    started = getattr(context, "hms_trace_started", None)
+    if trace is None or started is None:
+        return
+    words = statement.split(None, 3)
+    # "SELECT patients", "INSERT INTO ip_bills", ...: enough to tell spans apart
+    table = _FROM_TABLE.search(statement) if words and words[0].upper() in ("SELECT", "WITH") else None
+    name = f"{words[0].upper()} {table.group(1)}" if table else " ".join(words[:3])
+    args = {"statement": statement[:MAX_STATEMENT_LENGTH]}
+    if executemany:
+        args["rows"] = len(parameters)
+    trace.add(name, "db", started, time.perf_counter_ns(), args)
+
+
+def _before_commit(session):
+    if _current.get() is not None:
+        session.info["trace_commit_started"] = time.perf_counter_ns()
+
+
+def _after_commit(session):
+    trace = _current.get()
+    started = session.info.pop("trace_commit_started", None)
+    if trace is not None and started is not None:
+        trace.add("commit", "db", started, time.perf_counter_ns())
+
+
+def instrument(*engines):
+    """Record statements on these engines, and Session commits, as spans"""
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    if not event.contains(Session, "before_commit", _before_commit):
+        event.listen(Session, "before_commit", _before_commit)
+        event.listen(Session, "after_commit", _after_commit)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware tracing each HTTP request into the ring buffer. The
+    trace endpoints themselves are left out so exporting doesn't push the
+    requests being looked at out of the buffer.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.trace_buffer_size \
+                or scope["path"].startswith("/diagnostics/traces"):
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(current_request_id() or "", scope["method"], scope["path"])
+
+        async def send_traced(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                if trace.handler_end_ns is not None:
+                    trace.add("serialize response", "fastapi", trace.handler_end_ns, time.perf_counter_ns())
+            await send(message)
+
+        token = _current.set(trace)
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            _current.reset(token)
+            trace.end_ns = time.perf_counter_ns()
+            route = scope.get("route")
+            trace.route = getattr(route, "path", None)
+            trace.add(f"{trace.method} {trace.route or trace.path}", "request", trace.start_ns, trace.end_ns)
+            _traces.append(trace)
+
+
+def chrome_trace(selected: List[Trace]) -> dict:
+    """
+    Chrome trace-event JSON for these traces: complete ("X") events in
+    microseconds from the oldest trace's start, one pid per request
+    """
+    origin = min((trace.start_ns for trace in selected), default=0)
+    events = []
+    for pid, trace in enumerate(sorted(selected, key=lambda trace: trace.start_ns), start=1):
+        label = f"{trace.method} {trace.route or trace.path} [{trace.request_id}]"
+        events.append({"ph": "M", "name": "process_name", "pid": pid, "tid": 0, "args": {"name": label}})
+        threads = {trace.loop_thread: 1}
+        events.append({"ph": "M", "name": "thread_name", "pid": pid, "tid": 1, "args": {"name": "event loop"}})
+        for name, category, thread, start, duration, args in trace.spans:
+            if thread not in threads:
+                threads[thread] = len(threads) + 1
+                events.append({
+                    "ph": "M", "name": "thread_name", "pid": pid, "tid": threads[thread],
+                    "args": {"name": f"worker {len(threads) - 1}"},
+                })
+            event_ = {
+                "name": name, "cat": category, "ph": "X", "pid": pid, "tid": threads[thread],
+                "ts": (start - origin) / 1000, "dur": duration / 1000,
+            }
+            if args:
+                event_["args"] = args
+            events.append(event_)
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def traces_dir() -> str:
+    return os.path.join(settings.data_dir, "traces")
+
+
+def write_chrome_trace(selected: List[Trace]) -> str:
+    """Write the traces to <data_dir>/traces/trace-<time>.json; returns the path"""
+    directory = traces_dir()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"trace-{datetime.now():%Y%m%d-%H%M%S-%f}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(chrome_trace(selected), f)
+    return path
@@ -2,16 +2,39 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from datetime import datetime
+from anyio import to_thread
 import os
 
 from database import create_tables
-from .routers import auth, patients, doctors, bills, dashboard, reports, seeder, settings
+from .core import config, memory
+from .core.backup import start_backups
+from .core.memory import MemoryMiddleware
+from .core.logs import REQUEST_ID_HEADER, RequestIdMiddleware, setup_logging
+from .core.dbstats import QUERY_COUNT_HEADER, QUERY_TIME_HEADER, QueryStatsMiddleware
+from .core.metrics import MetricsMiddleware
+from .core.profiler import PROFILE_HEADER, ProfilingMiddleware
+from .core.tracing import TracingMiddleware, trace_routes
+from .core.pagination import NEXT_CURSOR_HEADER, TOTAL_ESTIMATE_HEADER
+from .routers import auth, patients, doctors, bills, dashboard, reports, exports, imports, archives, backups, seeder, settings, metrics, diagnostics
+
+# JSON lines to <data_dir>/logs/backend.log, written off the request path
+setup_logging()
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Create tables on startup
+    # Per-route peak memory from the first request, when HMS_MEMORY_TRACKING is set
+    if config.settings.memory_tracking:
+        memory.start()
+    # Create tables and apply pending schema migrations on startup
     create_tables()
+    # Route handlers are plain `def` functions, so FastAPI runs them (and
+    # their blocking SQLAlchemy calls) in this thread pool, off the event loop
+    to_thread.current_default_thread_limiter().total_tokens = config.settings.threadpool_size
+    # Base backups and WAL shipping, when HMS_BACKUP_DIR is set
+    app.state.backups = start_backups()
     yield
+    if app.state.backups:
+        app.state.backups.stop()
 
 app = FastAPI(
     title="Hospital Management System - Lite",
@@ -38,14 +61,36 @@ app = FastAPI(
 #     allow_headers=["*"],
 # )
 
+# Statement count and DB time per request, see app/core/dbstats.py
+app.add_middleware(QueryStatsMiddleware)
+
+# Peak traced memory per route while tracemalloc runs, see app/core/memory.py
+app.add_middleware(MemoryMiddleware)
+
+# ?__profile=1 from an admin samples that request into <data_dir>/profiles
+app.add_middleware(ProfilingMiddleware, is_admin=auth.is_admin_token)
+
+# Handler, auth, statement and serialization spans of recent requests,
+# exported from /diagnostics/traces
+app.add_middleware(TracingMiddleware)
+
+# Request counts, latency and in-flight requests for GET /metrics
+if config.settings.metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], 
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Keyset pagination, per-request DB stats, profile and request id headers, readable from the browser
+    expose_headers=[NEXT_CURSOR_HEADER, TOTAL_ESTIMATE_HEADER, QUERY_COUNT_HEADER, QUERY_TIME_HEADER, PROFILE_HEADER, REQUEST_ID_HEADER],
 )
 
+# Outermost, so every log line of a request carries its id
+app.add_middleware(RequestIdMiddleware)
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(patients.router)
@@ -53,8 +98,14 @@ app.include_router(doctors.router)
 app.include_router(bills.router)
 app.include_router(dashboard.router)
 app.include_router(reports.router)
+app.include_router(exports.router)
+app.include_router(imports.router)
+app.include_router(archives.router)
+app.include_router(backups.router)
 app.include_router(seeder.router)
 app.include_router(settings.router)
+app.include_router(metrics.router)
+app.include_router(diagnostics.router)
 
 @app.get("/")
 async def root():
@@ -76,6 +127,9 @@ async def health_check():
         "version": "1.0.0"
     }
 
+# Handler spans for every route above; keep this after the last route
+trace_routes(app)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
\ No newline at end of file
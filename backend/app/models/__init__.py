@@ -1,4 +1,4 @@
-from .models import Base, User, Doctor, Patient, OPBill, OPBillItem, IPBill, IPBillItem, Department, Particular
+from .models import Base, User, Doctor, Patient, OPBill, OPBillItem, IPBill, IPBillItem, Department, Particular, DailyStat, ParticularDailyStat, SequenceCounter, ExportWatermark, Archive, ImportJob
 
 __all__ = [
     "Base",
@@ -11,4 +11,10 @@ __all__ = [
     "IPBillItem",
     "Department",  # Add this
     "Particular",  # Add this
+    "DailyStat",
+    "ParticularDailyStat",
+    "SequenceCounter",
+    "ExportWatermark",
+    "Archive",
+    "ImportJob",
 ]
\ No newline at end of file
@@ -1,10 +1,28 @@
 from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, Date
-from datetime import date, time,datetime
+from datetime import date, time,datetime, timezone
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
 Base = declarative_base()
 
+def local_business_day(timestamp):
+    """
+    Local calendar date for a naive UTC timestamp (bill_date and
+    registration_date are stored via datetime.utcnow). Plain dates are
+    taken as already local.
+    """
+    if timestamp is None:
+        return date.today()
+    if not isinstance(timestamp, datetime):
+        return timestamp
+    return timestamp.replace(tzinfo=timezone.utc).astimezone().date()
+
+def business_day_default(column_name):
+    # Column default that derives the business day from another column of the same INSERT
+    def default(context):
+        return local_business_day(context.get_current_parameters().get(column_name))
+    return default
+
 class User(Base):
     __tablename__ = "users"
     
@@ -53,7 +71,8 @@ class Patient(Base):
     id = Column(Integer, primary_key=True, index=True)
     op_number = Column(String(50), unique=True, index=True)
     ip_number = Column(String(50), unique=True, index=True, nullable=True)
-    registration_date = Column(DateTime, default=datetime.utcnow)
+    registration_date = Column(DateTime, default=datetime.utcnow, index=True)
+    registration_day = Column(Date, default=business_day_default("registration_date"), index=True)
     name = Column(String(100))
     age = Column(String(20))
     gender = Column(String(10))
@@ -79,8 +98,9 @@ class OPBill(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     bill_number = Column(String(50), unique=True, index=True)
-    bill_date = Column(DateTime, default=datetime.utcnow)
-    patient_id = Column(Integer, ForeignKey("patients.id"))
+    bill_date = Column(DateTime, default=datetime.utcnow, index=True)
+    bill_day = Column(Date, default=business_day_default("bill_date"), index=True)
+    patient_id = Column(Integer, ForeignKey("patients.id"), index=True)
     bill_type = Column(String(20))
     category = Column(String(50))
     doctor = Column(String(100))
@@ -101,7 +121,7 @@ class OPBillItem(Base):
     __tablename__ = "op_bill_items"
     
     id = Column(Integer, primary_key=True, index=True)
-    bill_id = Column(Integer, ForeignKey("op_bills.id"))
+    bill_id = Column(Integer, ForeignKey("op_bills.id"), index=True)
     particular = Column(String(200))
     doctor = Column(String(100))
     doctor_id = Column(Integer, ForeignKey("doctors.id"))
@@ -122,8 +142,9 @@ class IPBill(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     bill_number = Column(String(50), unique=True, index=True)
-    bill_date = Column(DateTime, default=datetime.utcnow)
-    patient_id = Column(Integer, ForeignKey("patients.id"))
+    bill_date = Column(DateTime, default=datetime.utcnow, index=True)
+    bill_day = Column(Date, default=business_day_default("bill_date"), index=True)
+    patient_id = Column(Integer, ForeignKey("patients.id"), index=True)
     is_credit = Column(Boolean, default=False)
     is_insurance = Column(Boolean, default=False)
     category = Column(String(50))
@@ -150,7 +171,7 @@ class IPBillItem(Base):
     __tablename__ = "ip_bill_items"
     
     id = Column(Integer, primary_key=True, index=True)
-    bill_id = Column(Integer, ForeignKey("ip_bills.id"))
+    bill_id = Column(Integer, ForeignKey("ip_bills.id"), index=True)
     particular = Column(String(200))
     department = Column(String(100))
     amount = Column(Float, default=0)
@@ -177,4 +198,79 @@ class Particular(Base):
     opdefault = Column(Boolean, default=False)
     ipdefault = Column(Boolean, default=False)
     sortorder = Column(Integer, default=-1)
-    created_at = Column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+# Per-day, per-doctor counters behind the dashboard, kept current in the same
+# transaction as each patient/bill insert (app/core/rollups.py). doctor_id is 0
+# for rows without a doctor.
+class DailyStat(Base):
+    __tablename__ = "daily_stats"
+
+    day = Column(Date, primary_key=True)
+    doctor_id = Column(Integer, primary_key=True, default=0)
+    patients_registered = Column(Integer, default=0)
+    op_bills = Column(Integer, default=0)
+    ip_bills = Column(Integer, default=0)
+    op_revenue = Column(Float, default=0)
+    ip_revenue = Column(Float, default=0)
+
+# Per-particular item counts and totals by day, doctor and OP/IP, behind the
+# particulars report. particular_id is CAST(particular AS INTEGER), matching
+# how the report looks items up.
+class ParticularDailyStat(Base):
+    __tablename__ = "particular_daily_stats"
+
+    particular_id = Column(Integer, primary_key=True)
+    day = Column(Date, primary_key=True)
+    doctor_id = Column(Integer, primary_key=True, default=0)
+    bill_type = Column(String(2), primary_key=True)
+    item_count = Column(Integer, default=0)
+    total = Column(Float, default=0)
+
+# Next unallocated value of each numbering sequence (OP/IP numbers, bill
+# numbers) per period, e.g. ("op_bill", "20251017"). Only the sequence
+# allocator writes here.
+class SequenceCounter(Base):
+    __tablename__ = "sequences"
+
+    name = Column(String(30), primary_key=True)
+    period = Column(String(10), primary_key=True)
+    next_value = Column(Integer, nullable=False)
+
+# Highest bill id already written to the Parquet snapshot, per dataset and
+# bill type, e.g. "bill_items_op". Only app/core/analytics.py writes here.
+class ExportWatermark(Base):
+    __tablename__ = "export_watermarks"
+
+    name = Column(String(50), primary_key=True)
+    last_bill_id = Column(Integer, nullable=False, default=0)
+    exported_rows = Column(Integer, nullable=False, default=0)
+    exported_at = Column(DateTime)
+
+# Financial years whose bills were moved to an archive file (filename is
+# relative to the data directory); app/core/archive.py attaches the ones a
+# report's date range overlaps.
+class Archive(Base):
+    __tablename__ = "archives"
+
+    financial_year = Column(Integer, primary_key=True)  # start year, 2023 for 2023-24
+    filename = Column(String(100), nullable=False)
+    start_day = Column(Date, nullable=False)
+    end_day = Column(Date, nullable=False)
+    op_bills = Column(Integer, default=0)
+    ip_bills = Column(Integer, default=0)
+    archived_at = Column(DateTime)
+
+# Progress of each bulk import job (app/core/importer.py). records_done is
+# committed with the chunk it covers, so rerunning a job resumes after it.
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+
+    job = Column(String(200), primary_key=True)
+    kind = Column(String(20), nullable=False)
+    records_done = Column(Integer, nullable=False, default=0)
+    imported = Column(Integer, nullable=False, default=0)
+    rejected = Column(Integer, nullable=False, default=0)
+    started_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    finished_at = Column(DateTime)
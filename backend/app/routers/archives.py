@@ -0,0 +1,51 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from database import engine, get_read_db
+from .auth import get_current_admin
+from ..core.archive import archive_financial_year, closed_financial_years
+from ..models import Archive
+
+router = APIRouter(prefix="/archives", tags=["archives"])
+
+@router.get("")
+def get_archives(
+    db: Session = Depends(get_read_db),
+    current_user = Depends(get_current_admin)
+):
+    """
+    List archived financial years, and the closed years whose bills are
+    still in the main database
+    """
+    archives = db.query(Archive).order_by(Archive.financial_year).all()
+    return {
+        "archives": [
+            {
+                "financial_year": archive.financial_year,
+                "filename": archive.filename,
+                "start_day": archive.start_day,
+                "end_day": archive.end_day,
+                "op_bills": archive.op_bills,
+                "ip_bills": archive.ip_bills,
+                "archived_at": archive.archived_at,
+            }
+            for archive in archives
+        ],
+        "pending": closed_financial_years(db.connection()),
+    }
+
+@router.post("/{financial_year}")
+def archive_year(
+    financial_year: int,
+    current_user = Depends(get_current_admin)
+):
+    """
+    Move the bills of a closed financial year (its start year, e.g. 2023
+    for 2023-24) into its archive file. Reports keep seeing them. Refused
+    (400) while the year holds the newest bill ids.
+    """
+    try:
+        moved = archive_financial_year(engine, financial_year)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"financial_year": financial_year, "moved": moved}
@@ -1,3 +1,4 @@
+import logging
 from datetime import datetime, timedelta
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, status
@@ -8,9 +9,12 @@ from passlib.context import CryptContext
 from sqlalchemy import func
 
 
-from database import get_db
+from database import ReadSessionLocal, get_db, get_read_db
 from ..schemas import Token, UserCreate
 from ..models import User
+from ..core.tracing import span
+
+logger = logging.getLogger(__name__)
 
 # Configuration
 SECRET_KEY = "your-secret-key-change-this-in-production"
@@ -54,9 +58,9 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 # Dependency to get current user
-async def get_current_user(
+def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -64,24 +68,44 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.username == username).first()
+    with span("get_current_user", "auth"):
+        user = user_for_token(db, token)
     if user is None:
         raise credentials_exception
     return user
 
+def user_for_token(db: Session, token: str) -> Optional[User]:
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    username: str = payload.get("sub")
+    if username is None:
+        return None
+    return db.query(User).filter(User.username == username).first()
+
+def get_current_admin(current_user: User = Depends(get_current_user)):
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admins only")
+    return current_user
+
+def is_admin_token(token: str) -> bool:
+    """
+    Admin check for code outside a route's dependencies (middleware);
+    blocking, run it in the thread pool
+    """
+    db = ReadSessionLocal()
+    try:
+        user = user_for_token(db, token)
+        return user is not None and user.role == "admin"
+    finally:
+        db.close()
+
 # Routes
 @router.post("/login")
-async def login(
+def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     user = authenticate_user(db, form_data.username, form_data.password)
     if not user:
@@ -104,9 +128,7 @@ async def login(
     )
 
 @router.post("/register")
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
-    print("PASSWORD RECEIVED:", user_data.password)
-    print("PASSWORD LENGTH:", len(user_data.password))
+def register(user_data: UserCreate, db: Session = Depends(get_db)):
     # Check if user already exists
     existing_user = db.query(User).filter(User.username == user_data.username).first()
     if existing_user:
@@ -127,9 +149,10 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    logger.info("Registered user %s", db_user.username)
     
     return {"message": "User created successfully !"}
 
 @router.get("/me")
-async def read_users_me(current_user: User = Depends(get_current_user)):
+def read_users_me(current_user: User = Depends(get_current_user)):
     return current_user
\ No newline at end of file
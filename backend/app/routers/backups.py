@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends, HTTPException
+
+from .auth import get_current_admin
+from ..core.backup import backup_database, list_base_backups, prune_backups
+from ..core.config import settings
+
+router = APIRouter(prefix="/backups", tags=["backups"])
+
+def _backup_dir() -> str:
+    if not settings.backup_dir:
+        raise HTTPException(status_code=400, detail="Backups are off; set HMS_BACKUP_DIR")
+    return settings.backup_dir
+
+@router.get("")
+def get_backups(current_user = Depends(get_current_admin)):
+    """
+    List the base backups, oldest first
+    """
+    return list_base_backups(_backup_dir())
+
+@router.post("")
+def create_backup(current_user = Depends(get_current_admin)):
+    """
+    Take a base backup now, without stopping billing, and apply retention
+    """
+    backup_dir = _backup_dir()
+    backup = backup_database(settings.db_path, backup_dir)
+    prune_backups(backup_dir)
+    return backup
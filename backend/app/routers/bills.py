@@ -1,27 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy import func
-from typing import List
+from typing import List, Optional
 from datetime import datetime
-import random
 
-from database import get_db
+from database import get_db, get_read_db, sequences
 from .auth import get_current_user
+from ..core.archive import archive_reads
+from ..core.metrics import BILLS_CREATED
+from ..core.responses import encoded_response
+from ..core.pagination import page_response, paginate
+from ..core.rollups import daily_stats_total, record_daily_stats, record_particular_stats
 from ..models import OPBill, OPBillItem, IPBill, IPBillItem, Patient, Doctor
 from ..schemas import OPBillCreate, IPBillCreate
 
 router = APIRouter(prefix="/bills", tags=["bills"])
 
 
-def generate_bill_number(prefix: str = "B"):
-    current_date = datetime.now()
-    date_str = current_date.strftime("%Y%m%d")
-    sequence = random.randint(1, 9999)
-    return f"{prefix}{date_str}-{sequence:04d}"
+def generate_bill_number(prefix: str):
+    # "OP" -> OP20251017-0001, "IP" -> IP20251017-0001, one sequence per day
+    return sequences.next_number(f"{prefix.lower()}_bill")
 
 
 @router.post("/op")
-async def create_op_bill(
+def create_op_bill(
     bill_data: OPBillCreate,
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user)
@@ -79,8 +82,15 @@ async def create_op_bill(
     )
 
     db.add(db_bill)
+    db.flush()
+    record_daily_stats(db, db_bill.bill_day, db_bill.doctor_id, op_bills=1, op_revenue=net_amount)
+    # Items without a doctor of their own are the bill doctor's
+    record_particular_stats(db, db_bill.bill_day, "OP", [
+        (item.particular, item.doctor_id or db_bill.doctor_id, item.total) for item in bill_items
+    ])
     db.commit()
     db.refresh(db_bill)
+    BILLS_CREATED.labels("OP").inc()
 
     return {
         "message": "OP Bill created successfully",
@@ -90,7 +100,7 @@ async def create_op_bill(
 
 
 @router.post("/ip")
-async def create_ip_bill(
+def create_ip_bill(
     bill_data: IPBillCreate,
     db: Session = Depends(get_db),
     current_user=Depends(get_current_user)
@@ -157,8 +167,14 @@ async def create_ip_bill(
     )
 
     db.add(db_bill)
+    db.flush()
+    record_daily_stats(db, db_bill.bill_day, db_bill.doctor_id, ip_bills=1, ip_revenue=net_amount)
+    record_particular_stats(db, db_bill.bill_day, "IP", [
+        (item.particular, db_bill.doctor_id, item.total) for item in bill_items
+    ])
     db.commit()
     db.refresh(db_bill)
+    BILLS_CREATED.labels("IP").inc()
 
     return {
         "message": "IP Bill created successfully",
@@ -168,135 +184,157 @@ async def create_ip_bill(
 
 
 @router.get("/op/today")
-async def get_today_op_bills(
-    db: Session = Depends(get_db),
+def get_today_op_bills(
+    db: Session = Depends(get_read_db),
     current_user=Depends(get_current_user)
 ):
     today = datetime.now().date()
 
     bills = (
         db.query(OPBill)
-        .filter(func.date(OPBill.bill_date) == today)
+        .filter(OPBill.bill_day == today)
         .all()
     )
 
-    return bills
+    return encoded_response(bills)
 
 
 @router.get("/ip/today")
-async def get_today_ip_bills(
-    db: Session = Depends(get_db),
+def get_today_ip_bills(
+    db: Session = Depends(get_read_db),
     current_user=Depends(get_current_user)
 ):
     today = datetime.now().date()
 
     bills = (
         db.query(IPBill)
-        .filter(func.date(IPBill.bill_date) == today)
+        .filter(IPBill.bill_day == today)
         .all()
     )
 
-    return bills
+    return encoded_response(bills)
     
 @router.get("/op/all")
-async def get_all_op_bills(
-    db: Session = Depends(get_db),
+def get_all_op_bills(
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; all bills if omitted"),
+    db: Session = Depends(get_read_db),
     current_user=Depends(get_current_user)
 ):
-    # today = datetime.now().date()
-
-    bills = (
-        db.query(OPBill)
-        # .filter(func.date(IPBill.bill_date) == today)
-        .all()
-    )
+    """
+    All OP bills, archived years included, newest first. Without a
+    limit every bill is returned, as before paging; with one, a page at a
+    time (see X-Next-Cursor).
+    """
+    # SQLite merges the main and archive bill_date indexes, so a page is
+    # still an index seek per file
+    with archive_reads(db):
+        bills, next_cursor = paginate(
+            db.query(OPBill), [OPBill.bill_date, OPBill.id], cursor, limit
+        )
 
-    return bills
+    return page_response(bills, next_cursor, daily_stats_total(db, "op_bills"))
 
 
     
 @router.get("/ip/all")
-async def get_all_ip_bills(
-    db: Session = Depends(get_db),
+def get_all_ip_bills(
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; all bills if omitted"),
+    db: Session = Depends(get_read_db),
     current_user=Depends(get_current_user)
 ):
-    # today = datetime.now().date()
-
-    bills = (
-        db.query(IPBill)
-        # .filter(func.date(IPBill.bill_date) == today)
-        .all()
-    )
+    """
+    All IP bills, archived years included, newest first. Without a
+    limit every bill is returned, as before paging; with one, a page at a
+    time (see X-Next-Cursor).
+    """
+    with archive_reads(db):
+        bills, next_cursor = paginate(
+            db.query(IPBill), [IPBill.bill_date, IPBill.id], cursor, limit
+        )
 
-    return bills
+    return page_response(bills, next_cursor, daily_stats_total(db, "ip_bills"))
 
 
     
 @router.get("/ip/{patient_id}")
-async def get_patient_ip_bills(
+def get_patient_ip_bills(
     patient_id: int,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     # today = datetime.now().date()
 
-    bills = (
-        db.query(IPBill)
-        .filter(IPBill.patient_id == patient_id)
-        .all()
-    )
+    # A patient's history includes the archived years
+    with archive_reads(db):
+        bills = (
+            db.query(IPBill)
+            .filter(IPBill.patient_id == patient_id)
+            .all()
+        )
 
-    return bills
+    return encoded_response(bills)
 
 
     
 @router.get("/op/{patient_id}")
-async def get_patient_op_bills(
+def get_patient_op_bills(
     patient_id: int,
-    db: Session = Depends(get_db)
+    include_items: bool = Query(False, description="Add each bill's items, instead of a /op/details call per bill"),
+    db: Session = Depends(get_read_db)
 ):
     # today = datetime.now().date()
 
-    bills = (
-        db.query(OPBill)
-        .filter(OPBill.patient_id == patient_id)
-        .all()
-    )
+    # A patient's history includes the archived years
+    with archive_reads(db):
+        query = db.query(OPBill).filter(OPBill.patient_id == patient_id)
+        if not include_items:
+            return encoded_response(query.all())
 
-    return bills
+        # One extra query for the items of all the bills
+        bills = query.options(selectinload(OPBill.items)).all()
+    return encoded_response([
+        {**jsonable_encoder(bill), "items": jsonable_encoder(bill.items)}
+        for bill in bills
+    ])
 
 @router.get("/ip/details/{bill_id}")
-async def get_ip_bill_details(
+def get_ip_bill_details(
     bill_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user=Depends(get_current_user)
 ):
-    bill = db.query(IPBill).filter(IPBill.id == bill_id).first()
-    if not bill:
-        raise HTTPException(status_code=404, detail="Bill not found")
+    # Bills of archived years are looked up in their archive file too
+    with archive_reads(db):
+        bill = db.query(IPBill).filter(IPBill.id == bill_id).first()
+        if not bill:
+            raise HTTPException(status_code=404, detail="Bill not found")
+
+        # Load items
+        items = db.query(IPBillItem).filter(IPBillItem.bill_id == bill_id).all()
     
-    # Load items
-    items = db.query(IPBillItem).filter(IPBillItem.bill_id == bill_id).all()
-    
-    return {
+    return encoded_response({
         "bill": bill,
         "items": items
-    }
+    })
 
 
 @router.get("/op/details/{bill_id}")
-async def get_op_bill_details(
+def get_op_bill_details(
     bill_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user=Depends(get_current_user)
 ):
-    bill = db.query(OPBill).filter(OPBill.id == bill_id).first()
-    if not bill:
-        raise HTTPException(status_code=404, detail="Bill not found")
+    # Bills of archived years are looked up in their archive file too
+    with archive_reads(db):
+        bill = db.query(OPBill).filter(OPBill.id == bill_id).first()
+        if not bill:
+            raise HTTPException(status_code=404, detail="Bill not found")
+
+        # Load items
+        items = db.query(OPBillItem).filter(OPBillItem.bill_id == bill_id).all()
     
-    # Load items
-    items = db.query(OPBillItem).filter(OPBillItem.bill_id == bill_id).all()
-    
-    return {
+    return encoded_response({
         "bill": bill,
         "items": items
-    }
\ No newline at end of file
+    })
\ No newline at end of file
@@ -3,49 +3,45 @@ from sqlalchemy.orm import Session
 from sqlalchemy import func
 from datetime import datetime, date
 
-from database import get_db
-from .auth import get_current_user
-from ..models import Patient, OPBill, IPBill
+from database import get_db, get_read_db
+from .auth import get_current_admin, get_current_user
+from ..models import DailyStat
 from ..schemas import DashboardStats
+from ..core.rollups import rebuild_daily_stats
 
 router = APIRouter(prefix="/dashboard", tags=["dashboard"])
 
 @router.get("/stats", response_model=DashboardStats)
-async def get_dashboard_stats(
-    db: Session = Depends(get_db),
+def get_dashboard_stats(
+    db: Session = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
     today = date.today()
-    
-    # Total patients registered today
-    total_patients_today = db.query(Patient).filter(
-        func.date(Patient.registration_date) == today
-    ).count()
-    
-    # Total OP bills today
-    total_op_bills_today = db.query(OPBill).filter(
-        func.date(OPBill.bill_date) == today
-    ).count()
-    
-    # Total IP bills today
-    total_ip_bills_today = db.query(IPBill).filter(
-        func.date(IPBill.bill_date) == today
-    ).count()
-    
-    # Total revenue today
-    op_revenue = db.query(func.sum(OPBill.net_amount)).filter(
-        func.date(OPBill.bill_date) == today
-    ).scalar() or 0
-    
-    ip_revenue = db.query(func.sum(IPBill.net_amount)).filter(
-        func.date(IPBill.bill_date) == today
-    ).scalar() or 0
-    
-    total_revenue_today = op_revenue + ip_revenue
+
+    # One indexed lookup on the daily_stats rollup (a row per doctor for today)
+    patients, op_bills, ip_bills, op_revenue, ip_revenue = db.query(
+        func.sum(DailyStat.patients_registered),
+        func.sum(DailyStat.op_bills),
+        func.sum(DailyStat.ip_bills),
+        func.sum(DailyStat.op_revenue),
+        func.sum(DailyStat.ip_revenue)
+    ).filter(DailyStat.day == today).one()
 
     return DashboardStats(
-        total_patients_today=total_patients_today,
-        total_op_bills_today=total_op_bills_today,
-        total_ip_bills_today=total_ip_bills_today,
-        total_revenue_today=total_revenue_today
-    )
\ No newline at end of file
+        total_patients_today=patients or 0,
+        total_op_bills_today=op_bills or 0,
+        total_ip_bills_today=ip_bills or 0,
+        total_revenue_today=(op_revenue or 0) + (ip_revenue or 0)
+    )
+
+@router.post("/stats/rebuild")
+def rebuild_dashboard_stats(
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_admin)
+):
+    """
+    Recompute the daily_stats rollup from the patient and bill tables, in
+    batches so billing carries on meanwhile
+    """
+    rows = rebuild_daily_stats(db)
+    return {"message": "Dashboard statistics rebuilt", "rows": rows}
@@ -0,0 +1,174 @@
+from enum import Enum
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import FileResponse, JSONResponse
+
+from .auth import get_current_admin
+from ..core import memory, profiler, slowqueries, tracing
+from ..core.config import settings
+
+router = APIRouter(prefix="/diagnostics", tags=["diagnostics"])
+
+
+class AllocationGrouping(str, Enum):
+    lineno = "lineno"
+    filename = "filename"
+    traceback = "traceback"
+
+
+class StatementOrder(str, Enum):
+    max = "max"
+    total = "total"
+    mean = "mean"
+
+
+@router.get("/slow-queries")
+def get_slow_queries(
+    limit: int = Query(20, ge=1, le=500),
+    order_by: StatementOrder = Query(StatementOrder.max, description="Worst single run, total time or mean"),
+    current_user = Depends(get_current_admin)
+):
+    """
+    The slowest statement shapes since startup. Runs at or above threshold_ms
+    are counted in slow and sampled into the log file with their query plan.
+    """
+    return {
+        "threshold_ms": settings.slow_query_ms,
+        "log_file": settings.slow_query_log_path if settings.slow_query_ms else None,
+        "statements": slowqueries.slowest(limit, order_by.value),
+    }
+
+
+@router.get("/profiles")
+def get_profiles(current_user = Depends(get_current_admin)):
+    """
+    Request profiles taken with ?__profile=1, newest first
+    """
+    return profiler.list_profiles()
+
+
+@router.get("/profiles/{profile_id}")
+def download_profile(profile_id: str, current_user = Depends(get_current_admin)):
+    """
+    A profile's folded stacks, for flamegraph.pl, speedscope or inferno
+    """
+    path = profiler.profile_path(profile_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=f"hms-profile-{profile_id}{profiler.PROFILE_SUFFIX}")
+
+
+@router.get("/traces")
+def get_traces(
+    limit: int = Query(50, ge=1, le=1000),
+    current_user = Depends(get_current_admin)
+):
+    """
+    The most recently traced requests, newest first
+    """
+    return {
+        "buffer_size": settings.trace_buffer_size,
+        "traces": [trace.summary() for trace in tracing.traces(limit)],
+    }
+
+
+@router.get("/traces/export")
+def export_traces(
+    limit: Optional[int] = Query(None, ge=1, description="Newest requests only"),
+    request_id: Optional[str] = Query(None, description="Just this request"),
+    current_user = Depends(get_current_admin)
+):
+    """
+    Buffered traces as Chrome trace-event JSON, for chrome://tracing,
+    Perfetto or speedscope
+    """
+    selected = tracing.traces(limit, request_id)
+    if request_id and not selected:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return JSONResponse(
+        tracing.chrome_trace(selected),
+        headers={"Content-Disposition": 'attachment; filename="hms-trace.json"'},
+    )
+
+
+@router.post("/traces/export")
+def save_traces(
+    limit: Optional[int] = Query(None, ge=1, description="Newest requests only"),
+    current_user = Depends(get_current_admin)
+):
+    """
+    Write the buffered traces to <data_dir>/traces as Chrome trace-event JSON
+    """
+    selected = tracing.traces(limit)
+    return {"path": tracing.write_chrome_trace(selected), "traces": len(selected)}
+
+
+def _require_memory_tracking():
+    if not memory.tracking():
+        raise HTTPException(status_code=409, detail="Memory tracking is off")
+
+
+@router.get("/memory")
+def get_memory(
+    limit: int = Query(20, ge=1, le=500),
+    group_by: AllocationGrouping = Query(AllocationGrouping.lineno),
+    current_user = Depends(get_current_admin)
+):
+    """
+    Traced and resident memory, each route's peak memory per request and,
+    while tracking, the allocation sites holding the most memory now
+    """
+    return {
+        **memory.usage(),
+        "routes": memory.route_peaks(),
+        "top": memory.top_sites(limit, group_by.value) if memory.tracking() else [],
+    }
+
+
+@router.post("/memory/tracking")
+def set_memory_tracking(enabled: bool, current_user = Depends(get_current_admin)):
+    """
+    Start or stop tracemalloc. Allocations made before it started aren't traced.
+    """
+    if enabled:
+        memory.start()
+    else:
+        memory.stop()
+    return memory.usage()
+
+
+@router.get("/memory/snapshots")
+def get_memory_snapshots(current_user = Depends(get_current_admin)):
+    """
+    Kept snapshots, newest first
+    """
+    return memory.list_snapshots()
+
+
+@router.post("/memory/snapshots")
+def take_memory_snapshot(current_user = Depends(get_current_admin)):
+    """
+    Snapshot the traced allocations, to diff against later
+    """
+    _require_memory_tracking()
+    return memory.take_snapshot()
+
+
+@router.get("/memory/snapshots/{snapshot_id}/diff")
+def diff_memory_snapshot(
+    snapshot_id: int,
+    against: Optional[int] = Query(None, description="A later snapshot; now if omitted"),
+    limit: int = Query(20, ge=1, le=500),
+    group_by: AllocationGrouping = Query(AllocationGrouping.lineno),
+    current_user = Depends(get_current_admin)
+):
+    """
+    Allocation sites that grew or shrank since the snapshot, biggest change first
+    """
+    for wanted in (snapshot_id, against):
+        if wanted is not None and not memory.has_snapshot(wanted):
+            raise HTTPException(status_code=404, detail=f"Snapshot {wanted} not found")
+    if against is None:
+        _require_memory_tracking()
+    return memory.diff(snapshot_id, against, limit, group_by.value)
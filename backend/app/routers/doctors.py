@@ -4,7 +4,7 @@ from typing import List
 import random
 
 from typing import Optional
-from database import get_db
+from database import get_db, get_read_db
 from .auth import get_current_user
 from ..models import Doctor
 from ..schemas import DoctorCreate, DoctorResponse
@@ -16,7 +16,7 @@ def generate_doctor_code():
     return f"DR{random.randint(1000, 9999)}"
 
 @router.post("/", response_model=DoctorResponse)
-async def create_doctor(
+def create_doctor(
     doctor_data: DoctorCreate,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
@@ -34,12 +34,12 @@ async def create_doctor(
     return DoctorResponse.from_orm(db_doctor)
 
 @router.get("/", response_model=List[DoctorResponse])
-async def get_doctors(
+def get_doctors(
     skip: int = 0,
     limit: int = 100,
     search: Optional[str] = None,
     active_only: bool = True,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
     query = db.query(Doctor)
@@ -58,9 +58,9 @@ async def get_doctors(
     return [DoctorResponse.from_orm(doctor) for doctor in doctors]
 
 @router.get("/{doctor_id}", response_model=DoctorResponse)
-async def get_doctor(
+def get_doctor(
     doctor_id: int,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
     doctor = db.query(Doctor).filter(Doctor.id == doctor_id).first()
@@ -70,7 +70,7 @@ async def get_doctor(
     return DoctorResponse.from_orm(doctor)
 
 @router.put("/{doctor_id}", response_model=DoctorResponse)
-async def update_doctor(
+def update_doctor(
     doctor_id: int,
     doctor_data: DoctorCreate,
     db: Session = Depends(get_db),
@@ -89,7 +89,7 @@ async def update_doctor(
     return DoctorResponse.from_orm(doctor)
 
 @router.delete("/{doctor_id}")
-async def delete_doctor(
+def delete_doctor(
     doctor_id: int,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
@@ -0,0 +1,201 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Integer, cast, func, literal, null, select
+from sqlalchemy.orm import aliased
+from typing import Optional
+from datetime import date, timedelta
+from enum import Enum
+
+from database import ReadSessionLocal, engine, read_engine
+from .auth import get_current_admin, get_current_user
+from ..core import analytics
+from ..core.config import settings
+from ..core.export import csv_stream, stream_rows, xlsx_stream
+from ..models import Patient, OPBill, IPBill, OPBillItem, IPBillItem, Doctor, Particular
+
+router = APIRouter(prefix="/exports", tags=["exports"])
+
+
+class ExportFormat(str, Enum):
+    csv = "csv"
+    xlsx = "xlsx"
+
+
+class BillType(str, Enum):
+    all = "all"
+    op = "op"
+    ip = "ip"
+
+
+MEDIA_TYPES = {
+    ExportFormat.csv: "text/csv; charset=utf-8",
+    ExportFormat.xlsx: "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+BILL_COLUMNS = [
+    "bill_type", "bill_number", "bill_date", "bill_day", "op_number", "ip_number",
+    "patient_name", "doctor", "category", "total_amount", "discount_amount", "net_amount",
+]
+
+ITEM_COLUMNS = [
+    "bill_type", "bill_number", "bill_date", "bill_day", "op_number", "patient_name",
+    "particular_id", "particular", "department", "doctor", "unit", "rate",
+    "amount", "discount_amount", "total",
+]
+
+
+def _bill_statement(bill_model, bill_type: str, start_date, end_date, doctor_id, department):
+    item_model = OPBillItem if bill_model is OPBill else IPBillItem
+    statement = select(
+        literal(bill_type),
+        bill_model.bill_number,
+        bill_model.bill_date,
+        bill_model.bill_day,
+        Patient.op_number,
+        Patient.ip_number,
+        Patient.name,
+        Doctor.name,
+        bill_model.category,
+        bill_model.total_amount,
+        bill_model.discount_amount if bill_model is OPBill else null(),
+        bill_model.net_amount,
+    ).select_from(bill_model).outerjoin(
+        Patient, bill_model.patient_id == Patient.id
+    ).outerjoin(
+        Doctor, bill_model.doctor_id == Doctor.id
+    ).where(
+        bill_model.bill_day >= start_date,
+        bill_model.bill_day <= end_date
+    )
+    if doctor_id is not None:
+        statement = statement.where(bill_model.doctor_id == doctor_id)
+    if department:
+        statement = statement.where(
+            select(item_model.id).where(
+                item_model.bill_id == bill_model.id,
+                item_model.department == department
+            ).exists()
+        )
+    return statement.order_by(bill_model.bill_day, bill_model.id)
+
+
+def _item_statement(bill_model, bill_type: str, start_date, end_date, doctor_id, department):
+    is_op = bill_model is OPBill
+    item_model = OPBillItem if is_op else IPBillItem
+    # Same attribution as particular_daily_stats: OP items carry their own
+    # doctor, IP items take the bill's
+    item_doctor_id = item_model.doctor_id if is_op else bill_model.doctor_id
+    item_doctor = aliased(Doctor)
+    particular_id = cast(item_model.particular, Integer)
+
+    statement = select(
+        literal(bill_type),
+        bill_model.bill_number,
+        bill_model.bill_date,
+        bill_model.bill_day,
+        Patient.op_number,
+        Patient.name,
+        particular_id,
+        func.coalesce(Particular.name, item_model.particular),
+        item_model.department,
+        item_doctor.name,
+        item_model.unit if is_op else null(),
+        item_model.rate if is_op else null(),
+        item_model.amount,
+        item_model.discount_amount,
+        item_model.total,
+    ).select_from(bill_model).join(
+        item_model, item_model.bill_id == bill_model.id
+    ).outerjoin(
+        Patient, bill_model.patient_id == Patient.id
+    ).outerjoin(
+        item_doctor, item_doctor_id == item_doctor.id
+    ).outerjoin(
+        Particular, Particular.id == particular_id
+    ).where(
+        bill_model.bill_day >= start_date,
+        bill_model.bill_day <= end_date
+    )
+    if doctor_id is not None:
+        statement = statement.where(item_doctor_id == doctor_id)
+    if department:
+        statement = statement.where(item_model.department == department)
+    return statement.order_by(bill_model.bill_day, bill_model.id, item_model.id)
+
+
+def _export(build, name: str, header, bill_type: BillType, export_format: ExportFormat,
+            start_date: date, end_date: date, doctor_id, department):
+    statements = []
+    if bill_type in (BillType.all, BillType.op):
+        statements.append(build(OPBill, "OP", start_date, end_date, doctor_id, department))
+    if bill_type in (BillType.all, BillType.ip):
+        statements.append(build(IPBill, "IP", start_date, end_date, doctor_id, department))
+
+    rows = stream_rows(ReadSessionLocal, statements, start_date, end_date)
+    if export_format is ExportFormat.xlsx:
+        body = xlsx_stream(header, rows, sheet_name=name)
+    else:
+        body = csv_stream(header, rows)
+
+    filename = f"{name}_{start_date.isoformat()}_{end_date.isoformat()}.{export_format.value}"
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+@router.get("/bills")
+def export_bills(
+    format: ExportFormat = ExportFormat.csv,
+    bill_type: BillType = BillType.all,
+    start_date: date = Query(default_factory=lambda: date.today() - timedelta(days=30)),
+    end_date: date = Query(default_factory=date.today),
+    doctor_id: Optional[int] = None,
+    department: Optional[str] = Query(None, description="Only bills with an item in this department"),
+    current_user = Depends(get_current_user)
+):
+    """
+    Stream OP/IP bills for a date range as CSV or XLSX, one row per bill,
+    ordered by day. Rows are read and written one at a time, so the size of
+    the range doesn't affect the backend's memory.
+    """
+    return _export(
+        _bill_statement, "bills", BILL_COLUMNS, bill_type, format,
+        start_date, end_date, doctor_id, department
+    )
+
+
+@router.get("/bill-items")
+def export_bill_items(
+    format: ExportFormat = ExportFormat.csv,
+    bill_type: BillType = BillType.all,
+    start_date: date = Query(default_factory=lambda: date.today() - timedelta(days=30)),
+    end_date: date = Query(default_factory=date.today),
+    doctor_id: Optional[int] = None,
+    department: Optional[str] = None,
+    current_user = Depends(get_current_user)
+):
+    """
+    Stream OP/IP bill items for a date range as CSV or XLSX, one row per
+    item with its bill, patient, particular name and doctor.
+    """
+    return _export(
+        _item_statement, "bill_items", ITEM_COLUMNS, bill_type, format,
+        start_date, end_date, doctor_id, department
+    )
+
+
+@router.post("/parquet")
+def export_parquet(current_user = Depends(get_current_admin)):
+    """
+    Append OP/IP bill items saved since the last run (archived years
+    included) to the Parquet snapshot in the analytics directory,
+    partitioned by month. Needs pyarrow; one run at a time.
+    """
+    if not analytics.arrow_available():
+        raise HTTPException(status_code=501, detail="Parquet export needs pyarrow installed on the server")
+    try:
+        return analytics.export_bill_items(read_engine, engine, settings.analytics_path)
+    except analytics.ExportRunning as e:
+        raise HTTPException(status_code=409, detail=str(e))
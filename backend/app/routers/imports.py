@@ -0,0 +1,82 @@
+import csv
+import io
+from enum import Enum
+from typing import Optional
+
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from sqlalchemy.orm import Session
+
+from database import engine, get_read_db, sequences
+from .auth import get_current_admin
+from ..core.importer import DEFAULT_BATCH_SIZE, format_of, import_records, read_records
+from ..models import ImportJob
+
+router = APIRouter(prefix="/imports", tags=["imports"])
+
+
+class ImportKind(str, Enum):
+    patients = "patients"
+    op_bills = "op-bills"
+    ip_bills = "ip-bills"
+
+
+class ImportFormat(str, Enum):
+    csv = "csv"
+    ndjson = "ndjson"
+
+
+@router.get("")
+def get_import_jobs(
+    db: Session = Depends(get_read_db),
+    current_user = Depends(get_current_admin)
+):
+    """
+    List import jobs with their progress, latest first
+    """
+    jobs = db.query(ImportJob).order_by(ImportJob.updated_at.desc()).all()
+    return [
+        {
+            "job": job.job,
+            "kind": job.kind,
+            "records_done": job.records_done,
+            "imported": job.imported,
+            "rejected": job.rejected,
+            "started_at": job.started_at,
+            "updated_at": job.updated_at,
+            "finished_at": job.finished_at,
+        }
+        for job in jobs
+    ]
+
+
+@router.post("/{kind}")
+def import_file(
+    kind: ImportKind,
+    file: UploadFile = File(...),
+    format: Optional[ImportFormat] = Query(None, description="Default: from the file extension"),
+    job: Optional[str] = Query(None, description="Resume key, default: <kind>:<file name>"),
+    batch_size: int = Query(DEFAULT_BATCH_SIZE, ge=1, le=50000),
+    current_user = Depends(get_current_admin)
+):
+    """
+    Import legacy patients or OP/IP bills from a CSV or NDJSON file, keeping
+    their numbers and dates. Uploading the same file again (same job)
+    continues after the records already imported or rejected.
+    """
+    filename = file.filename or kind.value
+    source = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        records = read_records(source, kind.value, format.value if format else format_of(filename))
+        return import_records(
+            engine, kind.value, records,
+            job=job or f"{kind.value}:{filename}",
+            batch_size=batch_size,
+            created_by=current_user.full_name,
+            sequences=sequences
+        )
+    except (ValueError, csv.Error) as e:
+        # Unreadable file (bad CSV/JSON line) or a job of another kind;
+        # chunks committed before it stay imported
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        source.detach()
@@ -0,0 +1,18 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import Response
+
+from ..core.config import settings
+from ..core.metrics import CONTENT_TYPE, registry
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """
+    Prometheus scrape endpoint. Async on purpose: it only reads in-memory
+    counters, and still answers when every worker thread is busy.
+    """
+    if not settings.metrics_enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
@@ -1,32 +1,26 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Response
+from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
-from datetime import datetime
-import random
 
-from database import get_db
+from database import get_db, get_read_db, sequences
 from .auth import get_current_user
+from ..core.pagination import paginate, set_page_headers
+from ..core.responses import encoded_response
+from ..core.rollups import daily_stats_total, record_daily_stats
+from ..core.search import lookup_patients, search_patients
 from ..models import Patient, Doctor
 from ..schemas import PatientCreate, PatientResponse
 
 router = APIRouter(prefix="/patients", tags=["patients"])
 
 def generate_op_number():
-    current_date = datetime.now()
-    year_month = current_date.strftime("%Y%m")
-    # In real implementation, you would query the database for the last number
-    sequence = random.randint(1, 999999)
-    return f"{year_month}-{sequence:06d}"
+    return sequences.next_number("op_number")
 
 def generate_ip_number():
-    current_date = datetime.now()
-    year_month = current_date.strftime("%Y%m")
-    sequence = random.randint(1, 999999)
-    return f"{year_month}-{sequence:06d}"
+    return sequences.next_number("ip_number")
 
 @router.post("/", response_model=PatientResponse)
-async def create_patient(
+def create_patient(
     patient_data: PatientCreate,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
@@ -50,6 +44,8 @@ async def create_patient(
     )
     
     db.add(db_patient)
+    db.flush()
+    record_daily_stats(db, db_patient.registration_day, db_patient.doctor_id, patients_registered=1)
     db.commit()
     db.refresh(db_patient)
     
@@ -60,15 +56,22 @@ async def create_patient(
     return response
 
 @router.get("/", response_model=List[PatientResponse])
-async def get_patients(
-    skip: int = 0,
-    limit: int = 100,
+def get_patients(
+    response: Response,
+    cursor: Optional[str] = None,
+    skip: int = Query(0, ge=0, deprecated=True, description="Use cursor instead"),
+    limit: int = Query(100, ge=1, le=1000),
     search: Optional[str] = None,
     is_ip: Optional[bool] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
-    query = db.query(Patient)
+    """
+    Patients, newest first. Follow X-Next-Cursor for the next page; skip
+    still works but costs more the deeper it goes.
+    """
+    # Doctor names come in the same query instead of one lazy load per row
+    query = db.query(Patient).options(joinedload(Patient.doctor))
     
     if search:
         query = query.filter(
@@ -81,22 +84,39 @@ async def get_patients(
     if is_ip is not None:
         query = query.filter(Patient.is_ip == is_ip)
     
-    patients = query.offset(skip).limit(limit).all()
+    patients, next_cursor = paginate(query, [Patient.id], cursor, limit, offset=skip)
+    # The rollup counts every registration; filtered lists have no cheap total
+    total_estimate = None if search or is_ip is not None else daily_stats_total(db, "patients_registered")
+    set_page_headers(response, next_cursor, total_estimate)
     
     # Add doctor names to response
-    response = []
+    results = []
     for patient in patients:
         patient_dict = PatientResponse.from_orm(patient).dict()
         if patient.doctor:
             patient_dict["doctor_name"] = patient.doctor.name
-        response.append(PatientResponse(**patient_dict))
+        results.append(PatientResponse(**patient_dict))
     
-    return response
+    return results
+
+@router.get("/lookup/{fragment}")
+def lookup_by_number_fragment(
+    fragment: str = Path(..., min_length=3),
+    is_ip: Optional[bool] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_read_db),
+    current_user = Depends(get_current_user)
+):
+    """
+    Patients whose phone, OP number or IP number contains fragment, e.g. the
+    last four digits of a phone number. Newest first.
+    """
+    return encoded_response(lookup_patients(db, fragment, is_ip, limit))
 
 # @router.get("/{patient_id}", response_model=PatientResponse)
 # async def get_patient(
 #     patient_id: int,
-#     db: Session = Depends(get_db),
+#     db: Session = Depends(get_read_db),
 #     current_user = Depends(get_current_user)
 # ):
 #     patient = db.query(Patient).filter(Patient.id == patient_id).first()
@@ -112,7 +132,7 @@ async def get_patients(
 # @router.get("/search/op/{op_number}")
 # async def search_by_op_number(
 #     op_number: str,
-#     db: Session = Depends(get_db)
+#     db: Session = Depends(get_read_db)
 # ):
 #     patient = db.query(Patient).filter(Patient.op_number == op_number).first()
 #     if not patient:
@@ -127,50 +147,28 @@ async def get_patients(
 @router.get("/search/op/{searchtext}")
 def search_op_by_searchtext(
     searchtext: str,
-    db: Session = Depends(get_db)
+    limit: int = Query(20, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_read_db)
 ):
-    patients = db.query(Patient).filter(
-        or_(
-            Patient.name.contains(searchtext),
-            Patient.complaint.contains(searchtext),
-            Patient.house.contains(searchtext),
-            Patient.street.contains(searchtext),
-            Patient.place.contains(searchtext),
-            Patient.phone.contains(searchtext),
-            Patient.referred_by.contains(searchtext),
-            Patient.room.contains(searchtext),
-            Patient.op_number.contains(searchtext),
-        ),
-        ~Patient.is_ip
-    ).all()
+    patients = search_patients(db, searchtext, is_ip=False, limit=limit, offset=offset)
 
     if not patients:
         raise HTTPException(status_code=404, detail="Patient not found")
 
-    return patients
+    return encoded_response(patients)
 
 
 @router.get("/search/ip/{searchtext}")
 def search_ip_by_searchtext(
     searchtext: str,
-    db: Session = Depends(get_db)
+    limit: int = Query(20, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    db: Session = Depends(get_read_db)
 ):
-    patients = db.query(Patient).filter(
-        or_(
-            Patient.name.contains(searchtext),
-            Patient.complaint.contains(searchtext),
-            Patient.house.contains(searchtext),
-            Patient.street.contains(searchtext),
-            Patient.place.contains(searchtext),
-            Patient.phone.contains(searchtext),
-            Patient.referred_by.contains(searchtext),
-            Patient.room.contains(searchtext),
-            Patient.ip_number.contains(searchtext),
-        ),
-        Patient.is_ip
-    ).all()
+    patients = search_patients(db, searchtext, is_ip=True, limit=limit, offset=offset)
 
     if not patients:
         raise HTTPException(status_code=404, detail="Patient not found")
 
-    return patients
\ No newline at end of file
+    return encoded_response(patients)
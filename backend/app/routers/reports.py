@@ -1,102 +1,124 @@
 from fastapi import APIRouter, Depends, Query, HTTPException
 from sqlalchemy.orm import Session, joinedload
 from typing import List, Optional
+from contextlib import nullcontext
 from datetime import datetime, date, timedelta
 from sqlalchemy import func, or_, cast, Integer
 
-from database import get_db
+from database import get_read_db
 from .auth import get_current_user
-from ..models import Patient, OPBill, IPBill, OPBillItem, IPBillItem, Doctor
+from ..core.archive import archive_reads
+from ..core.pagination import page_response, paginate
+from ..core.responses import encoded_response
+from ..core.rollups import daily_stats_total
+from ..models import Patient, OPBill, IPBill, OPBillItem, IPBillItem, Doctor, ParticularDailyStat
 
 router = APIRouter(prefix="/reports", tags=["reports"])
 
 @router.get("/daily-op")
-async def get_daily_op_report(
+def get_daily_op_report(
     report_date: date = Query(default_factory=date.today),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; all bills if omitted"),
+    db: Session = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
     """
-    Get daily OP bill report for a specific date
+    Get daily OP bill report for a specific date, newest first
     """
-    bills = db.query(OPBill).filter(
-        func.date(OPBill.bill_date) == report_date
-    ).options(
-        joinedload(OPBill.patient),
-        joinedload(OPBill.doctor)
-    ).all()
+    with archive_reads(db, report_date, report_date):
+        query = db.query(OPBill).filter(
+            OPBill.bill_day == report_date
+        ).options(
+            joinedload(OPBill.patient),
+            joinedload(OPBill.doctor)
+        )
+        bills, next_cursor = paginate(query, [OPBill.id], cursor, limit)
     
-    return bills
+    return page_response(
+        bills, next_cursor, daily_stats_total(db, "op_bills", report_date, report_date)
+    )
 
 @router.get("/bill-summary")
-async def get_bill_summary(
+def get_bill_summary(
     start_date: date = Query(default_factory=lambda: date.today() - timedelta(days=7)),
     end_date: date = Query(default_factory=date.today),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
     """
     Get billing summary between two dates
     """
-    op_bills = db.query(OPBill).filter(
-        func.date(OPBill.bill_date) >= start_date,
-        func.date(OPBill.bill_date) <= end_date
-    ).options(
-        joinedload(OPBill.patient),
-        joinedload(OPBill.doctor)
-    ).all()
-    
-    ip_bills = db.query(IPBill).filter(
-        func.date(IPBill.bill_date) >= start_date,
-        func.date(IPBill.bill_date) <= end_date
-    ).options(
-        joinedload(IPBill.patient),
-        joinedload(IPBill.doctor)
-    ).all()
+    with archive_reads(db, start_date, end_date):
+        op_bills = db.query(OPBill).filter(
+            OPBill.bill_day >= start_date,
+            OPBill.bill_day <= end_date
+        ).options(
+            joinedload(OPBill.patient),
+            joinedload(OPBill.doctor)
+        ).all()
+        
+        ip_bills = db.query(IPBill).filter(
+            IPBill.bill_day >= start_date,
+            IPBill.bill_day <= end_date
+        ).options(
+            joinedload(IPBill.patient),
+            joinedload(IPBill.doctor)
+        ).all()
     
-    return {
+    return encoded_response({
         "op_bills": op_bills,
         "ip_bills": ip_bills,
         "total_op_amount": sum(bill.net_amount or 0 for bill in op_bills),
         "total_ip_amount": sum(bill.net_amount or 0 for bill in ip_bills),
         "total_amount": sum(bill.net_amount or 0 for bill in op_bills + ip_bills)
-    }
+    })
 
 @router.get("/patient-list")
-async def get_patient_list(
+def get_patient_list(
     start_date: date = Query(default_factory=lambda: date.today() - timedelta(days=30)),
     end_date: date = Query(default_factory=date.today),
     is_ip: bool = Query(None),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; all patients if omitted"),
+    db: Session = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
     """
-    Get patient list within date range
+    Get patient list within date range, newest first
     """
     query = db.query(Patient).filter(
-        func.date(Patient.registration_date) >= start_date,
-        func.date(Patient.registration_date) <= end_date
+        Patient.registration_day >= start_date,
+        Patient.registration_day <= end_date
     )
     
     if is_ip is not None:
         query = query.filter(Patient.is_ip == is_ip)
     
-    patients = query.all()
-    return patients
+    patients, next_cursor = paginate(query, [Patient.registration_day, Patient.id], cursor, limit)
+    total_estimate = None
+    if is_ip is None:
+        total_estimate = daily_stats_total(db, "patients_registered", start_date, end_date)
+    return page_response(patients, next_cursor, total_estimate)
 
 @router.get("/particulars-report")
-async def get_particulars_report(
+def get_particulars_report(
     particular_id: int = Query(..., description="Particular ID"),
     start_date: date = Query(default_factory=lambda: date.today() - timedelta(days=30)),
     end_date: date = Query(default_factory=date.today),
     include_op: bool = Query(True, description="Include OP bills"),
     include_ip: bool = Query(True, description="Include IP bills"),
     group_by_patient: bool = Query(False, description="Group results by patient"),
-    db: Session = Depends(get_db),
+    include_details: bool = Query(False, description="Include the individual bill items"),
+    db: Session = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
     """
     Generate report for specific medical particulars (e.g., X-RAY, ECG, Blood Test).
+
+    Totals and summaries come from the particular_daily_stats rollup; the
+    per-item detail rows are only queried when include_details (or
+    group_by_patient) is set.
     """
     
     if not include_op and not include_ip:
@@ -155,89 +177,64 @@ async def get_particulars_report(
         
         return detail
     
-    # ========== OP BILL ITEMS ==========
-    if include_op:
-        op_query = db.query(OPBillItem, OPBill, Patient).join(
-            OPBill, OPBillItem.bill_id == OPBill.id
-        ).join(
-            Patient, OPBill.patient_id == Patient.id
-        )
+    fetch_details = include_details or group_by_patient
+
+    # Detail rows come from the bill tables, which may reach into archived years
+    with archive_reads(db, start_date, end_date) if fetch_details else nullcontext():
+        # ========== OP BILL ITEMS ==========
+        if include_op and fetch_details:
+            op_query = db.query(OPBillItem, OPBill, Patient).join(
+                OPBill, OPBillItem.bill_id == OPBill.id
+            ).join(
+                Patient, OPBill.patient_id == Patient.id
+            )
         
-        op_query = op_query.filter(
-            cast(OPBillItem.particular, Integer) == particular_id,
-            func.date(OPBill.bill_date) >= start_date,
-            func.date(OPBill.bill_date) <= end_date
-        )
+            op_query = op_query.filter(
+                cast(OPBillItem.particular, Integer) == particular_id,
+                OPBill.bill_day >= start_date,
+                OPBill.bill_day <= end_date
+            )
         
-        op_items = op_query.order_by(OPBill.bill_date.desc()).all()
+            op_items = op_query.order_by(OPBill.bill_day.desc(), OPBill.bill_date.desc()).all()
         
-        for item, bill, patient in op_items:
-            op_detail = create_bill_item_detail(item, bill, patient, "OP")
-            results["op_details"].append(op_detail)
-            results["total_count"] += 1
-            results["total_amount"] += op_detail["total"]
+            for item, bill, patient in op_items:
+                op_detail = create_bill_item_detail(item, bill, patient, "OP")
+                results["op_details"].append(op_detail)
     
-    # ========== IP BILL ITEMS ==========
-    if include_ip:
-        ip_query = db.query(IPBillItem, IPBill, Patient).join(
-            IPBill, IPBillItem.bill_id == IPBill.id
-        ).join(
-            Patient, IPBill.patient_id == Patient.id
-        )
+        # ========== IP BILL ITEMS ==========
+        if include_ip and fetch_details:
+            ip_query = db.query(IPBillItem, IPBill, Patient).join(
+                IPBill, IPBillItem.bill_id == IPBill.id
+            ).join(
+                Patient, IPBill.patient_id == Patient.id
+            )
         
-        ip_query = ip_query.filter(
-            cast(IPBillItem.particular, Integer) == particular_id,
-            func.date(IPBill.bill_date) >= start_date,
-            func.date(IPBill.bill_date) <= end_date
-        )
+            ip_query = ip_query.filter(
+                cast(IPBillItem.particular, Integer) == particular_id,
+                IPBill.bill_day >= start_date,
+                IPBill.bill_day <= end_date
+            )
         
-        ip_items = ip_query.order_by(IPBill.bill_date.desc()).all()
+            ip_items = ip_query.order_by(IPBill.bill_day.desc(), IPBill.bill_date.desc()).all()
         
-        for item, bill, patient in ip_items:
-            ip_detail = create_bill_item_detail(item, bill, patient, "IP")
-            results["ip_details"].append(ip_detail)
-            results["total_count"] += 1
-            results["total_amount"] += ip_detail["total"]
+            for item, bill, patient in ip_items:
+                ip_detail = create_bill_item_detail(item, bill, patient, "IP")
+                results["ip_details"].append(ip_detail)
     
     # ========== SUMMARY BY DATE ==========
-    # OP summary by date
-    op_summary = db.query(
-        func.date(OPBill.bill_date).label("date"),
-        func.count(OPBillItem.id).label("count"),
-        func.sum(OPBillItem.total).label("total_amount")
-    ).join(OPBillItem, OPBill.id == OPBillItem.bill_id
+    daily_rows = db.query(
+        ParticularDailyStat.day,
+        ParticularDailyStat.bill_type,
+        func.sum(ParticularDailyStat.item_count),
+        func.sum(ParticularDailyStat.total)
     ).filter(
-        cast(OPBillItem.particular, Integer) == particular_id,
-        func.date(OPBill.bill_date) >= start_date,
-        func.date(OPBill.bill_date) <= end_date
-    ).group_by(func.date(OPBill.bill_date)).all()
+        ParticularDailyStat.particular_id == particular_id,
+        ParticularDailyStat.day >= start_date,
+        ParticularDailyStat.day <= end_date
+    ).group_by(ParticularDailyStat.day, ParticularDailyStat.bill_type).all()
     
-    # IP summary by date
-    ip_summary = db.query(
-        func.date(IPBill.bill_date).label("date"),
-        func.count(IPBillItem.id).label("count"),
-        func.sum(IPBillItem.total).label("total_amount")
-    ).join(IPBillItem, IPBill.id == IPBillItem.bill_id
-    ).filter(
-        cast(IPBillItem.particular, Integer) == particular_id,
-        func.date(IPBill.bill_date) >= start_date,
-        func.date(IPBill.bill_date) <= end_date
-    ).group_by(func.date(IPBill.bill_date)).all()
-    
-    # Combine summaries
     summary_dict = {}
-    for date_val, count, amount in op_summary:
-        if date_val not in summary_dict:
-            summary_dict[date_val] = {
-                "date": date_val, 
-                "op_count": 0, 
-                "ip_count": 0, 
-                "total_amount": 0.0
-            }
-        summary_dict[date_val]["op_count"] = count or 0
-        summary_dict[date_val]["total_amount"] += float(amount or 0)
-    
-    for date_val, count, amount in ip_summary:
+    for date_val, bill_type, count, amount in daily_rows:
         if date_val not in summary_dict:
             summary_dict[date_val] = {
                 "date": date_val, 
@@ -245,8 +242,15 @@ async def get_particulars_report(
                 "ip_count": 0, 
                 "total_amount": 0.0
             }
-        summary_dict[date_val]["ip_count"] = count or 0
+        if bill_type == "OP":
+            summary_dict[date_val]["op_count"] = count or 0
+        else:
+            summary_dict[date_val]["ip_count"] = count or 0
         summary_dict[date_val]["total_amount"] += float(amount or 0)
+        
+        if (bill_type == "OP" and include_op) or (bill_type == "IP" and include_ip):
+            results["total_count"] += count or 0
+            results["total_amount"] += float(amount or 0)
     
     results["summary_by_date"] = sorted(summary_dict.values(), key=lambda x: x["date"], reverse=True)
     
@@ -254,14 +258,14 @@ async def get_particulars_report(
     # OP by doctor
     op_doctor_summary = db.query(
         Doctor.name.label("doctor_name"),
-        func.count(OPBillItem.id).label("count"),
-        func.sum(OPBillItem.total).label("total_amount")
-    ).join(OPBillItem, Doctor.id == OPBillItem.doctor_id
-    ).join(OPBill, OPBillItem.bill_id == OPBill.id
+        func.sum(ParticularDailyStat.item_count).label("count"),
+        func.sum(ParticularDailyStat.total).label("total_amount")
+    ).join(Doctor, Doctor.id == ParticularDailyStat.doctor_id
     ).filter(
-        cast(OPBillItem.particular, Integer) == particular_id,
-        func.date(OPBill.bill_date) >= start_date,
-        func.date(OPBill.bill_date) <= end_date
+        ParticularDailyStat.particular_id == particular_id,
+        ParticularDailyStat.bill_type == "OP",
+        ParticularDailyStat.day >= start_date,
+        ParticularDailyStat.day <= end_date
     ).group_by(Doctor.name).all()
     
     results["summary_by_doctor"] = [
@@ -298,13 +302,13 @@ async def get_particulars_report(
         
         results["grouped_by_patient"] = list(patient_summary.values())
     
-    return results
+    return encoded_response(results)
 
 @router.get("/particulars-list")
-async def get_available_particulars(
+def get_available_particulars(
     search: str = Query("", description="Search particular names"),
     limit: int = Query(50, description="Max number of results"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
     """
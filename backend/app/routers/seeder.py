@@ -1,10 +1,15 @@
+import logging
 import random
 from datetime import date, timedelta
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from sqlalchemy.exc import SQLAlchemyError
 
-from database import SessionLocal
+from database import SessionLocal, engine, sequences
 from ..models.models import Doctor, Patient, OPBill, OPBillItem, IPBill, IPBillItem
+from ..core.rollups import rebuild_rollups
+from ..core.synthetic import DEFAULT_END_DATE, generate
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/seed", tags=["Data Seeder"])
 
@@ -458,7 +463,7 @@ PATIENTS_DATA = [
 ]
 
 @router.post("/all", summary="Insert all dummy data")
-async def insert_all_dummy_data():
+def insert_all_dummy_data():
     """
     Insert dummy data for:
     1. Doctors (10 records)
@@ -480,7 +485,7 @@ async def insert_all_dummy_data():
         # db.commit()
         
         # Step 2: Insert Doctors
-        print("Inserting doctors...")
+        logger.info("Inserting doctors...")
         doctors_objects = []
         for doc_data in DOCTORS_DATA:
             doctor = Doctor(**doc_data)
@@ -488,7 +493,7 @@ async def insert_all_dummy_data():
         
         db.bulk_save_objects(doctors_objects)
         db.commit()
-        print("✅ 10 doctors inserted successfully")
+        logger.info("10 doctors inserted")
         
         # Step 3: Get doctor IDs for patient assignment
         doctor_ids = [d.id for d in db.query(Doctor.id).all()]
@@ -496,7 +501,7 @@ async def insert_all_dummy_data():
             raise HTTPException(status_code=500, detail="No doctors found after insertion")
         
         # Step 4: Insert Patients
-        print("Inserting patients...")
+        logger.info("Inserting patients...")
         patients_objects = []
         for patient_data in PATIENTS_DATA:
             patient = Patient(
@@ -507,7 +512,7 @@ async def insert_all_dummy_data():
         
         db.bulk_save_objects(patients_objects)
         db.commit()
-        print("✅ 18 patients inserted successfully")
+        logger.info("18 patients inserted")
         
         # Step 5: Get patient and doctor IDs for bills
         all_patients = db.query(Patient).all()
@@ -523,7 +528,7 @@ async def insert_all_dummy_data():
             raise HTTPException(status_code=500, detail="No doctors found")
         
         # Step 6: Insert OP Bills
-        print("Inserting OP bills...")
+        logger.info("Inserting OP bills...")
         start_date = date(2025, 12, 1)
         
         for i in range(25):
@@ -555,10 +560,10 @@ async def insert_all_dummy_data():
                 )
                 db.add(item)
         
-        print("✅ 25 OP bills inserted")
+        logger.info("25 OP bills inserted")
         
         # Step 7: Insert IP Bills
-        print("Inserting IP bills...")
+        logger.info("Inserting IP bills...")
         
         for i in range(25):
             patient = ip_patients[i % len(ip_patients)]
@@ -597,7 +602,10 @@ async def insert_all_dummy_data():
                 db.add(item)
         
         db.commit()
-        print("✅ 25 IP bills inserted")
+        logger.info("25 IP bills inserted")
+
+        # bulk_save_objects bypasses the routers, so refresh the report rollups
+        rebuild_rollups(db)
         
         # Final summary
         total_doctors = db.query(Doctor).count()
@@ -631,8 +639,32 @@ async def insert_all_dummy_data():
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 
+@router.post("/scale", summary="Generate synthetic data at benchmark scale")
+def insert_synthetic_data(
+    patients: int = Query(100_000, ge=1),
+    bills: int = Query(500_000, ge=0),
+    years: float = Query(5, gt=0, le=20),
+    doctors: int = Query(25, ge=1, le=500),
+    seed: int = 42,
+    workers: int = Query(1, ge=1, le=32, description="Generator processes; writes stay on one connection"),
+    end_date: date = Query(DEFAULT_END_DATE, description="Last day of the generated timeline")
+):
+    """
+    Fill an empty database with years of realistic OP/IP activity (weekly
+    and seasonal patterns, outbreaks, doctor popularity). The same seed
+    and end date give the same data. 1M patients and 5M bills take a few minutes; the
+    command line (python -m app.core.synthetic) does the same without
+    holding a request open.
+    """
+    try:
+        return generate(engine, patients, bills, years, doctors, seed, workers,
+                        sequences=sequences, end_date=end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.post("/doctors", summary="Insert dummy doctors only")
-async def insert_doctors_only():
+def insert_doctors_only():
     """Insert only the 10 dummy doctors."""
     db = SessionLocal()
     try:
@@ -658,7 +690,7 @@ async def insert_doctors_only():
 
 
 @router.post("/patients", summary="Insert dummy patients only")
-async def insert_patients_only():
+def insert_patients_only():
     """Insert only the 18 dummy patients (requires doctors to exist)."""
     db = SessionLocal()
     try:
@@ -676,6 +708,7 @@ async def insert_patients_only():
         
         db.bulk_save_objects(patients_objects)
         db.commit()
+        rebuild_rollups(db)
         
         total = db.query(Patient).count()
         db.close()
@@ -691,7 +724,7 @@ async def insert_patients_only():
 
 
 @router.post("/clear-all", summary="Clear all data (DANGER)")
-async def clear_all_data():
+def clear_all_data():
     """⚠️ WARNING: Deletes ALL data from all tables."""
     db = SessionLocal()
     try:
@@ -702,6 +735,7 @@ async def clear_all_data():
         db.query(Patient).delete()
         db.query(Doctor).delete()
         db.commit()
+        rebuild_rollups(db)
         db.close()
         
         return {
@@ -4,7 +4,7 @@ from sqlalchemy.orm import Session
 from typing import List, Optional
 from datetime import datetime
 
-from database import get_db
+from database import get_db, get_read_db
 from .auth import get_current_user
 from ..models import Base, Department, Particular
 from ..schemas import DepartmentCreate, DepartmentResponse, ParticularCreate, ParticularResponse #, ParticularUpdate
@@ -13,8 +13,8 @@ router = APIRouter(prefix="/settings", tags=["settings"])
 
 # Departments CRUD (unchanged)
 @router.get("/departments", response_model=List[DepartmentResponse])
-async def get_departments(
-    db: Session = Depends(get_db),
+def get_departments(
+    db: Session = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
     """
@@ -23,7 +23,7 @@ async def get_departments(
     return db.query(Department).order_by(Department.name).all()
 
 @router.post("/departments", response_model=DepartmentResponse)
-async def create_department(
+def create_department(
     department: DepartmentCreate,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
@@ -43,7 +43,7 @@ async def create_department(
     return db_department
 
 @router.delete("/departments/{department_id}")
-async def delete_department(
+def delete_department(
     department_id: int,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
@@ -61,8 +61,8 @@ async def delete_department(
 
 # Particulars CRUD (Modified to be independent)
 @router.get("/particulars", response_model=List[ParticularResponse])
-async def get_particulars(
-    db: Session = Depends(get_db),
+def get_particulars(
+    db: Session = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
     """
@@ -72,8 +72,8 @@ async def get_particulars(
     return db.query(Particular).order_by(Particular.sortorder, Particular.name).all()
 
 @router.get("/particulars/opdefaults", response_model=List[ParticularResponse])
-async def get_op_default_particulars(
-    db: Session = Depends(get_db),
+def get_op_default_particulars(
+    db: Session = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
     """
@@ -82,8 +82,8 @@ async def get_op_default_particulars(
     return db.query(Particular).filter(Particular.opdefault == True).order_by(Particular.sortorder, Particular.name).all()
 
 @router.get("/particulars/ipdefaults", response_model=List[ParticularResponse])
-async def get_ip_default_particulars(
-    db: Session = Depends(get_db),
+def get_ip_default_particulars(
+    db: Session = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
     """
@@ -92,7 +92,7 @@ async def get_ip_default_particulars(
     return db.query(Particular).filter(Particular.ipdefault == True).order_by(Particular.sortorder, Particular.name).all()
 
 @router.post("/particulars", response_model=ParticularResponse)
-async def create_particular(
+def create_particular(
     particular: ParticularCreate,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
@@ -149,7 +149,7 @@ async def create_particular(
 #     return db_particular
 
 @router.delete("/particulars/{particular_id}")
-async def delete_particular(
+def delete_particular(
     particular_id: int,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
@@ -166,8 +166,8 @@ async def delete_particular(
     return {"message": "Particular deleted successfully"}
 
 @router.get("/stats")
-async def get_settings_stats(
-    db: Session = Depends(get_db),
+def get_settings_stats(
+    db: Session = Depends(get_read_db),
     current_user = Depends(get_current_user)
 ):
     """
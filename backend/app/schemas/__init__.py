@@ -5,6 +5,7 @@ from .schemas import (
     PatientCreate, PatientResponse,
     OPBillCreate, OPBillResponse,
     IPBillCreate, IPBillResponse,
+    PatientImport, OPBillImport, IPBillImport,
     DashboardStats,
     OPBillItemCreate, OPBillItemResponse,
     IPBillItemCreate, IPBillItemResponse,
@@ -19,6 +20,7 @@ __all__ = [
     "PatientCreate", "PatientResponse",
     "OPBillCreate", "OPBillResponse",
     "IPBillCreate", "IPBillResponse",
+    "PatientImport", "OPBillImport", "IPBillImport",
     "DashboardStats",
     "OPBillItemCreate", "OPBillItemResponse",
     "IPBillItemCreate", "IPBillItemResponse",
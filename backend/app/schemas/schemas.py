@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, model_validator
 from typing import Optional, List
 from datetime import datetime,date
 
@@ -200,6 +200,36 @@ class IPBillResponse(BaseModel):
     class Config:
         from_attributes = True
 
+# Bulk import schemas (app/core/importer.py). Legacy records keep their
+# own numbers and dates; bills name their patient by id or OP number.
+class PatientImport(PatientBase):
+    op_number: str
+    ip_number: Optional[str] = None
+    is_ip: bool = False
+    registration_date: Optional[datetime] = None
+    created_by: Optional[str] = None
+
+class _BillImport(BaseModel):
+    @model_validator(mode="after")
+    def check_patient(self):
+        if self.patient_id is None and not self.op_number:
+            raise ValueError("patient_id or op_number is required")
+        return self
+
+class OPBillImport(_BillImport, OPBillCreate):
+    bill_number: str
+    bill_date: datetime
+    patient_id: Optional[int] = None
+    op_number: Optional[str] = None
+    created_by: Optional[str] = None
+
+class IPBillImport(_BillImport, IPBillCreate):
+    bill_number: str
+    bill_date: datetime
+    patient_id: Optional[int] = None
+    op_number: Optional[str] = None
+    created_by: Optional[str] = None
+
 # Dashboard Schemas
 class DashboardStats(BaseModel):
     total_patients_today: int
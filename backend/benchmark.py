@@ -0,0 +1,1415 @@
+"""
+Endpoint benchmark against a throwaway seeded database.
+
+Every run gets its own temporary HMS data directory, so nothing touches the
+real hms_lite.db in LOCALAPPDATA.
+
+    python benchmark.py --profile performance
+    python benchmark.py --compare default performance
+    python benchmark.py --under-load --check
+    python benchmark.py --explain
+    python benchmark.py --patients 500000 --search --check
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        "runs": len(samples),
+        "mean_ms": round(statistics.mean(samples), 2),
+        "p50_ms": round(percentile(samples, 50), 2),
+        "p95_ms": round(percentile(samples, 95), 2),
+        "p99_ms": round(percentile(samples, 99), 2),
+    }
+
+
+FIRST_NAMES = (
+    "Abdul", "Ajay", "Ajith", "Akhil", "Aleena", "Amal", "Ambili", "Ammini", "Anand", "Anil",
+    "Anitha", "Anju", "Annamma", "Anoop", "Anu", "Arjun", "Aswathy", "Babu", "Beena", "Biju",
+    "Bindu", "Chandrika", "Deepa", "Deepak", "Devi", "Dileep", "Divya", "Elizabeth", "Fathima", "Gireesh",
+    "Gopal", "Gopika", "Hari", "Indira", "Jayan", "Jaya", "Jisha", "Jose", "Kavitha", "Krishnan",
+    "Kunjumon", "Lakshmi", "Latha", "Leela", "Manoj", "Mary", "Meera", "Midhun", "Mohan", "Muhammed",
+    "Nandana", "Nikhil", "Nisha", "Pradeep", "Prasad", "Preetha", "Priya", "Radha", "Rahul", "Rajan",
+    "Rajesh", "Ramesh", "Rema", "Reshma", "Rinu", "Saji", "Sajitha", "Sandhya", "Sanjay", "Santhosh",
+    "Sarala", "Shaji", "Sheeba", "Sini", "Sreeja", "Sreekumar", "Suma", "Sunil", "Suresh", "Thomas",
+)
+LAST_NAMES = (
+    "Abraham", "Antony", "Babu", "Chacko", "Chandran", "Cherian", "Das", "George", "Gopinath", "Jacob",
+    "John", "Joseph", "Kumar", "Kurian", "Kuruvilla", "Mani", "Mathew", "Menon", "Mohan", "Nair",
+    "Narayanan", "Panicker", "Paul", "Philip", "Pillai", "Prakash", "Raj", "Raghavan", "Samuel", "Sasi",
+    "Sebastian", "Thampi", "Thomas", "Unnikrishnan", "Varghese", "Varma", "Vasudevan", "Warrier", "Xavier", "Zacharia",
+)
+PLACES = (
+    "Adoor", "Alappuzha", "Aluva", "Ambalappuzha", "Angamaly", "Chengannur", "Changanassery", "Cherthala",
+    "Ettumanoor", "Haripad", "Kanjirappally", "Karunagappally", "Kayamkulam", "Kottarakkara", "Kottayam",
+    "Kollam", "Kumily", "Mallappally", "Mavelikara", "Muvattupuzha", "Pala", "Pandalam", "Pathanamthitta",
+    "Perumbavoor", "Punalur", "Ranni", "Thiruvalla", "Thodupuzha", "Thrissur", "Vaikom",
+)
+
+# Spread registrations the way a busy OP desk would, instead of cramming
+# every patient into the --days window
+PATIENTS_PER_DAY = 300
+
+
+def seed_database(engine, patients, bills, days):
+    from app.models import User, Doctor, Patient, OPBill, OPBillItem
+    from app.routers.auth import get_password_hash
+
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    registration_days = max(days, patients // PATIENTS_PER_DAY)
+
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [{
+            "username": "bench",
+            "password": get_password_hash("bench"),
+            "full_name": "Benchmark User",
+            "role": "admin",
+            "is_active": True,
+        }])
+        conn.execute(Doctor.__table__.insert(), [
+            {"code": f"BENCH-{i:02d}", "name": f"Dr Bench {i}", "booking_code": f"B{i:02d}"}
+            for i in range(1, 11)
+        ])
+        registrations = sorted(
+            now - timedelta(days=rng.randrange(registration_days), minutes=rng.randrange(1440))
+            for _ in range(patients)
+        )
+        conn.execute(Patient.__table__.insert(), [
+            {
+                "op_number": f"{registered:%Y%m}-{i:06d}",
+                "registration_date": registered,
+                "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                "age": str(rng.randint(1, 90)),
+                "gender": rng.choice(("M", "F")),
+                "complaint": "Fever",
+                "house": f"House {rng.randrange(1, 500)}",
+                "street": "Main Road",
+                "place": rng.choice(PLACES),
+                "phone": f"9{rng.randrange(10**9):09d}",
+                "doctor_id": rng.randint(1, 10),
+                "is_ip": False,
+                "created_by": "Benchmark User",
+            }
+            for i, registered in enumerate(registrations, start=1)
+        ])
+        conn.execute(OPBill.__table__.insert(), [
+            {
+                "bill_number": f"BENCH{i:08d}",
+                "bill_date": now - timedelta(days=rng.randrange(days), minutes=rng.randrange(1440)),
+                "patient_id": rng.randint(1, patients),
+                "bill_type": "OP",
+                "category": "Consultation",
+                "doctor_id": rng.randint(1, 10),
+                "total_amount": 500,
+                "discount_amount": 0,
+                "net_amount": 500,
+            }
+            for i in range(1, bills + 1)
+        ])
+        conn.execute(OPBillItem.__table__.insert(), [
+            {
+                "bill_id": i,
+                "particular": str(rng.randint(1, 20)),
+                "department": "General",
+                "unit": 1,
+                "rate": 500,
+                "amount": 500,
+                "total": 500,
+            }
+            for i in range(1, bills + 1)
+        ])
+
+    from database import SessionLocal
+    from app.core.rollups import rebuild_rollups
+    session = SessionLocal()
+    try:
+        rebuild_rollups(session)
+    finally:
+        session.close()
+
+
+def timed_requests(send, runs):
+    samples, errors = [], 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        response = send()
+        samples.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            errors += 1
+    return dict(summarize(samples), errors=errors)
+
+
+def measure_under_report_load(client, headers, bill, params, runs):
+    """
+    Time /api/health and POST /bills/op while another client keeps running
+    /reports/bill-summary. Handlers run in the thread pool, so neither should
+    wait for the report to finish.
+    """
+    stop = threading.Event()
+    report_times = []
+
+    def run_reports():
+        while not stop.is_set():
+            start = time.perf_counter()
+            client.get("/reports/bill-summary", params=params, headers=headers)
+            report_times.append((time.perf_counter() - start) * 1000)
+
+    worker = threading.Thread(target=run_reports, daemon=True)
+    worker.start()
+    # Make sure a report is in flight before measuring
+    time.sleep(0.2)
+    try:
+        health = timed_requests(lambda: client.get("/api/health"), runs)
+        billing = timed_requests(lambda: client.post("/bills/op", json=bill, headers=headers), runs)
+    finally:
+        stop.set()
+        worker.join()
+
+    return {
+        "GET /reports/bill-summary (background)": summarize(report_times),
+        "GET /api/health": health,
+        "POST /bills/op": billing,
+    }
+
+
+def measure_search(client, headers, runs):
+    """
+    Time the OP patient search for the kinds of text typed at the billing
+    desk: a full name, a name prefix, a place, a phone prefix and an OP
+    number, plus number-fragment lookups. Search terms come from the seeded
+    rows, so every query has hits.
+    """
+    from database import read_engine
+
+    with read_engine.connect() as conn:
+        rows = conn.exec_driver_sql(
+            "SELECT name, place, phone, op_number FROM patients ORDER BY random() LIMIT 20"
+        ).fetchall()
+
+    queries = {
+        "full name": [name for name, _, _, _ in rows],
+        "name prefix": [name.split()[0][:3] + " " + name.split()[1][:2] for name, _, _, _ in rows],
+        "place": [place for _, place, _, _ in rows],
+        "phone prefix": [phone[:6] for _, _, phone, _ in rows],
+        "op number": [op_number for _, _, _, op_number in rows],
+    }
+
+    # Number fragments go to the trigram lookup instead
+    lookups = {
+        "lookup phone last 4": [phone[-4:] for _, _, phone, _ in rows],
+        "lookup op number tail": [op_number[-5:] for _, _, _, op_number in rows],
+    }
+
+    results = {}
+    for kind, terms in list(queries.items()) + list(lookups.items()):
+        path = "/patients/lookup/" if kind in lookups else "/patients/search/op/"
+        terms = iter(terms * (runs // len(terms) + 1))
+        results[kind] = timed_requests(
+            lambda: client.get(path + next(terms), headers=headers), runs
+        )
+    return results
+
+
+def stress_sequences(client, headers, bill, threads, per_thread):
+    """
+    Allocate OP numbers and bill numbers from many threads at once: through
+    POST /patients and POST /bills/op, and through a second allocator on its
+    own connection standing in for another backend process. Every number
+    handed out must be unique and every request must succeed.
+    """
+    from sqlalchemy import create_engine
+    from app.core.sequences import SequenceAllocator
+    from database import SQLALCHEMY_DATABASE_URL
+
+    other_process = SequenceAllocator(create_engine(SQLALCHEMY_DATABASE_URL), block_size=3)
+    patient = {
+        "name": "Sequence Stress", "age": "40", "gender": "M", "complaint": "-",
+        "house": "-", "street": "-", "place": "-", "phone": "9000000000", "doctor_id": 1,
+    }
+
+    numbers, errors = [], []
+    lock = threading.Lock()
+
+    def work(worker):
+        for i in range(per_thread):
+            kind = (worker + i) % 3
+            if kind == 0:
+                response = client.post("/patients/", json=patient, headers=headers)
+                value = response.json().get("op_number") if response.status_code == 200 else None
+            elif kind == 1:
+                response = client.post("/bills/op", json=bill, headers=headers)
+                value = response.json().get("bill_number") if response.status_code == 200 else None
+            else:
+                response, value = None, other_process.next_number(("op_number", "op_bill")[i % 2])
+            with lock:
+                if value is None:
+                    errors.append(response.status_code)
+                else:
+                    numbers.append(value)
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=work, args=(n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    return {
+        "threads": threads,
+        "allocations": len(numbers),
+        "duplicates": len(numbers) - len(set(numbers)),
+        "errors": len(errors),
+        "elapsed_s": round(time.perf_counter() - started, 2),
+    }
+
+
+def measure_pagination(client, headers, path, limit=50, max_pages=2000):
+    """
+    Follow X-Next-Cursor through every page of a list endpoint and compare
+    the latency of the first pages with the deepest ones. With keyset
+    pagination both should cost the same.
+    """
+    samples, cursor = [], None
+    while len(samples) < max_pages:
+        params = {"limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        start = time.perf_counter()
+        response = client.get(path, params=params, headers=headers)
+        samples.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    edge = max(1, min(20, len(samples) // 4))
+    return {
+        "pages": len(samples),
+        "total_estimate": response.headers.get("X-Total-Count-Estimate"),
+        "first_pages": summarize(samples[:edge]),
+        "last_pages": summarize(samples[-edge:]),
+    }
+
+
+def seed_old_bills(engine, bills, years_back):
+    """
+    Add OP bills (one item each) spread over the financial year that started
+    years_back years ago, with ids after the existing ones.
+    """
+    from app.models import OPBill, OPBillItem
+    from app.core.archive import financial_year_bounds, financial_year_of
+
+    rng = random.Random(7)
+    start_year = financial_year_of(datetime.now().date()) - years_back
+    first_day, _ = financial_year_bounds(start_year)
+    with engine.begin() as conn:
+        first_id = (conn.exec_driver_sql("SELECT max(id) FROM op_bills").scalar() or 0) + 1
+        patients = conn.exec_driver_sql("SELECT max(id) FROM patients").scalar()
+        conn.execute(OPBill.__table__.insert(), [
+            {
+                "id": first_id + i,
+                "bill_number": f"OLD{start_year}-{i:08d}",
+                "bill_date": datetime.combine(first_day, datetime.min.time())
+                             + timedelta(days=rng.randrange(365), hours=9, minutes=rng.randrange(600)),
+                "patient_id": rng.randint(1, patients),
+                "bill_type": "OP",
+                "category": "Consultation",
+                "doctor_id": rng.randint(1, 10),
+                "total_amount": 400,
+                "discount_amount": 0,
+                "net_amount": 400,
+            }
+            for i in range(bills)
+        ])
+        conn.execute(OPBillItem.__table__.insert(), [
+            {"bill_id": first_id + i, "particular": str(rng.randint(1, 20)), "department": "General",
+             "unit": 1, "rate": 400, "amount": 400, "total": 400}
+            for i in range(bills)
+        ])
+    return start_year
+
+
+def measure_archive(client, headers, engine, bill, days, bills):
+    """
+    Seed a closed financial year of bills, then time a recent and an old
+    bill summary before and after archiving that year. Both must return the
+    same bills afterwards, and the rebuilt rollups must still count them.
+    The seeded year holds the newest ids, so archiving is refused until
+    new bills are saved; bills saved after archiving must get new ids.
+    """
+    start_year = seed_old_bills(engine, bills, years_back=3)
+    from app.core.archive import financial_year_bounds
+
+    refused = client.post(f"/archives/{start_year}", headers=headers).status_code
+    # The seeded IP bills have random dates, so the year may hold the
+    # newest IP ids as well
+    ip_bill = {
+        "patient_id": 1,
+        "category": "General",
+        "doctor_id": 1,
+        "room": "101",
+        "admission_date": datetime.now().date().isoformat(),
+        "items": [{"particular": "Room rent", "department": "General", "amount": 1500}],
+    }
+    client.post("/bills/op", json=bill, headers=headers).raise_for_status()
+    client.post("/bills/ip", json=ip_bill, headers=headers).raise_for_status()
+
+    first_day, last_day = financial_year_bounds(start_year)
+    with engine.connect() as conn:
+        archived_max_id = conn.exec_driver_sql(
+            "SELECT max(id) FROM op_bills WHERE bill_day >= ? AND bill_day <= ?",
+            (first_day.isoformat(), last_day.isoformat())
+        ).scalar()
+    end_date = datetime.now().date()
+    ranges = {
+        "recent": {"start_date": (end_date - timedelta(days=days)).isoformat(), "end_date": end_date.isoformat()},
+        "archived_year": {"start_date": first_day.isoformat(), "end_date": last_day.isoformat()},
+    }
+
+    def snapshot():
+        timings, counts = {}, {}
+        for name, params in ranges.items():
+            samples = []
+            for _ in range(5):
+                start = time.perf_counter()
+                response = client.get("/reports/bill-summary", params=params, headers=headers)
+                samples.append((time.perf_counter() - start) * 1000)
+                response.raise_for_status()
+            timings[name] = summarize(samples)
+            counts[name] = len(response.json()["op_bills"])
+        rebuilt = client.post("/dashboard/stats/rebuild", headers=headers)
+        rebuilt.raise_for_status()
+        return timings, counts, rebuilt.json()["rows"]
+
+    before, before_counts, before_rows = snapshot()
+    start = time.perf_counter()
+    client.post(f"/archives/{start_year}", headers=headers).raise_for_status()
+    archive_seconds = round(time.perf_counter() - start, 2)
+    after, after_counts, after_rows = snapshot()
+    with engine.connect() as conn:
+        hot_bills = conn.exec_driver_sql("SELECT count(*) FROM op_bills").scalar()
+    saved = client.post("/bills/op", json=bill, headers=headers)
+    saved.raise_for_status()
+
+    return {
+        "financial_year": start_year,
+        "refused_status": refused,
+        "archived_max_id": archived_max_id,
+        "new_bill_id": saved.json()["bill_id"],
+        "archive_seconds": archive_seconds,
+        "before": before,
+        "after": after,
+        "bills_before": before_counts,
+        "bills_after": after_counts,
+        "daily_stats_rows": [before_rows, after_rows],
+        "hot_op_bills": hot_bills,
+    }
+
+
+def measure_backup(app, client, headers, bill, runs):
+    """
+    Time bill commits on their own and while base backups run back to back,
+    then ship the WAL and restore to now; the restored copy must hold every
+    committed bill.
+    """
+    import sqlite3
+    from app.core.backup import backup_database, restore_database
+    from app.core.config import settings
+
+    def count(path):
+        conn = sqlite3.connect(path)
+        try:
+            return {table: conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+                    for table in ("patients", "op_bills", "op_bill_items")}
+        finally:
+            conn.close()
+
+    post = lambda: client.post("/bills/op", json=bill, headers=headers)
+    idle = timed_requests(post, runs)
+    # A restore point before the backups below, reached from the startup
+    # base by replaying the seeded data and the bills above
+    app.state.backups.ship_now()
+    point_in_time = datetime.now(timezone.utc)
+    rows_at_point = count(settings.db_path)
+
+    backups, stop = [], threading.Event()
+
+    def back_to_back():
+        while not stop.is_set():
+            backups.append(backup_database(settings.db_path, settings.backup_dir))
+
+    thread = threading.Thread(target=back_to_back)
+    thread.start()
+    try:
+        during = timed_requests(post, runs)
+    finally:
+        stop.set()
+        thread.join()
+
+    app.state.backups.ship_now()
+    target = os.path.join(settings.data_dir, "restored.db")
+    start = time.perf_counter()
+    restored = restore_database(settings.backup_dir, target)
+    restore_seconds = round(time.perf_counter() - start, 2)
+
+    earlier = restore_database(
+        settings.backup_dir, os.path.join(settings.data_dir, "restored-earlier.db"), point_in_time
+    )
+
+    return {
+        "idle": idle,
+        "during_backup": during,
+        "backups": len(backups),
+        "backup_seconds": max(backup["seconds"] for backup in backups) if backups else None,
+        "restore_seconds": restore_seconds,
+        "wal_segments": restored["segments"],
+        "quick_check": restored["quick_check"],
+        "live_rows": count(settings.db_path),
+        "restored_rows": count(target),
+        "point_in_time": {
+            "wal_segments": earlier["segments"],
+            "quick_check": earlier["quick_check"],
+            "rows_then": rows_at_point,
+            "restored_rows": count(earlier["path"]),
+        },
+    }
+
+
+def legacy_files(directory, patients, bills):
+    """
+    Write legacy patients (CSV), OP bills (CSV, one row per item) and IP
+    bills (NDJSON) with a few bad records; returns paths and bad counts.
+    """
+    import csv
+    rng = random.Random(16)
+    now = datetime.now()
+    paths = {kind: os.path.join(directory, name) for kind, name in (
+        ("patients", "legacy_patients.csv"), ("op-bills", "legacy_op_bills.csv"),
+        ("ip-bills", "legacy_ip_bills.ndjson"),
+    )}
+
+    with open(paths["patients"], "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["op_number", "ip_number", "registration_date", "name", "age", "gender",
+                         "complaint", "house", "street", "place", "phone", "doctor_id"])
+        for i in range(1, patients + 1):
+            registered = now - timedelta(days=rng.randint(400, 1500), minutes=rng.randint(0, 600))
+            writer.writerow([
+                f"L-{i:07d}", f"LI-{i:07d}" if i % 10 == 0 else "", registered.isoformat(),
+                # Every 50th record has no name
+                "" if i % 50 == 0 else f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                str(rng.randint(1, 90)), rng.choice(["Male", "Female"]), "Legacy", "1", "Main Road",
+                rng.choice(PLACES), f"9{rng.randint(100000000, 999999999)}", rng.randint(1, 10),
+            ])
+
+    def patient_number(i):
+        # Every 100th bill names a patient that was never imported
+        if i % 100 == 0:
+            return "L-9999999"
+        number = rng.randrange(1, patients + 1)
+        return f"L-{number - 1 if number % 50 == 0 else number:07d}"
+
+    def bill_date(i):
+        if i <= 5:
+            # A few carry today's numbers, which the allocator must skip
+            return now
+        return now - timedelta(days=rng.randint(400, 1500), minutes=rng.randint(0, 600))
+
+    today = now.strftime("%Y%m%d")
+    with open(paths["op-bills"], "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["bill_number", "bill_date", "op_number", "bill_type", "category", "doctor_id",
+                         "item_particular", "item_doctor", "item_department", "item_unit", "item_rate"])
+        for i in range(1, bills + 1):
+            number = f"OP{today}-{9000 + i:04d}" if i <= 5 else f"LOP-{i:07d}"
+            op_number, billed = patient_number(i), bill_date(i).isoformat()
+            for _ in range(rng.randint(1, 3)):
+                writer.writerow([number, billed, op_number, "OP", "General", rng.randint(1, 10),
+                                 str(rng.randint(1, 5)), "B01", "General", rng.randint(1, 3), 150])
+
+    with open(paths["ip-bills"], "w") as f:
+        for i in range(1, bills // 5 + 1):
+            f.write(json.dumps({
+                "bill_number": f"LIP-{i:07d}", "bill_date": bill_date(i + 5).isoformat(),
+                "op_number": patient_number(i), "category": "General", "doctor_id": rng.randint(1, 10),
+                "room": "W1", "admission_date": (now - timedelta(days=1500)).date().isoformat(),
+                "items": [{"particular": str(rng.randint(1, 5)), "department": "General", "amount": 1000}],
+            }) + "\n")
+
+    return paths, {"patients": patients // 50, "op-bills": bills // 100, "ip-bills": bills // 5 // 100}
+
+
+def measure_import(client, headers, engine, bill, patients, bills):
+    """
+    Import legacy files through /imports after an interrupted first run of
+    the OP bills, then check counts, rollups and the next allocated number.
+    The rollups the import added to must equal a full rebuild, and the OP
+    totals by doctor in the particulars report must match the bill items.
+    """
+    from sqlalchemy.orm import Session
+    from app.core.config import settings
+    from app.core.importer import import_records, read_records
+    from app.core.rollups import rebuild_rollups
+
+    paths, bad = legacy_files(settings.data_dir, patients, bills)
+    results = {}
+    # Start from exact rollups; the seeders bypass them
+    with Session(bind=engine) as db:
+        rebuild_rollups(db)
+
+    def upload(kind, path):
+        with open(path, "rb") as f:
+            response = client.post(
+                f"/imports/{kind}", files={"file": (os.path.basename(path), f)},
+                params={"batch_size": 2000}, headers=headers
+            )
+        response.raise_for_status()
+        return response.json()
+
+    results["patients"] = upload("patients", paths["patients"])
+
+    # Stop the first OP bill run part way; the upload resumes the same job
+    class Interrupted(Exception):
+        pass
+
+    def interrupted(records, after):
+        for number, record in enumerate(records, start=1):
+            if number > after:
+                raise Interrupted
+            yield record
+
+    with open(paths["op-bills"], newline="") as f:
+        try:
+            import_records(engine, "op-bills", interrupted(read_records(f, "op-bills", "csv"), bills // 2),
+                           job="op-bills:legacy_op_bills.csv", batch_size=2000)
+        except Interrupted:
+            pass
+    results["op-bills"] = upload("op-bills", paths["op-bills"])
+    results["ip-bills"] = upload("ip-bills", paths["ip-bills"])
+
+    with engine.connect() as conn:
+        count = lambda sql: conn.exec_driver_sql(sql).scalar()
+        results["rows"] = {
+            "patients": count("SELECT count(*) FROM patients WHERE op_number LIKE 'L-%'"),
+            "op_bills": count("SELECT count(*) FROM op_bills WHERE bill_number LIKE 'LOP-%' "
+                              "OR bill_number LIKE 'OP%-9%'"),
+            "ip_bills": count("SELECT count(*) FROM ip_bills WHERE bill_number LIKE 'LIP-%'"),
+            "rollup_op_bills": count("SELECT sum(op_bills) FROM daily_stats"),
+            "all_op_bills": count("SELECT count(*) FROM op_bills"),
+        }
+
+    def rollups():
+        with engine.connect() as conn:
+            return {
+                table: [tuple(round(value, 2) if isinstance(value, float) else value for value in row)
+                        for row in conn.exec_driver_sql(f"SELECT * FROM {table} ORDER BY 1, 2, 3, 4")]
+                for table in ("daily_stats", "particular_daily_stats")
+            }
+
+    imported_rollups = rollups()
+    with Session(bind=engine) as db:
+        rebuild_rollups(db)
+    results["rollups_match_rebuild"] = imported_rollups == rollups()
+    results["expected"] = {
+        "patients": patients - bad["patients"],
+        "op_bills": bills - bad["op-bills"],
+        "ip_bills": bills // 5 - bad["ip-bills"],
+    }
+    created = client.post("/bills/op", json=bill, headers=headers)
+    results["next_bill"] = {"status": created.status_code, "bill_number": created.json().get("bill_number")}
+
+    # OP totals by doctor from the rollup against the bill items themselves,
+    # now that the API bill above is in both
+    particular_id = int(bill["items"][0]["particular"])
+    report = client.get("/reports/particulars-report", params={
+        "particular_id": particular_id, "start_date": "2000-01-01",
+        "end_date": datetime.now().date().isoformat(), "include_ip": False,
+    }, headers=headers).json()
+    with engine.connect() as conn:
+        detail = conn.exec_driver_sql(
+            "SELECT d.name, count(*), sum(i.total) FROM op_bill_items i "
+            "JOIN op_bills b ON b.id = i.bill_id "
+            "JOIN doctors d ON d.id = coalesce(i.doctor_id, b.doctor_id) "
+            "WHERE CAST(i.particular AS INTEGER) = ? GROUP BY d.name", (particular_id,)
+        ).all()
+    results["op_doctor_totals"] = {
+        "rollup": {row["doctor_name"]: [row["count"], round(row["total_amount"], 2)]
+                   for row in report["summary_by_doctor"]},
+        "detail": {name: [count, round(total, 2)] for name, count, total in detail},
+    }
+    return results
+
+
+def stream_from_app(app, path, params, headers):
+    """
+    Call the ASGI app directly and throw each body chunk away as it arrives.
+    TestClient would collect the whole body first, which is exactly the
+    memory a streaming endpoint is meant to avoid.
+    """
+    import anyio
+    from urllib.parse import urlencode
+
+    size = 0
+    status = None
+    requested = False
+    finished = None
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Like a server: the client only goes away once the body is sent
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal size, status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+            if not message.get("more_body", False):
+                finished.set()
+
+    async def run():
+        nonlocal finished
+        finished = anyio.Event()
+        await app(scope, receive, send)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(),
+        "query_string": urlencode(params).encode(), "root_path": "",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+        "client": ("127.0.0.1", 0), "server": ("testserver", 80),
+    }
+    anyio.run(run)
+    return status, size
+
+
+def measure_export(app, headers, days):
+    """
+    Stream the bill item export as CSV and XLSX over the whole seeded range
+    and record Python's peak traced memory while doing it. A streaming
+    export keeps that peak flat however many rows there are.
+    """
+    import tracemalloc
+
+    end_date = datetime.now().date()
+    params = {"start_date": (end_date - timedelta(days=days)).isoformat(), "end_date": end_date.isoformat()}
+
+    results = {}
+    for export_format in ("csv", "xlsx"):
+        tracemalloc.start()
+        start = time.perf_counter()
+        status, size = stream_from_app(
+            app, "/exports/bill-items", dict(params, format=export_format), headers
+        )
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        if status != 200:
+            raise RuntimeError(f"/exports/bill-items returned {status}")
+        results[export_format] = {
+            "seconds": round(elapsed, 2),
+            "megabytes": round(size / 2**20, 1),
+            "peak_traced_mb": round(peak / 2**20, 1),
+        }
+    return results
+
+
+def measure_parquet_export(client, headers, bill):
+    """
+    Time a full Parquet snapshot, then save one more bill and check the next
+    run appends exactly that bill's items. Skipped without pyarrow.
+    """
+    from app.core.analytics import arrow_available
+
+    if not arrow_available():
+        return None
+
+    def run():
+        start = time.perf_counter()
+        response = client.post("/exports/parquet", headers=headers)
+        response.raise_for_status()
+        summary = response.json()
+        return round(time.perf_counter() - start, 2), summary
+
+    full_seconds, full = run()
+    client.post("/bills/op", json=bill, headers=headers).raise_for_status()
+    incremental_seconds, incremental = run()
+    return {
+        "full_seconds": full_seconds,
+        "full_rows": full["OP"]["rows"] + full["IP"]["rows"],
+        "incremental_seconds": incremental_seconds,
+        "incremental_rows": incremental["OP"]["rows"] + incremental["IP"]["rows"],
+        "expected_incremental_rows": len(bill["items"]),
+    }
+
+
+# Peak traced memory allowed while streaming an export, whatever its size
+EXPORT_PEAK_LIMIT_MB = 32
+
+SEARCH_P95_LIMIT_MS = 20
+
+# Bill commits may slow down during a backup, but only by a little
+BACKUP_P99_SLACK_MS = 20
+
+# A scrape renders every series; it must stay cheap enough to poll often
+METRICS_SCRAPE_P95_LIMIT_MS = 50
+
+# Log calls only enqueue; well under a queue's worth so nothing is dropped
+LOG_BENCH_RECORDS = 5000
+LOG_CALL_LIMIT_US = 100
+
+# The list endpoints that materialize whole tables, with how to count the
+# rows in their responses
+MEMORY_ENDPOINTS = [
+    ("/reports/bill-summary", {}, lambda body: len(body["op_bills"]) + len(body["ip_bills"])),
+    ("/reports/patient-list", {}, len),
+    ("/bills/op/all", {"limit": 1000}, len),
+]
+# Peak Python memory ceiling: a fixed allowance per request (~2.5MB seen)
+# plus, per returned row, its ORM object, encoded dict and JSON together.
+# Peaks swing by up to 2x with whether the cyclic GC ran mid-request; these
+# sit above the worst seen (7KB, 4.5KB and 5KB per row)
+MEMORY_BASE_MB = 4
+MEMORY_PER_ROW_LIMIT_KB = {
+    "GET /reports/bill-summary": 8,
+    "GET /reports/patient-list": 5,
+    "GET /bills/op/all": 6,
+}
+
+# Low enough that the bill-summary report's statements are logged
+SLOW_QUERY_BENCH_MS = 0.05
+
+# Tables that must never be read with a full scan by the date-filtered endpoints
+BIG_TABLES = ("patients", "op_bills", "ip_bills", "op_bill_items", "ip_bill_items")
+
+EXPLAIN_ENDPOINTS = [
+    ("/dashboard/stats", {}),
+    ("/bills/op/today", {}),
+    ("/bills/ip/today", {}),
+    ("/reports/daily-op", {}),
+    ("/reports/bill-summary", {}),
+    ("/reports/patient-list", {}),
+    ("/reports/particulars-report", {"particular_id": 1}),
+]
+
+
+def explain_endpoints(client, headers):
+    """
+    Capture the SELECTs each endpoint issues and run EXPLAIN QUERY PLAN on
+    them. Returns the full-scan plan steps on BIG_TABLES per endpoint.
+    """
+    from sqlalchemy import event
+    from database import read_engine
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    plans = {}
+    for path, params in EXPLAIN_ENDPOINTS:
+        captured.clear()
+        event.listen(read_engine, "before_cursor_execute", capture)
+        try:
+            client.get(path, params=params, headers=headers).raise_for_status()
+        finally:
+            event.remove(read_engine, "before_cursor_execute", capture)
+
+        scans = []
+        with read_engine.connect() as conn:
+            for statement, parameters in captured:
+                for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters):
+                    detail = row[-1]
+                    if detail.startswith("SCAN ") and detail.split()[1] in BIG_TABLES:
+                        scans.append(detail)
+        plans[path] = scans
+    return plans
+
+
+# List endpoints whose statement count must not depend on the page size
+QUERY_COUNT_ENDPOINTS = [
+    ("/patients/", {}),
+    ("/bills/op/all", {}),
+    ("/bills/op/1", {"include_items": "true"}),
+]
+
+
+def measure_queries(client, headers):
+    """
+    X-DB-Queries / X-DB-Time of each list endpoint at two page sizes; an
+    N+1 shows up as a statement count that grows with the page.
+    """
+    from app.core.dbstats import QUERY_COUNT_HEADER, QUERY_TIME_HEADER
+
+    results = {}
+    for path, params in QUERY_COUNT_ENDPOINTS:
+        counts = []
+        for limit in (5, 200):
+            response = client.get(path, params={**params, "limit": limit}, headers=headers)
+            response.raise_for_status()
+            counts.append({
+                "limit": limit,
+                "rows": len(response.json()),
+                "statements": int(response.headers[QUERY_COUNT_HEADER]),
+                "db_ms": float(response.headers[QUERY_TIME_HEADER]),
+            })
+        results[path] = counts
+    return results
+
+
+def scrape_metrics(client):
+    """GET /metrics as {sample line without the value: value}"""
+    response = client.get("/metrics")
+    response.raise_for_status()
+    samples = {}
+    for line in response.text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def measure_metrics(client, headers, bill, runs):
+    """
+    Create bills and check /metrics counted every one of them, and time the
+    scrape itself.
+    """
+    request_key = 'hms_http_requests_total{method="POST",route="/bills/op",status="200"}'
+    latency_key = 'hms_http_request_duration_seconds_count{method="POST",route="/bills/op"}'
+    bills_key = 'hms_bills_created_total{type="OP"}'
+
+    before = scrape_metrics(client)
+    for _ in range(runs):
+        client.post("/bills/op", json=bill, headers=headers).raise_for_status()
+    after = scrape_metrics(client)
+
+    return {
+        "bills": runs,
+        "counted": {
+            key: after.get(key, 0) - before.get(key, 0)
+            for key in (request_key, latency_key, bills_key)
+        },
+        "scrape": timed_requests(lambda: client.get("/metrics"), max(10, runs // 4)),
+    }
+
+
+def measure_slow_queries(client, headers, params):
+    """
+    Run a report with a low slow-query threshold and read back both the
+    /diagnostics/slow-queries listing and the log file.
+    """
+    for _ in range(3):
+        client.get("/reports/bill-summary", params=params, headers=headers).raise_for_status()
+    listing = client.get("/diagnostics/slow-queries", params={"limit": 5}, headers=headers)
+    listing.raise_for_status()
+    listing = listing.json()
+
+    entries = []
+    if os.path.exists(listing["log_file"]):
+        with open(listing["log_file"], encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f]
+    report = [entry for entry in entries if entry["route"] == "GET /reports/bill-summary"]
+    shapes = Counter(" ".join(entry["statement"].split()) for entry in report)
+    return {
+        "threshold_ms": listing["threshold_ms"],
+        "slowest": [
+            {key: statement[key] for key in ("max_ms", "count", "slow")}
+            for statement in listing["statements"]
+        ],
+        "logged": len(entries),
+        "report_entries": len(report),
+        "report_entries_with_plan": sum(1 for entry in report if entry["plan"]),
+        # Sampling: the report ran a few times, each shape is logged once
+        "most_logged_shape": max(shapes.values(), default=0),
+    }
+
+
+def measure_request_profile(client, headers, params):
+    """
+    Profile one bill-summary request with ?__profile=1 and check the saved
+    stacks reach the route handler in its worker thread.
+    """
+    from app.core.profiler import PROFILE_HEADER
+
+    response = client.get("/reports/bill-summary", params={**params, "__profile": "1"}, headers=headers)
+    response.raise_for_status()
+    profile_id = response.headers.get(PROFILE_HEADER)
+    listed = client.get("/diagnostics/profiles", headers=headers).json()
+    stacks = client.get(f"/diagnostics/profiles/{profile_id}", headers=headers) if profile_id else None
+    samples = {}
+    if stacks is not None and stacks.status_code == 200:
+        for line in stacks.text.splitlines():
+            stack, count = line.rsplit(" ", 1)
+            frame = "handler" if "get_bill_summary (" in stack else "other"
+            samples[frame] = samples.get(frame, 0) + int(count)
+    return {
+        "profile_id": profile_id,
+        "listed": any(profile["id"] == profile_id for profile in listed),
+        "samples": samples,
+    }
+
+
+def measure_tracing(client, headers):
+    """
+    Trace one IP bill and export it; check the handler, auth, statement,
+    commit and serialization spans are all there.
+    """
+    from app.core.logs import REQUEST_ID_HEADER
+
+    ip_bill = {
+        "patient_id": 1,
+        "category": "General",
+        "doctor_id": 1,
+        "room": "101",
+        "admission_date": datetime.now().date().isoformat(),
+        "items": [
+            {"particular": "Room rent", "department": "General", "amount": 1500},
+            {"particular": "Nursing", "department": "General", "amount": 500, "discount_percent": 10},
+        ],
+    }
+    response = client.post("/bills/ip", json=ip_bill, headers=headers)
+    response.raise_for_status()
+    request_id = response.headers.get(REQUEST_ID_HEADER)
+    listed = client.get("/diagnostics/traces", headers=headers).json()["traces"]
+    exported = client.get("/diagnostics/traces/export", params={"request_id": request_id}, headers=headers)
+    spans = {}
+    if exported.status_code == 200:
+        for trace_event in exported.json()["traceEvents"]:
+            if trace_event["ph"] == "X":
+                category = trace_event["cat"]
+                spans.setdefault(category, []).append((trace_event["name"], round(trace_event["dur"] / 1000, 3)))
+    saved = client.post("/diagnostics/traces/export", params={"limit": 5}, headers=headers)
+    return {
+        "request_id": request_id,
+        "listed": any(trace["request_id"] == request_id for trace in listed),
+        "spans": spans,
+        "saved": saved.status_code == 200 and os.path.isfile(saved.json()["path"]),
+    }
+
+
+def measure_memory(client, headers, params):
+    """
+    Turn tracemalloc on, load the big list endpoints over the seeded range
+    and read each route's peak memory back from /diagnostics/memory, per row
+    returned. A snapshot diff around the requests must list allocation sites.
+    """
+    client.post("/diagnostics/memory/tracking", params={"enabled": True}, headers=headers).raise_for_status()
+    try:
+        snapshot = client.post("/diagnostics/memory/snapshots", headers=headers).json()
+        rows = {}
+        for path, query, count_rows in MEMORY_ENDPOINTS:
+            response = client.get(path, params={**params, **query}, headers=headers)
+            response.raise_for_status()
+            rows[f"GET {path}"] = count_rows(response.json())
+        diff = client.get(f"/diagnostics/memory/snapshots/{snapshot['id']}/diff", headers=headers).json()
+        usage = client.get("/diagnostics/memory", params={"limit": 5}, headers=headers).json()
+    finally:
+        client.post("/diagnostics/memory/tracking", params={"enabled": False}, headers=headers)
+
+    peaks = {route["route"]: route for route in usage["routes"]}
+    results = {}
+    for route, count in rows.items():
+        peak = peaks.get(route, {}).get("max_bytes", 0)
+        results[route] = {
+            "rows": count,
+            "peak_mb": round(peak / 2**20, 2),
+            "kb_per_row": round(peak / 1024 / max(count, 1), 2),
+        }
+    return {
+        "routes": results,
+        "top_sites": len(usage["top"]),
+        "diff_sites": len(diff["sites"]),
+    }
+
+
+def measure_logging(client, records):
+    """
+    Time log calls on the request path (enqueue only), then check every
+    record reached the JSON log file and a request's lines carry its id.
+    """
+    import logging
+    from app.core.config import settings
+    from app.core.logs import REQUEST_ID_HEADER, dropped_records
+
+    logger = logging.getLogger("benchmark")
+    marker = f"bench-{time.time_ns()}"
+    start = time.perf_counter()
+    for i in range(records):
+        logger.info("%s record %d", marker, i, extra={"record": i})
+    call_us = (time.perf_counter() - start) * 1e6 / records
+
+    response = client.post("/auth/register", json={
+        "username": marker, "password": "bench", "full_name": "Logging bench"
+    })
+    request_id = response.headers.get(REQUEST_ID_HEADER)
+
+    # The writer thread catches up in the background
+    written, tagged = 0, 0
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        with open(settings.log_file_path, encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f if marker in line]
+        written = sum(1 for line in lines if line["logger"] == "benchmark")
+        tagged = sum(1 for line in lines if line.get("request_id") == request_id)
+        if written + dropped_records() >= records and tagged:
+            break
+        time.sleep(0.1)
+    return {
+        "records": records,
+        "call_us": round(call_us, 2),
+        "written": written,
+        "dropped": dropped_records(),
+        "request_lines_with_id": tagged,
+    }
+
+
+def run_profile(args):
+    data_dir = tempfile.mkdtemp(prefix="hms-bench-")
+    os.environ["HMS_DATA_DIR"] = data_dir
+    os.environ["HMS_DB_PROFILE"] = args.profile
+    if args.backup:
+        os.environ["HMS_BACKUP_DIR"] = os.path.join(data_dir, "backups")
+    if args.slow_queries:
+        os.environ["HMS_SLOW_QUERY_MS"] = str(SLOW_QUERY_BENCH_MS)
+
+    from fastapi.testclient import TestClient
+    from database import engine, SQLITE_PRAGMAS
+    from app.main import app
+
+    results = {"profile": args.profile, "pragmas": SQLITE_PRAGMAS}
+
+    with TestClient(app, raise_server_exceptions=False) as client:
+        seed_database(engine, args.patients, args.bills, args.days)
+
+        token = client.post(
+            "/auth/login", data={"username": "bench", "password": "bench"}
+        ).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        bill = {
+            "patient_id": 1,
+            "bill_type": "OP",
+            "category": "Consultation",
+            "doctor_id": 1,
+            "items": [
+                {"particular": "1", "doctor": "B01", "department": "General", "unit": 1, "rate": 300},
+                {"particular": "2", "doctor": "B01", "department": "General", "unit": 2, "rate": 150},
+            ],
+        }
+        results["POST /bills/op"] = timed_requests(
+            lambda: client.post("/bills/op", json=bill, headers=headers), args.runs
+        )
+
+        end_date = datetime.now().date()
+        params = {
+            "start_date": (end_date - timedelta(days=args.days)).isoformat(),
+            "end_date": end_date.isoformat(),
+        }
+        samples = []
+        for _ in range(max(1, args.runs // 10)):
+            start = time.perf_counter()
+            response = client.get("/reports/bill-summary", params=params, headers=headers)
+            samples.append((time.perf_counter() - start) * 1000)
+            response.raise_for_status()
+        results["GET /reports/bill-summary"] = summarize(samples)
+
+        if args.explain:
+            results["full_scans"] = explain_endpoints(client, headers)
+
+        if args.logging:
+            results["logging"] = measure_logging(client, LOG_BENCH_RECORDS)
+
+        if args.request_profile:
+            results["request_profile"] = measure_request_profile(client, headers, params)
+
+        if args.memory:
+            results["memory"] = measure_memory(client, headers, params)
+
+        if args.tracing:
+            results["tracing"] = measure_tracing(client, headers)
+
+        if args.slow_queries:
+            results["slow_queries"] = measure_slow_queries(client, headers, params)
+
+        if args.metrics:
+            results["metrics"] = measure_metrics(client, headers, bill, max(10, args.runs // 4))
+
+        if args.queries:
+            results["queries"] = measure_queries(client, headers)
+
+        if args.export:
+            results["export"] = measure_export(app, headers, args.days)
+            results["parquet_export"] = measure_parquet_export(client, headers, bill)
+
+        if args.backup:
+            results["backup"] = measure_backup(app, client, headers, bill, args.runs)
+
+        if args.bulk_import:
+            results["import"] = measure_import(client, headers, engine, bill, args.patients, args.bills)
+
+        if args.archive:
+            results["archive"] = measure_archive(client, headers, engine, bill, args.days, args.bills)
+
+        if args.pagination:
+            results["pagination"] = {
+                path: measure_pagination(client, headers, path)
+                for path in ("/bills/op/all", "/patients/")
+            }
+
+        if args.sequences:
+            results["sequence_stress"] = stress_sequences(
+                client, headers, bill, threads=16, per_thread=max(10, args.runs // 4)
+            )
+
+        if args.search:
+            results["patient_search"] = measure_search(client, headers, args.runs)
+
+        if args.under_load:
+            results["under_report_load"] = measure_under_report_load(
+                client, headers, bill, params, args.runs
+            )
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", default="performance", help="HMS_DB_PROFILE to benchmark")
+    parser.add_argument("--compare", nargs="+", metavar="PROFILE", help="run each profile in a fresh process")
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--bills", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--runs", type=int, default=200)
+    parser.add_argument("--under-load", action="store_true",
+                        help="also time health/billing while a report is running")
+    parser.add_argument("--explain", action="store_true",
+                        help="report full table scans in the date-filtered endpoints' query plans")
+    parser.add_argument("--queries", action="store_true",
+                        help="count statements per request on list endpoints at two page sizes (N+1)")
+    parser.add_argument("--metrics", action="store_true",
+                        help="check /metrics counts created bills and requests, and time the scrape")
+    parser.add_argument("--slow-queries", action="store_true",
+                        help="log slow statements at a low threshold and check the log and listing")
+    parser.add_argument("--request-profile", action="store_true",
+                        help="profile one report request with ?__profile=1 and read the stacks back")
+    parser.add_argument("--memory", action="store_true",
+                        help="record the big list endpoints' peak memory per row with tracemalloc")
+    parser.add_argument("--tracing", action="store_true",
+                        help="trace an IP bill and check its exported Chrome trace has every kind of span")
+    parser.add_argument("--logging", action="store_true",
+                        help="time log calls and check they reach the JSON log with request ids")
+    parser.add_argument("--search", action="store_true",
+                        help="time /patients/search for typical billing-desk queries")
+    parser.add_argument("--export", action="store_true",
+                        help="stream the CSV/XLSX bill item exports and record peak memory, and time the Parquet snapshot")
+    parser.add_argument("--pagination", action="store_true",
+                        help="walk the cursor-paginated lists and compare first and last pages")
+    parser.add_argument("--sequences", action="store_true",
+                        help="allocate OP/bill numbers from many threads and count collisions")
+    parser.add_argument("--archive", action="store_true",
+                        help="archive a seeded closed financial year and compare reports before and after")
+    parser.add_argument("--backup", action="store_true",
+                        help="time bill commits during online backups and check a point-in-time restore")
+    parser.add_argument("--import", dest="bulk_import", action="store_true",
+                        help="bulk import legacy patient and bill files, resuming an interrupted job")
+    parser.add_argument("--check", action="store_true",
+                        help="exit non-zero on any --under-load, --explain, --queries, --metrics, --slow-queries, --request-profile, --memory, --tracing, --logging, --search, --sequences, --pagination, --export, --archive, --backup or --import regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        for profile in args.compare:
+            command = [
+                sys.executable, os.path.abspath(__file__),
+                "--profile", profile,
+                "--patients", str(args.patients),
+                "--bills", str(args.bills),
+                "--days", str(args.days),
+                "--runs", str(args.runs),
+            ]
+            if args.under_load:
+                command.append("--under-load")
+            if args.explain:
+                command.append("--explain")
+            if args.queries:
+                command.append("--queries")
+            if args.metrics:
+                command.append("--metrics")
+            if args.slow_queries:
+                command.append("--slow-queries")
+            if args.request_profile:
+                command.append("--request-profile")
+            if args.memory:
+                command.append("--memory")
+            if args.tracing:
+                command.append("--tracing")
+            if args.logging:
+                command.append("--logging")
+            if args.search:
+                command.append("--search")
+            if args.sequences:
+                command.append("--sequences")
+            if args.pagination:
+                command.append("--pagination")
+            if args.export:
+                command.append("--export")
+            if args.archive:
+                command.append("--archive")
+            if args.backup:
+                command.append("--backup")
+            if args.bulk_import:
+                command.append("--import")
+            subprocess.run(command, check=True)
+        return
+
+    if args.check:
+        args.under_load = True
+        args.explain = True
+        args.queries = True
+        args.metrics = True
+        args.slow_queries = True
+        args.request_profile = True
+        args.memory = True
+        args.tracing = True
+        args.logging = True
+        args.search = True
+        args.sequences = True
+        args.pagination = True
+        args.export = True
+        args.archive = True
+        args.backup = True
+        args.bulk_import = True
+
+    results = run_profile(args)
+    print(json.dumps(results, indent=2))
+
+    if args.check:
+        report_ms = results["GET /reports/bill-summary"]["p50_ms"]
+        loaded = results["under_report_load"]
+        for name in ("GET /api/health", "POST /bills/op"):
+            # Blocked requests would queue behind a whole report
+            if loaded[name]["p95_ms"] >= report_ms / 2:
+                sys.exit(f"{name} p95 {loaded[name]['p95_ms']}ms is stuck behind a {report_ms}ms report")
+        for path, scans in results["full_scans"].items():
+            if scans:
+                sys.exit(f"{path} does a full table scan: {'; '.join(scans)}")
+        for path, (small, large) in results["queries"].items():
+            if large["rows"] > small["rows"] and large["statements"] > small["statements"]:
+                sys.exit(f"{path}: {small['statements']} statements for {small['rows']} rows but "
+                         f"{large['statements']} for {large['rows']} (N+1)")
+        counted = results["metrics"]["counted"]
+        if any(value != results["metrics"]["bills"] for value in counted.values()):
+            sys.exit(f"/metrics counted {counted} for {results['metrics']['bills']} bills")
+        if results["metrics"]["scrape"]["p95_ms"] >= METRICS_SCRAPE_P95_LIMIT_MS:
+            sys.exit(f"/metrics scrape p95 {results['metrics']['scrape']['p95_ms']}ms")
+        slow = results["slow_queries"]
+        if not slow["slowest"] or not slow["report_entries_with_plan"]:
+            sys.exit(f"slow-query log has no bill-summary statement with a plan: {slow}")
+        if slow["most_logged_shape"] > 1:
+            sys.exit(f"slow-query log wrote one statement {slow['most_logged_shape']} times within the interval")
+        profiled = results["request_profile"]
+        if not profiled["listed"] or not profiled["samples"].get("handler"):
+            sys.exit(f"request profile missing or without the route handler: {profiled}")
+        remembered = results["memory"]
+        if not remembered["top_sites"] or not remembered["diff_sites"]:
+            sys.exit(f"/diagnostics/memory listed no allocation sites: {remembered}")
+        for route, peak in remembered["routes"].items():
+            if not peak["rows"] or not peak["peak_mb"]:
+                sys.exit(f"{route}: no rows or no peak memory recorded: {peak}")
+            ceiling_mb = MEMORY_BASE_MB + peak["rows"] * MEMORY_PER_ROW_LIMIT_KB[route] / 1024
+            if peak["peak_mb"] >= ceiling_mb:
+                sys.exit(f"{route} peaked at {peak['peak_mb']}MB for {peak['rows']} rows, "
+                         f"over its {ceiling_mb:.1f}MB ceiling")
+        traced = results["tracing"]
+        missing = {"request", "fastapi", "auth", "handler", "db"} - set(traced["spans"])
+        if not traced["listed"] or missing or not traced["saved"]:
+            sys.exit(f"trace of POST /bills/ip incomplete (missing {sorted(missing)}): {traced}")
+        if not any(name == "commit" for name, _ in traced["spans"].get("db", [])):
+            sys.exit(f"trace of POST /bills/ip has no commit span: {traced}")
+        logged = results["logging"]
+        if logged["written"] != logged["records"] or logged["dropped"]:
+            sys.exit(f"log writer lost records: {logged}")
+        if not logged["request_lines_with_id"]:
+            sys.exit(f"no log line carries the register request's X-Request-ID: {logged}")
+        if logged["call_us"] >= LOG_CALL_LIMIT_US:
+            sys.exit(f"a log call costs {logged['call_us']}us on the request path")
+        stress = results["sequence_stress"]
+        if stress["duplicates"] or stress["errors"]:
+            sys.exit(f"sequence stress: {stress['duplicates']} duplicate numbers, {stress['errors']} failed requests")
+        for path, walk in results["pagination"].items():
+            first, last = walk["first_pages"]["p50_ms"], walk["last_pages"]["p50_ms"]
+            # Allow for noise, not for a cost that grows with depth
+            if last > 2 * first + 5:
+                sys.exit(f"{path}: deep pages take {last}ms vs {first}ms for the first ones")
+        for export_format, export in results["export"].items():
+            if export["peak_traced_mb"] >= EXPORT_PEAK_LIMIT_MB:
+                sys.exit(f"{export_format} export peaked at {export['peak_traced_mb']}MB")
+        parquet = results["parquet_export"]
+        if parquet and parquet["incremental_rows"] != parquet["expected_incremental_rows"]:
+            sys.exit(f"incremental Parquet export wrote {parquet['incremental_rows']} rows "
+                     f"for a bill with {parquet['expected_incremental_rows']} items")
+        archive = results["archive"]
+        if archive["bills_after"] != archive["bills_before"]:
+            sys.exit(f"reports lost bills after archiving: {archive['bills_before']} -> {archive['bills_after']}")
+        if archive["daily_stats_rows"][0] != archive["daily_stats_rows"][1]:
+            sys.exit(f"daily_stats rebuild lost archived days: {archive['daily_stats_rows']}")
+        if archive["refused_status"] != 400:
+            sys.exit(f"archiving the year holding the newest ids returned {archive['refused_status']}, not 400")
+        if archive["new_bill_id"] <= archive["archived_max_id"]:
+            sys.exit(f"bill {archive['new_bill_id']} reuses an archived id (up to {archive['archived_max_id']})")
+        backup = results["backup"]
+        if backup["restored_rows"] != backup["live_rows"] or backup["quick_check"] != "ok":
+            sys.exit(f"restore mismatch: {backup['restored_rows']} vs live {backup['live_rows']}, "
+                     f"quick_check {backup['quick_check']}")
+        earlier = backup["point_in_time"]
+        if earlier["restored_rows"] != earlier["rows_then"] or earlier["quick_check"] != "ok":
+            sys.exit(f"point-in-time restore mismatch: {earlier['restored_rows']} vs {earlier['rows_then']}")
+        idle_p99, backup_p99 = backup["idle"]["p99_ms"], backup["during_backup"]["p99_ms"]
+        if backup_p99 > 2 * idle_p99 + BACKUP_P99_SLACK_MS:
+            sys.exit(f"bill commit p99 {backup_p99}ms during backup vs {idle_p99}ms idle")
+        imported = results["import"]
+        if imported["rows"]["patients"] != imported["expected"]["patients"] \
+                or imported["rows"]["op_bills"] != imported["expected"]["op_bills"] \
+                or imported["rows"]["ip_bills"] != imported["expected"]["ip_bills"]:
+            sys.exit(f"bulk import wrote {imported['rows']}, expected {imported['expected']}")
+        if imported["rows"]["rollup_op_bills"] != imported["rows"]["all_op_bills"]:
+            sys.exit(f"daily_stats counts {imported['rows']['rollup_op_bills']} OP bills "
+                     f"of {imported['rows']['all_op_bills']} after the import")
+        if not imported["rollups_match_rebuild"]:
+            sys.exit("rollups maintained by the import differ from a full rebuild")
+        if imported["next_bill"]["status"] != 200:
+            sys.exit(f"first bill after the import failed: {imported['next_bill']}")
+        doctor_totals = imported["op_doctor_totals"]
+        if doctor_totals["rollup"] != doctor_totals["detail"]:
+            sys.exit(f"OP totals by doctor from the rollup {doctor_totals['rollup']} "
+                     f"differ from the bill items {doctor_totals['detail']}")
+        for kind, timing in results["patient_search"].items():
+            if timing["p95_ms"] >= SEARCH_P95_LIMIT_MS:
+                sys.exit(f"patient search ({kind}) p95 {timing['p95_ms']}ms >= {SEARCH_P95_LIMIT_MS}ms")
+
+
+if __name__ == "__main__":
+    main()
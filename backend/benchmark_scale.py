@@ -0,0 +1,492 @@
+"""
+Endpoint latency, SQL statement count and memory at dataset scale.
+
+Each scale is a synthetic database (app/core/synthetic.py) of about that
+many OP/IP bill items, ending on a fixed --end-date. It is generated once
+per seed and end date into --cache-dir and then copied for every run, so
+runs of the same scale, seed and end date see the same data. Each scale
+runs in its own process. Every endpoint is called through the FastAPI test
+client about --runs times within --budget seconds, in rounds that go
+through all endpoints, so a passing slowdown of the machine hits every
+endpoint alike. The endpoints that write run after all the reads, in
+rounds of their own, so every read sees the generated data unchanged.
+
+Results go to a JSON file tagged with the git commit; --compare reads two
+of them and exits non-zero if an endpoint got slower, ran more SQL
+statements, used more memory or changed its status code.
+
+    python benchmark_scale.py --scales 10k 100k --output bench-base.json
+    python benchmark_scale.py --scales 10k 100k --output bench-new.json
+    python benchmark_scale.py --compare bench-base.json bench-new.json
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+from benchmark import summarize
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# bill items -> (patients, bills, years); synthetic bills average ~2.24 items
+SCALES = {
+    "10k": (900, 4_500, 1),
+    "100k": (9_000, 45_000, 2),
+    "1m": (90_000, 450_000, 5),
+    "10m": (900_000, 4_500_000, 5),
+}
+
+# --compare: the median must grow by more than this factor and by more than
+# the noise floor to count as a regression (p95 is reported, but too noisy
+# on a shared machine to gate on). Statement counts and status codes must
+# not change at all.
+LATENCY_RATIO = 1.5
+LATENCY_NOISE_MS = 3.0
+RSS_NOISE_MB = 8.0
+
+ROUNDS = 5
+
+
+def rss_bytes():
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class RSSSampler:
+    """Highest RSS seen between start() and stop(), sampled every few ms."""
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            rss = rss_bytes()
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self.peak = rss_bytes()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        rss = rss_bytes()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+        return self.peak
+
+
+class StatementCounter:
+    """Counts SQL statements sent by the backend's engines."""
+    def __init__(self, engines):
+        from sqlalchemy import event
+        self.count = 0
+        self._lock = threading.Lock()
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self._executed)
+
+    def _executed(self, *args):
+        with self._lock:
+            self.count += 1
+
+
+def generator_version():
+    # Cached databases are rebuilt whenever the generator changes
+    with open(os.path.join(BACKEND_DIR, "app", "core", "synthetic.py"), "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:10]
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+def prepare_database(scale, seed, end_date, cache_dir, data_dir):
+    """
+    Copy the cached synthetic database for scale/seed/end_date into
+    data_dir, building it first if needed. Returns the seconds spent
+    generating (0 if cached).
+    """
+    patients, bills, years = SCALES[scale]
+    cached = os.path.join(cache_dir, f"hms-{scale}-seed{seed}-{end_date}-{generator_version()}.db")
+    target = os.path.join(data_dir, "hms_lite.db")
+    if os.path.exists(cached):
+        shutil.copyfile(cached, target)
+        return 0
+
+    from database import create_tables, engine, sequences
+    from app.core.synthetic import generate
+    from app.models import User
+    from app.routers.auth import get_password_hash
+
+    start = time.perf_counter()
+    create_tables()
+    generate(engine, patients, bills, years, seed=seed, workers=os.cpu_count() or 1, sequences=sequences,
+             end_date=date.fromisoformat(end_date))
+    with engine.begin() as conn:
+        conn.execute(User.__table__.insert(), [{
+            "username": "bench", "password": get_password_hash("bench"),
+            "full_name": "Benchmark User", "role": "admin", "is_active": True,
+        }])
+    seconds = time.perf_counter() - start
+
+    # A self-contained copy (no -wal) for the next runs
+    os.makedirs(cache_dir, exist_ok=True)
+    source = sqlite3.connect(target)
+    copy = sqlite3.connect(cached + ".partial")
+    try:
+        source.backup(copy)
+    finally:
+        copy.close()
+        source.close()
+    os.replace(cached + ".partial", cached)
+    return seconds
+
+
+def dataset_facts(engine):
+    """Values the endpoint calls need: a busy day, a regular patient, common search terms."""
+    with engine.connect() as conn:
+        one = lambda sql: conn.exec_driver_sql(sql).first()
+        counts = {
+            table: conn.exec_driver_sql(f"SELECT count(*) FROM {table}").scalar()
+            for table in ("patients", "op_bills", "op_bill_items", "ip_bills", "ip_bill_items")
+        }
+        last_day = one("SELECT max(bill_day) FROM op_bills")[0]
+        regular = one("SELECT patient_id FROM op_bills GROUP BY patient_id ORDER BY count(*) DESC LIMIT 1")[0]
+        name, place, phone, op_number = one(
+            "SELECT name, place, phone, op_number FROM patients ORDER BY id DESC LIMIT 1"
+        )
+        return {
+            "counts": counts,
+            "last_day": last_day,
+            "patient_id": regular,
+            "doctor_id": one("SELECT doctor_id FROM op_bills GROUP BY doctor_id ORDER BY count(*) DESC LIMIT 1")[0],
+            "op_bill_id": one("SELECT max(id) FROM op_bills")[0],
+            "ip_bill_id": one("SELECT max(id) FROM ip_bills")[0],
+            "consultation_id": one("SELECT id FROM particulars WHERE name = 'Consultation'")[0],
+            "last_name": name.split()[-1],
+            "name_prefix": name[:3],
+            "place": place,
+            "phone_fragment": phone[-4:],
+            "op_fragment": op_number[-5:],
+        }
+
+
+def endpoint_calls(facts):
+    """(name, method, path, params or json body) for every endpoint measured."""
+    last_day = datetime.strptime(str(facts["last_day"]), "%Y-%m-%d").date()
+    week = {"start_date": (last_day - timedelta(days=6)).isoformat(), "end_date": last_day.isoformat()}
+    month = {"start_date": (last_day - timedelta(days=29)).isoformat(), "end_date": last_day.isoformat()}
+    op_bill = {
+        "patient_id": facts["patient_id"], "bill_type": "OP", "category": "Consultation",
+        "doctor_id": facts["doctor_id"],
+        "items": [{"particular": str(facts["consultation_id"]), "doctor": "S001",
+                   "department": "General Medicine", "unit": 1, "rate": 500}],
+    }
+    ip_bill = {
+        "patient_id": facts["patient_id"], "category": "IP", "doctor_id": facts["doctor_id"],
+        "room": "Ward 1", "admission_date": last_day.isoformat(),
+        "items": [{"particular": str(facts["consultation_id"]), "department": "General Medicine",
+                   "amount": 1500}],
+    }
+    patient = {
+        "name": "Bench Patient", "age": "40", "gender": "Male", "complaint": "Fever", "house": "1",
+        "street": "Main Road", "place": "Kottayam", "phone": "9000000000", "doctor_id": facts["doctor_id"],
+    }
+    return [
+        ("GET /dashboard/stats", "GET", "/dashboard/stats", None),
+        ("GET /patients/", "GET", "/patients/", {"limit": 100}),
+        ("GET /patients/?search", "GET", "/patients/", {"limit": 100, "search": facts["last_name"]}),
+        ("GET /patients/search/op (name)", "GET", f"/patients/search/op/{facts['last_name']}", None),
+        ("GET /patients/search/op (prefix)", "GET", f"/patients/search/op/{facts['name_prefix']}", None),
+        ("GET /patients/search/op (place)", "GET", f"/patients/search/op/{facts['place']}", None),
+        ("GET /patients/search/ip (name)", "GET", f"/patients/search/ip/{facts['last_name']}", None),
+        ("GET /patients/lookup (phone)", "GET", f"/patients/lookup/{facts['phone_fragment']}", None),
+        ("GET /patients/lookup (op number)", "GET", f"/patients/lookup/{facts['op_fragment']}", None),
+        ("GET /bills/op/today", "GET", "/bills/op/today", None),
+        ("GET /bills/op/all", "GET", "/bills/op/all", {"limit": 100}),
+        ("GET /bills/ip/all", "GET", "/bills/ip/all", {"limit": 100}),
+        ("GET /bills/op/{patient_id}", "GET", f"/bills/op/{facts['patient_id']}", None),
+        ("GET /bills/op/details/{bill_id}", "GET", f"/bills/op/details/{facts['op_bill_id']}", None),
+        ("GET /bills/ip/details/{bill_id}", "GET", f"/bills/ip/details/{facts['ip_bill_id']}", None),
+        ("GET /reports/daily-op", "GET", "/reports/daily-op", {"report_date": last_day.isoformat()}),
+        ("GET /reports/bill-summary (week)", "GET", "/reports/bill-summary", week),
+        ("GET /reports/bill-summary (month)", "GET", "/reports/bill-summary", month),
+        ("GET /reports/patient-list (month)", "GET", "/reports/patient-list", dict(month, limit=100)),
+        ("GET /reports/particulars-report (month)", "GET", "/reports/particulars-report",
+         dict(month, particular_id=facts["consultation_id"])),
+        ("GET /reports/particulars-report (details)", "GET", "/reports/particulars-report",
+         dict(week, particular_id=facts["consultation_id"], include_details=True)),
+        ("GET /reports/particulars-list", "GET", "/reports/particulars-list", None),
+        ("GET /exports/bills (month csv)", "GET", "/exports/bills", month),
+        ("GET /doctors/", "GET", "/doctors/", None),
+        ("GET /settings/particulars", "GET", "/settings/particulars", None),
+        ("POST /patients/", "POST", "/patients/", patient),
+        ("POST /bills/op", "POST", "/bills/op", op_bill),
+        ("POST /bills/ip", "POST", "/bills/ip", ip_bill),
+    ]
+
+
+class Endpoint:
+    """Samples of one endpoint, collected over several rounds."""
+    def __init__(self, client, headers, method, path, payload):
+        self.client = client
+        self.headers = headers
+        self.method = method
+        self.path = path
+        self.payload = payload
+        self.samples, self.statements, self.statuses = [], [], set()
+        self.peak_rss = self.rss_growth = None
+
+    def call(self):
+        if self.method == "GET":
+            return self.client.get(self.path, params=self.payload, headers=self.headers)
+        return self.client.post(self.path, json=self.payload, headers=self.headers)
+
+    def run(self, counter, sampler, calls, budget):
+        baseline = rss_bytes()
+        sampler.start()
+        started = time.perf_counter()
+        for _ in range(calls):
+            before = counter.count
+            start = time.perf_counter()
+            response = self.call()
+            self.samples.append((time.perf_counter() - start) * 1000)
+            self.statements.append(counter.count - before)
+            self.statuses.add(response.status_code)
+            if time.perf_counter() - started >= budget:
+                break
+        peak = sampler.stop()
+        if peak is not None and baseline is not None:
+            self.peak_rss = max(self.peak_rss or 0, peak)
+            self.rss_growth = max(self.rss_growth or 0, peak - baseline)
+
+    def result(self) -> dict:
+        result = summarize(self.samples)
+        result["statements"] = max(self.statements)
+        result["status"] = sorted(self.statuses)
+        if self.peak_rss is not None:
+            result["peak_rss_mb"] = round(self.peak_rss / 2 ** 20, 1)
+            result["rss_growth_mb"] = round(self.rss_growth / 2 ** 20, 1)
+        return result
+
+
+def measure_all(endpoints, counter, sampler, runs, budget):
+    """
+    Call every endpoint a few times per round, for ROUNDS rounds. A machine
+    that slows down for a while then slows all endpoints alike instead of
+    whichever ones happened to be measured at that moment.
+
+    Reads go first and writes only once they are done, otherwise a later
+    round's reads would run against the rows earlier rounds added.
+    """
+    reads = [endpoint for endpoint in endpoints.values() if endpoint.method == "GET"]
+    writes = [endpoint for endpoint in endpoints.values() if endpoint.method != "GET"]
+    calls = max(1, -(-runs // ROUNDS))
+    for phase in (reads, writes):
+        for endpoint in phase:
+            endpoint.call()  # warm-up: first-use imports and statement caches
+        for _ in range(ROUNDS):
+            for endpoint in phase:
+                endpoint.run(counter, sampler, calls, budget / ROUNDS)
+    return {name: endpoint.result() for name, endpoint in endpoints.items()}
+
+
+def run_scale(args):
+    data_dir = tempfile.mkdtemp(prefix=f"hms-scale-{args.run_scale}-")
+    os.environ["HMS_DATA_DIR"] = data_dir
+    os.environ["HMS_DB_PROFILE"] = args.profile
+    try:
+        generated = prepare_database(args.run_scale, args.seed, args.end_date, args.cache_dir, data_dir)
+
+        from fastapi.testclient import TestClient
+        from database import engine, read_engine, sequence_engine
+        from app.main import app
+
+        logging.getLogger("httpx").setLevel(logging.WARNING)
+        counter = StatementCounter([engine, read_engine, sequence_engine])
+        sampler = RSSSampler()
+        with TestClient(app, raise_server_exceptions=False) as client:
+            token = client.post(
+                "/auth/login", data={"username": "bench", "password": "bench"}
+            ).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+            facts = dataset_facts(engine)
+
+            endpoints = {
+                name: Endpoint(client, headers, method, path, payload)
+                for name, method, path, payload in endpoint_calls(facts)
+                if not args.only or any(part in name for part in args.only)
+            }
+            results = measure_all(endpoints, counter, sampler, args.runs, args.budget)
+            for name, result in results.items():
+                print(f"  {name}: p50 {result['p50_ms']}ms, p95 {result['p95_ms']}ms, "
+                      f"{result['statements']} statements, status {result['status']}", file=sys.stderr)
+
+        return {
+            "rows": facts["counts"],
+            "generate_seconds": round(generated, 1),
+            "endpoints": results,
+        }
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def compare(base_path, new_path, latency_ratio):
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+
+    print(f"base {base['meta'].get('commit')}  new {new['meta'].get('commit')}")
+    regressions = []
+    for scale, new_scale in new["scales"].items():
+        old_scale = base["scales"].get(scale)
+        if not old_scale:
+            continue
+        print(f"\n{scale}")
+        print(f"  {'endpoint':<44} {'p50 base':>9} {'p50 new':>9} {'ratio':>6} "
+              f"{'p95 base':>9} {'p95 new':>9} {'stmts':>9} {'rss +MB':>11}")
+        for name, now in new_scale["endpoints"].items():
+            then = old_scale["endpoints"].get(name)
+            if not then:
+                print(f"  {name:<44} {'-':>9} {now['p50_ms']:>9} (new)")
+                continue
+            ratio = now["p50_ms"] / then["p50_ms"] if then["p50_ms"] else 1
+            problems = []
+            if now["status"] != then["status"]:
+                problems.append(f"status {then['status']} -> {now['status']}")
+            if ratio > latency_ratio and now["p50_ms"] - then["p50_ms"] > LATENCY_NOISE_MS:
+                problems.append(f"p50 {then['p50_ms']}ms -> {now['p50_ms']}ms")
+            if now["statements"] > then["statements"]:
+                problems.append(f"statements {then['statements']} -> {now['statements']}")
+            old_rss, new_rss = then.get("rss_growth_mb"), now.get("rss_growth_mb")
+            if old_rss is not None and new_rss is not None \
+                    and new_rss > old_rss * latency_ratio and new_rss - old_rss > RSS_NOISE_MB:
+                problems.append(f"RSS growth {old_rss}MB -> {new_rss}MB")
+            marker = "  <-- " + "; ".join(problems) if problems else ""
+            print(f"  {name:<44} {then['p50_ms']:>9} {now['p50_ms']:>9} {ratio:>6.2f} "
+                  f"{then['p95_ms']:>9} {now['p95_ms']:>9} "
+                  f"{then['statements']:>4}>{now['statements']:<4} "
+                  f"{str(old_rss):>5}>{str(new_rss):<5}{marker}")
+            regressions.extend(f"{scale} {name}: {problem}" for problem in problems)
+
+    if regressions:
+        print(f"\n{len(regressions)} regressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("\nno regressions")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", nargs="+", default=["10k", "100k"], choices=list(SCALES))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--end-date", help="last day of the synthetic timeline, YYYY-MM-DD "
+                                           "(default app.core.synthetic.DEFAULT_END_DATE)")
+    parser.add_argument("--runs", type=int, default=50, help="calls per endpoint at most")
+    parser.add_argument("--budget", type=float, default=10, help="seconds per endpoint at most")
+    parser.add_argument("--profile", default="performance", help="HMS_DB_PROFILE")
+    parser.add_argument("--only", nargs="+", metavar="TEXT", help="endpoints whose name contains TEXT")
+    parser.add_argument("--cache-dir", default=os.path.join(tempfile.gettempdir(), "hms-bench-cache"),
+                        help="where generated databases are kept between runs")
+    parser.add_argument("--output", default="benchmark-scale.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="compare two result files")
+    parser.add_argument("--ratio", type=float, default=LATENCY_RATIO,
+                        help="median latency growth that counts as a regression")
+    parser.add_argument("--run-scale", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(compare(*args.compare, args.ratio))
+
+    if args.run_scale:
+        with open(args.result_file, "w") as f:
+            json.dump(run_scale(args), f)
+        return
+
+    if args.end_date is None:
+        # Only the scale processes open a database; importing the app here is harmless
+        from app.core.synthetic import DEFAULT_END_DATE
+        args.end_date = DEFAULT_END_DATE.isoformat()
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "created_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "profile": args.profile,
+            "seed": args.seed,
+            "end_date": args.end_date,
+            "runs": args.runs,
+            "budget": args.budget,
+            "generator": generator_version(),
+        },
+        "scales": {},
+    }
+    for scale in args.scales:
+        print(f"{scale}:", file=sys.stderr)
+        # A fresh process per scale, so module state and RSS start clean
+        fd, result_file = tempfile.mkstemp(prefix=f"hms-scale-{scale}-", suffix=".json")
+        os.close(fd)
+        command = [
+            sys.executable, os.path.abspath(__file__), "--run-scale", scale, "--result-file", result_file,
+            "--seed", str(args.seed), "--end-date", args.end_date,
+            "--runs", str(args.runs), "--budget", str(args.budget),
+            "--profile", args.profile, "--cache-dir", args.cache_dir,
+        ]
+        if args.only:
+            command += ["--only", *args.only]
+        subprocess.run(command, check=True, cwd=BACKEND_DIR)
+        with open(result_file) as f:
+            results["scales"][scale] = json.load(f)
+        os.remove(result_file)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, default=str)
+    print(f"results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,128 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from app.models.models import Base
+from app.core.config import settings
+from app.core import dbstats, metrics, slowqueries, tracing
+from app.core.metrics import TimedQueuePool
+from app.core.migrations import run_migrations
+from app.core.sequences import SequenceAllocator
+from pathlib import Path
+import logging
 import os
+import sqlite3
 
-APP_DATA_DIR = os.path.join(
-    os.environ["LOCALAPPDATA"],
-    "HMSLite"
-)
+APP_DATA_DIR = settings.data_dir
 
 os.makedirs(APP_DATA_DIR, exist_ok=True)
 
-db_path = os.path.join(APP_DATA_DIR, "hms_lite.db")
+db_path = settings.db_path
 
 SQLALCHEMY_DATABASE_URL = f"sqlite:///{db_path}"
 
+# HMS_SQL_ECHO logs statements through the "sqlalchemy.engine" logger, so
+# they go wherever the backend's logging goes (echo=True would add its own
+# console handler)
+if settings.sql_echo:
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
+
+# Writer: a single pooled connection, so bill/patient/doctor mutations queue
+# up in-process instead of fighting over the SQLite write lock.
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
+    SQLALCHEMY_DATABASE_URL,
     connect_args={"check_same_thread": False},
-    echo=True  # Set to False in production
+    poolclass=TimedQueuePool,
+    pool_logging_name="writer",
+    pool_size=1,
+    max_overflow=0,
+    pool_timeout=settings.write_pool_timeout
+)
+
+READ_DATABASE_URI = f"{Path(db_path).resolve().as_uri()}?mode=ro"
+
+def _connect_read_only():
+    return sqlite3.connect(READ_DATABASE_URI, uri=True, check_same_thread=False)
+
+# Readers: mode=ro connections used by reports, dashboard and lookups. In WAL
+# mode they read a consistent snapshot without blocking the writer.
+read_engine = create_engine(
+    "sqlite://",
+    creator=_connect_read_only,
+    poolclass=TimedQueuePool,
+    pool_logging_name="reader",
+    pool_size=settings.read_pool_size,
+    max_overflow=settings.read_pool_overflow
 )
 
+# Sequence blocks are reserved on their own connection, so a request holding
+# the writer connection (possibly mid-transaction) can still get a number
+sequence_engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=TimedQueuePool,
+    pool_logging_name="sequence",
+    pool_size=1,
+    max_overflow=0
+)
+
+# Statement counts and time per request (X-DB-Queries / X-DB-Time)
+dbstats.instrument(engine, read_engine, sequence_engine)
+# Pool usage and busy/locked errors for GET /metrics
+metrics.instrument(writer=engine, reader=read_engine, sequence=sequence_engine)
+# Per-statement timings and the slow-query log
+slowqueries.instrument(engine, read_engine, sequence_engine)
+# Statement and commit spans for request traces
+tracing.instrument(engine, read_engine, sequence_engine)
+
+SQLITE_PRAGMAS = settings.sqlite_pragmas()
+
+# With backups on, only the WAL shipper checkpoints, right after copying the
+# frames it folds into the database (app/core/backup.py)
+if settings.backup_dir and str(SQLITE_PRAGMAS.get("journal_mode", "")).upper() == "WAL":
+    SQLITE_PRAGMAS["wal_autocheckpoint"] = 0
+
+# journal_mode, synchronous and checkpointing only matter to connections that write
+SQLITE_READ_PRAGMAS = {
+    name: value for name, value in SQLITE_PRAGMAS.items()
+    if name not in ("journal_mode", "synchronous", "wal_autocheckpoint")
+}
+
+def _apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+@event.listens_for(engine, "connect")
+@event.listens_for(sequence_engine, "connect")
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    # Runs once per new pool connection, before SQLAlchemy uses it
+    _apply_pragmas(dbapi_connection, SQLITE_PRAGMAS)
+
+@event.listens_for(read_engine, "connect")
+def apply_sqlite_read_pragmas(dbapi_connection, connection_record):
+    _apply_pragmas(dbapi_connection, SQLITE_READ_PRAGMAS)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+sequences = SequenceAllocator(sequence_engine, settings.sequence_block_size)
+
 def create_tables():
     Base.metadata.create_all(bind=engine)
+    # create_all never alters existing tables; columns, indexes and backfills
+    # for databases created by older versions come from the migrations
+    run_migrations(engine)
 
 def get_db():
     db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def get_read_db():
+    db = ReadSessionLocal()
     try:
         yield db
     finally:
@@ -168,7 +168,8 @@ const Reports = () => {
             end_date: endDate,
             include_op: includeOp,
             include_ip: includeIp,
-            group_by_patient: groupByPatient
+            group_by_patient: groupByPatient,
+            include_details: true
           };
           
           // Don't fetch if no particular is selected